@@ -144,3 +144,17 @@ DATA_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024  # 50MB
 # Security settings for file uploads
 SECURE_CONTENT_TYPE_NOSNIFF = True
 SECURE_BROWSER_XSS_FILTER = True
+
+# Web tester settings
+WEBTESTER_RESULT_BATCH_SIZE = 1000  # Rows per bulk insert when storing raw results
+WEBTESTER_RESULT_FLUSH_INTERVAL = 5  # Seconds between raw result writes during a test
+WEBTESTER_COORDINATOR_HOST = '127.0.0.1'  # Address the coordinator listens on for remote workers (e.g. '0.0.0.0' to accept other hosts)
+WEBTESTER_COORDINATOR_PORT = 7741
+WEBTESTER_COORDINATOR_AUTHKEY = os.environ.get('WEBTESTER_COORDINATOR_AUTHKEY')  # Secret shared with workers, required for distributed tests
+WEBTESTER_WORKER_REGISTER_TIMEOUT = 60  # Seconds to wait for every remote worker to register
+WEBTESTER_MAX_JOBS_PER_HOST = 1  # Tests run at the same time against one target host
+WEBTESTER_JOB_HEARTBEAT_INTERVAL = 5  # Seconds between runner heartbeats
+WEBTESTER_JOB_STALE_AFTER = 60  # Seconds without a heartbeat before a running job is considered orphaned
+WEBTESTER_DRAIN_TIMEOUT = 10  # Seconds in-flight requests get to finish when a test ends or is stopped
+WEBTESTER_MAX_BROWSERS = 8  # Headless browsers per process in browser journey mode (unless the test sets a pool size)
+WEBTESTER_BROWSER_MEMORY_MB = 300  # Memory set aside per headless browser; pools never exceed the available memory
@@ -1,15 +1,19 @@
 from django.contrib import admin
-from .models import LoadTest, UserJourney, JourneyStep, TestAssignment
+from .models import LoadTest, UserJourney, JourneyStep, TestAssignment, DataFeeder, TestJob
 
 class TestAssignmentInline(admin.TabularInline):
     model = TestAssignment
     extra = 1
 
+class DataFeederInline(admin.TabularInline):
+    model = DataFeeder
+    extra = 0
+
 class LoadTestAdmin(admin.ModelAdmin):
     list_display = ('name', 'created_by', 'status', 'created_at')
     list_filter = ('status', 'created_by')
     search_fields = ('name', 'target_url')
-    inlines = [TestAssignmentInline]
+    inlines = [TestAssignmentInline, DataFeederInline]
 
 class JourneyStepInline(admin.TabularInline):
     model = JourneyStep
@@ -21,6 +25,12 @@ class UserJourneyAdmin(admin.ModelAdmin):
     search_fields = ('name', 'base_url')
     inlines = [JourneyStepInline]
 
+class TestJobAdmin(admin.ModelAdmin):
+    list_display = ('test', 'status', 'target_host', 'runner', 'created_at', 'heartbeat_at')
+    list_filter = ('status', 'target_host')
+    search_fields = ('test__name', 'runner')
+
 admin.site.register(LoadTest, LoadTestAdmin)
 admin.site.register(UserJourney, UserJourneyAdmin)
-admin.site.register(TestAssignment)
\ No newline at end of file
+admin.site.register(TestAssignment)
+admin.site.register(TestJob, TestJobAdmin)
\ No newline at end of file
@@ -0,0 +1,322 @@
+import json
+import re
+
+# Assertion types and the keys each one requires
+ASSERTION_TYPES = {
+    'status': ('value',),
+    'header': ('name',),
+    'body_contains': ('value',),
+    'body_regex': ('value',),
+    'json_path': ('path',),
+    'max_latency': ('value',),
+}
+
+# $.name, .name, [0] and ['name'] parts of a JSONPath
+JSON_PATH_PART = re.compile(r'''\.([A-Za-z_][\w-]*)|\[(\d+)\]|\[(["'])(.*?)\3\]''')
+
+# Marker for a JSONPath that matched nothing
+MISSING = object()
+
+def compile_json_path(path):
+    """Compile a simple JSONPath such as $.items[0].id into a tuple of keys and indexes"""
+    if not path.startswith('$'):
+        raise ValueError(f"JSONPath must start with $: {path}")
+    parts = []
+    position = 1
+    while position < len(path):
+        match = JSON_PATH_PART.match(path, position)
+        if not match:
+            raise ValueError(f"Unsupported JSONPath near {path[position:]!r}")
+        name, index, quote, quoted = match.groups()
+        parts.append(int(index) if index is not None else (name if name is not None else quoted))
+        position = match.end()
+    return tuple(parts)
+
+def resolve_json_path(document, parts):
+    """Get the value at a compiled JSONPath (MISSING when there is none)"""
+    for part in parts:
+        try:
+            document = document[part]
+        except (KeyError, IndexError, TypeError):
+            return MISSING
+    return document
+
+class Assertion:
+    """A compiled check on a response
+    
+    Status, header and latency assertions only look at the response
+    metadata. Body assertions either stream (start() returns a state that
+    is fed every chunk) or need the whole body (check_body()), which is
+    then buffered as bytes and never decoded to text.
+    """
+    
+    streaming = False
+    buffered = False
+    parses_json = False
+    
+    def __init__(self, spec):
+        self.spec = spec
+        self.label = spec.get('label')
+        self.negate = bool(spec.get('negate'))
+    
+    def describe(self):
+        return self.spec['type']
+    
+    def failed(self, passed):
+        """Turn a check outcome into a failure message (None when the assertion holds)"""
+        if passed != self.negate:
+            return None
+        return f"Assertion failed: {self.label}"
+
+class StatusAssertion(Assertion):
+    def __init__(self, spec):
+        value = spec['value']
+        codes = value if isinstance(value, list) else [value]
+        try:
+            self.codes = frozenset(int(code) for code in codes)
+        except (TypeError, ValueError):
+            raise ValueError("Status assertions need a status code or a list of codes")
+        super().__init__(spec)
+    
+    def describe(self):
+        return f"status in {', '.join(str(code) for code in sorted(self.codes))}"
+    
+    def check_status(self, status):
+        return self.failed(status in self.codes)
+
+class HeaderAssertion(Assertion):
+    def __init__(self, spec):
+        self.name = spec['name']
+        self.pattern = re.compile(spec['value']) if spec.get('value') is not None else None
+        super().__init__(spec)
+    
+    def describe(self):
+        if self.pattern is None:
+            return f"header {self.name} present"
+        return f"header {self.name} ~ /{self.pattern.pattern}/"
+    
+    def check_headers(self, headers):
+        value = headers.get(self.name)
+        if value is None:
+            return self.failed(False)
+        return self.failed(self.pattern is None or self.pattern.search(value) is not None)
+
+class BodyContainsAssertion(Assertion):
+    streaming = True
+    
+    def __init__(self, spec):
+        self.needle = str(spec['value']).encode('utf-8')
+        if not self.needle:
+            raise ValueError("body_contains needs a non-empty value")
+        super().__init__(spec)
+    
+    def describe(self):
+        return f"body {'does not contain' if self.negate else 'contains'} {self.spec['value']!r}"
+    
+    def start(self):
+        return BodySearch(self.needle)
+
+class BodySearch:
+    """Looks for a byte string across chunk boundaries without keeping the body"""
+    
+    def __init__(self, needle):
+        self.needle = needle
+        self.tail = b''
+        self.found = False
+    
+    def feed(self, chunk):
+        if self.found:
+            return
+        data = self.tail + chunk
+        if self.needle in data:
+            self.found = True
+        else:
+            self.tail = data[-(len(self.needle) - 1):] if len(self.needle) > 1 else b''
+
+class BodyRegexAssertion(Assertion):
+    buffered = True
+    
+    def __init__(self, spec):
+        self.pattern = re.compile(str(spec['value']).encode('utf-8'))
+        super().__init__(spec)
+    
+    def describe(self):
+        return f"body {'does not match' if self.negate else 'matches'} /{self.spec['value']}/"
+    
+    def check_body(self, body, document):
+        return self.failed(self.pattern.search(body) is not None)
+
+class JSONPathAssertion(Assertion):
+    buffered = True
+    parses_json = True
+    
+    def __init__(self, spec):
+        self.parts = compile_json_path(spec['path'])
+        self.has_value = 'value' in spec
+        super().__init__(spec)
+    
+    def describe(self):
+        if not self.has_value:
+            return f"{self.spec['path']} exists"
+        return f"{self.spec['path']} == {json.dumps(self.spec['value'])}"
+    
+    def check_body(self, body, document):
+        value = resolve_json_path(document, self.parts) if document is not MISSING else MISSING
+        if value is MISSING:
+            return self.failed(False)
+        return self.failed(not self.has_value or value == self.spec['value'])
+
+class MaxLatencyAssertion(Assertion):
+    def __init__(self, spec):
+        try:
+            self.limit = float(spec['value'])
+        except (TypeError, ValueError):
+            raise ValueError("max_latency needs a number of seconds")
+        super().__init__(spec)
+    
+    def describe(self):
+        return f"latency <= {self.limit:g}s"
+    
+    def check_latency(self, response_time):
+        return self.failed(response_time is not None and response_time <= self.limit)
+
+ASSERTION_CLASSES = {
+    'status': StatusAssertion,
+    'header': HeaderAssertion,
+    'body_contains': BodyContainsAssertion,
+    'body_regex': BodyRegexAssertion,
+    'json_path': JSONPathAssertion,
+    'max_latency': MaxLatencyAssertion,
+}
+
+def build_assertion(spec, prefix=''):
+    """Compile one assertion from its JSON description (raises ValueError if it is invalid)"""
+    if not isinstance(spec, dict):
+        raise ValueError("Each assertion must be an object")
+    assertion_type = spec.get('type')
+    if assertion_type not in ASSERTION_TYPES:
+        raise ValueError(f"Unknown assertion type: {assertion_type}")
+    for key in ASSERTION_TYPES[assertion_type]:
+        if key not in spec:
+            raise ValueError(f"{assertion_type} assertions need a {key!r}")
+    
+    try:
+        assertion = ASSERTION_CLASSES[assertion_type](spec)
+    except re.error as e:
+        raise ValueError(f"Invalid regular expression in {assertion_type} assertion: {e}")
+    assertion.label = prefix + (spec.get('label') or assertion.describe())
+    return assertion
+
+class AssertionSet:
+    """Assertions compiled once and evaluated against every response they apply to"""
+    
+    def __init__(self, assertions=()):
+        self.assertions = tuple(assertions)
+        self.labels = tuple(assertion.label for assertion in self.assertions)
+        self.status = [assertion for assertion in self.assertions if isinstance(assertion, StatusAssertion)]
+        self.headers = [assertion for assertion in self.assertions if isinstance(assertion, HeaderAssertion)]
+        self.latency = [assertion for assertion in self.assertions if isinstance(assertion, MaxLatencyAssertion)]
+        self.streaming = [assertion for assertion in self.assertions if assertion.streaming]
+        self.buffered = [assertion for assertion in self.assertions if assertion.buffered]
+        self.parses_json = any(assertion.parses_json for assertion in self.assertions)
+    
+    def __bool__(self):
+        return bool(self.assertions)
+    
+    @classmethod
+    def parse(cls, text, prefix=''):
+        """Compile assertions from a JSON list (None when there are none; raises ValueError if invalid)"""
+        if not text or not text.strip():
+            return None
+        try:
+            specs = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON: {e}")
+        if not isinstance(specs, list):
+            raise ValueError("Assertions must be a JSON list")
+        return cls(build_assertion(spec, prefix) for spec in specs) or None
+    
+    @staticmethod
+    def merge(first, second):
+        """Combine two assertion sets, either of which may be None"""
+        if not first:
+            return second
+        if not second:
+            return first
+        return AssertionSet(first.assertions + second.assertions)
+    
+    def start(self, status, headers, lag=None):
+        """Start checking a response once its status and headers have arrived
+        
+        lag is how late a scheduled arrival was sent, which latency
+        assertions count as part of the response time.
+        """
+        return AssertionCheck(self, status, headers, lag)
+
+class AssertionCheck:
+    """Evaluation of an assertion set against one response, fed the body as it streams in"""
+    
+    def __init__(self, assertions, status, headers, lag=None):
+        self.assertions = assertions
+        self.lag = lag
+        self.failures = []
+        self.status_ok = None
+        if assertions.status:
+            # Explicit status assertions replace the default 2xx/3xx check
+            self.status_ok = True
+            for assertion in assertions.status:
+                message = assertion.check_status(status)
+                if message:
+                    self.status_ok = False
+                    self.failures.append((assertion.label, message))
+        for assertion in assertions.headers:
+            message = assertion.check_headers(headers)
+            if message:
+                self.failures.append((assertion.label, message))
+        
+        self.searches = [(assertion, assertion.start()) for assertion in assertions.streaming]
+        self.buffer = [] if assertions.buffered else None
+    
+    def feed(self, chunk):
+        """Check a chunk of the response body"""
+        for assertion, search in self.searches:
+            search.feed(chunk)
+        if self.buffer is not None:
+            self.buffer.append(chunk)
+    
+    def finish(self, result):
+        """Apply the outcome to a result dict: success, error and the assertion counters"""
+        for assertion, search in self.searches:
+            message = assertion.failed(search.found)
+            if message:
+                self.failures.append((assertion.label, message))
+        
+        if self.buffer is not None:
+            body = b''.join(self.buffer)
+            document = MISSING
+            if self.assertions.parses_json:
+                try:
+                    document = json.loads(body)
+                except ValueError:
+                    pass
+            for assertion in self.assertions.buffered:
+                message = assertion.check_body(body, document)
+                if message:
+                    self.failures.append((assertion.label, message))
+        
+        response_time = result.get('response_time')
+        if response_time is not None and self.lag:
+            response_time += self.lag
+        for assertion in self.assertions.latency:
+            message = assertion.check_latency(response_time)
+            if message:
+                self.failures.append((assertion.label, message))
+        
+        result['assertions'] = self.assertions.labels
+        if self.status_ok is not None:
+            result['success'] = self.status_ok
+        if self.failures:
+            result['success'] = False
+            result['error'] = self.failures[0][1]
+            result['assertion_failures'] = [label for label, message in self.failures]
+        return result
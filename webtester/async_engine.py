@@ -0,0 +1,613 @@
+import asyncio
+import random
+import time
+import logging
+import aiohttp
+from .utils import BaseVirtualUser, get_drain_timeout
+from .scheduler import SPIN_THRESHOLD
+from .feeders import render_placeholders
+from .transport import BODY_CHUNK_SIZE, BodyCounter
+from .errors import classify_exception
+
+logger = logging.getLogger(__name__)
+
+# Same per-request timeout as the thread engine
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=30)
+
+def build_trace_config():
+    """Create a trace config recording connection and time-to-first-byte timings
+    
+    aiohttp opens TCP and TLS in one step, so the TLS handshake is counted in
+    the connect time. Timings go into the dict passed as trace_request_ctx.
+    """
+    async def on_request_start(session, context, params):
+        context.trace_request_ctx['request_started'] = time.perf_counter()
+    
+    async def on_connection_create_start(session, context, params):
+        context.trace_request_ctx['connect_started'] = time.perf_counter()
+    
+    async def on_connection_create_end(session, context, params):
+        timings = context.trace_request_ctx
+        timings['connected_at'] = time.perf_counter()
+        timings['connect_time'] = timings.get('connect_time', 0.0) + timings['connected_at'] - timings['connect_started']
+        timings['connection_reused'] = False
+    
+    async def on_connection_reuseconn(session, context, params):
+        context.trace_request_ctx['connection_reused'] = True
+    
+    async def on_request_end(session, context, params):
+        timings = context.trace_request_ctx
+        timings['headers_at'] = time.perf_counter()
+        sent_at = max(timings['request_started'], timings.get('connected_at', 0.0))
+        timings['ttfb'] = timings.get('ttfb', 0.0) + timings['headers_at'] - sent_at
+    
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_connection_create_start.append(on_connection_create_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+    trace_config.on_request_end.append(on_request_end)
+    return trace_config
+
+class StopSignal:
+    """Event that sleeping virtual users wait on with a timer instead of a task
+    
+    A sleep is one future and one timer handle on the loop, so thousands of
+    users in a think time cost no more than their timers. Setting the signal
+    wakes every sleeper at once.
+    """
+    
+    def __init__(self):
+        self.flag = False
+        self.waiters = set()
+    
+    def is_set(self):
+        return self.flag
+    
+    def set(self):
+        self.flag = True
+        for waiter in self.waiters:
+            if not waiter.done():
+                waiter.set_result(True)
+        self.waiters.clear()
+    
+    async def wait(self, timeout):
+        """Wait until the signal is set or the timeout expires"""
+        if self.flag:
+            return
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        timer = loop.call_later(timeout, wake, waiter)
+        self.waiters.add(waiter)
+        try:
+            await waiter
+        finally:
+            timer.cancel()
+            self.waiters.discard(waiter)
+
+def wake(waiter):
+    if not waiter.done():
+        waiter.set_result(False)
+
+class AsyncVirtualUser(BaseVirtualUser):
+    """Virtual user backed by a non-blocking aiohttp session"""
+    
+    def __init__(self, user_id, connector, headers=None, stopped=None, connector_owner=False, trace_configs=None):
+        super().__init__(user_id, stopped or StopSignal())
+        session_headers = {'User-Agent': self.user_agent}
+        if headers:
+            session_headers.update(headers)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            connector_owner=connector_owner,
+            headers=session_headers,
+            timeout=REQUEST_TIMEOUT,
+            trace_configs=trace_configs
+        )
+    
+    def get_cookies(self):
+        """Get the current session cookies as a dictionary"""
+        return {cookie.key: cookie.value for cookie in self.session.cookie_jar}
+    
+    async def close(self):
+        """Close the session (a shared connector stays open)"""
+        await self.session.close()
+    
+    async def read_body(self, response, keep_page=True, check=None):
+        """Read a response body, decoding it into page_content only when the page is kept
+        
+        check is the response's AssertionCheck, fed the raw body as it arrives.
+        """
+        if keep_page or self.body_mode == 'keep':
+            content = await response.read()
+            self.page_content = content.decode(response.get_encoding(), errors='replace')
+            if check is not None:
+                check.feed(content)
+            return {'content_length': len(content)}
+        
+        counter = BodyCounter(checksum=self.body_mode == 'checksum')
+        async for chunk in response.content.iter_chunked(BODY_CHUNK_SIZE):
+            counter.update(chunk)
+            if check is not None:
+                check.feed(chunk)
+        self.page_content = None
+        return counter.result()
+    
+    async def fetch(self, method, url, keep_page=True, assertions=None, lag=None, **kwargs):
+        """Make a request and return a result dict in the thread engine's schema
+        
+        The response is checked against assertions (an AssertionSet) if
+        given, counting lag (see AssertionSet.start) in its latency.
+        """
+        timings = {}
+        try:
+            start_time = time.time()
+            async with self.session.request(method, url, trace_request_ctx=timings, **kwargs) as response:
+                check = assertions.start(response.status, response.headers, lag) if assertions else None
+                body = await self.read_body(response, keep_page, check)
+                end_time = time.time()
+                finished_at = time.perf_counter()
+                
+                self.current_url = str(response.url)
+                
+                result = {
+                    'success': 200 <= response.status < 400,
+                    'status_code': response.status,
+                    'response_time': end_time - start_time,
+                    'url': str(response.url),
+                    **body
+                }
+                if 'headers_at' in timings:
+                    result.update({
+                        'connect_time': timings.get('connect_time', 0.0),
+                        'ttfb': timings['ttfb'],
+                        'transfer_time': finished_at - timings['headers_at'],
+                        'connection_reused': timings.get('connection_reused'),
+                    })
+                return check.finish(result) if check else result
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return {
+                'success': False,
+                'error': str(e) or e.__class__.__name__,
+                'error_class': classify_exception(e),
+                'url': url
+            }
+    
+    async def navigate_to(self, url, base_url=None, keep_page=True, assertions=None, lag=None):
+        """Navigate to a URL, checking the response against an AssertionSet if given (see AssertionSet.start for lag)"""
+        full_url = self.resolve_url(url, base_url)
+        result = await self.fetch('GET', full_url, keep_page, assertions, lag)
+        if 'status_code' in result:
+            self.current_url = full_url
+        return result
+    
+    async def submit_form(self, form_selector, extra_data=None, keep_page=True, assertions=None, lag=None):
+        """Submit a form on the current page, checking the response against an AssertionSet if given (see AssertionSet.start for lag)"""
+        if not self.page_content or not self.current_url:
+            return {
+                'success': False,
+                'error': 'No page loaded',
+                'url': None
+            }
+        
+        # Extract form data
+        form_data = self.extract_form_data(form_selector)
+        
+        # Add extra data
+        if extra_data:
+            form_data.update(extra_data)
+        
+        # Find form action and method
+        action, method = self.get_form_target(form_selector)
+        
+        if method.lower() == 'get':
+            return await self.fetch('GET', action, keep_page, assertions, lag, params=form_data)
+        return await self.fetch('POST', action, keep_page, assertions, lag, data=form_data)
+
+class AsyncLoadRunner:
+    """Runs the virtual users of a LoadTester as coroutines on one event loop"""
+    
+    def __init__(self, tester):
+        self.tester = tester
+        self.test = tester.test
+        self.stopping = None
+        self.shared_connector = None
+        self.trace_configs = [build_trace_config()]
+        
+        # The ORM cannot be used from inside the event loop, so load
+        # everything the virtual users need up front
+        self.target_url = self.test.target_url
+        self.request_plan = tester.get_request_plan()
+        self.headers = self.request_plan.session_headers
+        self.journey_plans = tester.load_plans()
+        self.feeders = tester.feeders
+    
+    def run(self, end_time, start_time, worker_index=0, worker_count=1):
+        """Run the test until the end time (blocks the calling thread)"""
+        asyncio.run(self.main(end_time, start_time, worker_index, worker_count))
+    
+    async def main(self, end_time, start_time, worker_index, worker_count):
+        """Start and retire the virtual users, wait for the test duration and drain"""
+        self.stopping = StopSignal()
+        loop = asyncio.get_running_loop()
+        watcher = asyncio.create_task(self.watch_stop_event())
+        self.open_shared_connector()
+        tasks = []
+        retire_events = {}
+        
+        try:
+            # Convert wall-clock times to the loop's monotonic clock
+            clock_offset = loop.time() - time.time()
+            deadline = end_time + clock_offset
+            
+            # Start and retire users exactly when the load profile says so
+            for event_time, user_id, start in self.tester.get_user_events(start_time, end_time, worker_index, worker_count):
+                if not await self.sleep_until(event_time + clock_offset):
+                    break
+                if start:
+                    retire_events[user_id] = StopSignal()
+                    tasks.append(asyncio.create_task(self.user_task(user_id, retire_events[user_id])))
+                elif user_id in retire_events:
+                    retire_events.pop(user_id).set()
+            
+            # Wait until the test duration is reached
+            await self.sleep(deadline - loop.time())
+            
+            # Signal all users to stop (waking up those in a think time) and
+            # wait for in-flight requests
+            self.stopping.set()
+            self.tester.stop_event.set()
+            for retired in retire_events.values():
+                retired.set()
+            await self.drain(tasks)
+        finally:
+            self.tester.stop_event.set()
+            await watcher
+            await self.close_shared_connector()
+    
+    def run_arrivals(self, end_time, start_time, user_ids, worker_index=0, worker_count=1):
+        """Run an open model test until the end time (blocks the calling thread)"""
+        asyncio.run(self.main_arrivals(end_time, start_time, user_ids, worker_index, worker_count))
+    
+    async def main_arrivals(self, end_time, start_time, user_ids, worker_index, worker_count):
+        """Start iterations at the scheduled arrival rate on a pool of virtual users"""
+        self.stopping = StopSignal()
+        loop = asyncio.get_running_loop()
+        watcher = asyncio.create_task(self.watch_stop_event())
+        self.open_shared_connector()
+        idle_users = asyncio.Queue()
+        available_ids = iter(user_ids)
+        virtual_users = []
+        tasks = set()
+        
+        try:
+            clock_offset = loop.time() - time.time()
+            
+            for intended_time in self.tester.get_arrivals(start_time, end_time, worker_index, worker_count):
+                if not await self.sleep_until(intended_time + clock_offset):
+                    break
+                
+                # Hand the arrival to an idle user, a new one while below the
+                # user limit, or queue it until a user is free
+                if idle_users.empty() and len(virtual_users) < len(user_ids):
+                    virtual_user = self.new_virtual_user(next(available_ids), self.stopping)
+                    virtual_users.append(virtual_user)
+                    self.tester.virtual_users[virtual_user.user_id] = virtual_user
+                    self.tester.user_counter.add(1)
+                    idle_users.put_nowait(virtual_user)
+                
+                task = asyncio.create_task(self.arrival_task(intended_time, idle_users))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            
+            # Wait until the test duration is reached
+            await self.sleep(end_time + clock_offset - loop.time())
+            
+            # Queued arrivals are dropped once the test stops
+            self.stopping.set()
+            self.tester.stop_event.set()
+            await self.drain(tasks)
+        finally:
+            for virtual_user in virtual_users:
+                await virtual_user.close()
+                self.tester.virtual_users.pop(virtual_user.user_id, None)
+            self.tester.stop_event.set()
+            await watcher
+            await self.close_shared_connector()
+    
+    async def drain(self, tasks):
+        """Wait up to the drain timeout for in-flight requests, then cancel the ones still running"""
+        tasks = list(tasks)
+        if not tasks:
+            return
+        done, pending = await asyncio.wait(tasks, timeout=get_drain_timeout())
+        if pending:
+            logger.warning(f"Cancelling {len(pending)} tasks still busy after the drain timeout; their in-flight requests are not counted")
+            for task in pending:
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    async def watch_stop_event(self):
+        """Stop the test when the tester's stop event is set from another thread (e.g. on cancellation)"""
+        await asyncio.get_running_loop().run_in_executor(None, self.tester.stop_event.wait)
+        self.stopping.set()
+    
+    def new_connector(self):
+        """Create a connection pool with the test's pool size and keep-alive settings"""
+        return aiohttp.TCPConnector(
+            limit=0,
+            limit_per_host=self.test.pool_size or 0,
+            force_close=not self.test.keep_alive
+        )
+    
+    def open_shared_connector(self):
+        """Create the pool shared by all virtual users, if the test uses one"""
+        if self.test.connection_pool == 'shared':
+            self.shared_connector = self.new_connector()
+    
+    async def close_shared_connector(self):
+        """Close the shared pool once every user is done"""
+        if self.shared_connector is not None:
+            await self.shared_connector.close()
+            self.shared_connector = None
+    
+    def new_virtual_user(self, user_id, stopped=None):
+        """Create a virtual user on the shared pool or with a pool of its own"""
+        if self.shared_connector is not None:
+            virtual_user = AsyncVirtualUser(user_id, self.shared_connector, self.headers, stopped, trace_configs=self.trace_configs)
+        else:
+            virtual_user = AsyncVirtualUser(
+                user_id,
+                self.new_connector(),
+                self.headers,
+                stopped,
+                connector_owner=True,
+                trace_configs=self.trace_configs
+            )
+        virtual_user.body_mode = self.test.body_mode
+        return virtual_user
+    
+    async def arrival_task(self, intended_time, idle_users):
+        """Run one scheduled arrival on the next idle virtual user"""
+        virtual_user = await idle_users.get()
+        try:
+            if self.is_stopping():
+                return
+            self.tester.active_users.add(1)
+            try:
+                results = await self.run_iteration(virtual_user, intended_time)
+                if results:
+                    self.tester.record_results(results)
+            finally:
+                self.tester.active_users.add(-1)
+        except Exception as e:
+            logger.error(f"Arrival failed for virtual user {virtual_user.user_id}: {str(e)}")
+        finally:
+            idle_users.put_nowait(virtual_user)
+    
+    async def sleep_until(self, deadline):
+        """Wait until a loop.time() deadline, spinning for the last stretch"""
+        loop = asyncio.get_running_loop()
+        if not await self.sleep(deadline - loop.time() - SPIN_THRESHOLD):
+            return False
+        while loop.time() < deadline:
+            # Let other tasks run while spinning
+            await asyncio.sleep(0)
+        return not self.is_stopping()
+    
+    async def sleep(self, seconds, virtual_user=None):
+        """Wait without blocking the loop; return False if the test (or the user) is stopping"""
+        if self.is_stopping(virtual_user):
+            return False
+        if seconds > 0:
+            # A virtual user's stop signal is also set when the test stops
+            signal = virtual_user.stopped if virtual_user else self.stopping
+            await signal.wait(seconds)
+        return not self.is_stopping(virtual_user)
+    
+    def is_stopping(self, virtual_user=None):
+        """Check whether the test should stop, or the virtual user was retired"""
+        if virtual_user is not None and virtual_user.is_stopped():
+            return True
+        return self.stopping.is_set() or self.tester.stop_event.is_set()
+    
+    async def user_task(self, user_id, retired=None):
+        """Simulate a user making requests or executing a journey until the test stops or the user is retired"""
+        self.tester.active_users.add(1)
+        self.tester.user_counter.add(1)
+        
+        virtual_user = self.new_virtual_user(user_id, retired)
+        self.tester.virtual_users[user_id] = virtual_user
+        
+        try:
+            while not self.is_stopping(virtual_user):
+                results = await self.run_iteration(virtual_user)
+                if results:
+                    self.tester.record_results(results)
+                else:
+                    # Nothing to request, wait and continue
+                    await self.sleep(1, virtual_user)
+                
+                # Paced journeys start a fixed cycle time apart
+                pacing_wait = virtual_user.get_pacing_wait()
+                if pacing_wait > 0:
+                    await self.sleep(pacing_wait, virtual_user)
+        
+        except Exception as e:
+            logger.error(f"Virtual user {user_id} stopped: {str(e)}")
+        
+        finally:
+            self.tester.active_users.add(-1)
+            await virtual_user.close()
+            self.tester.virtual_users.pop(user_id, None)
+    
+    async def run_iteration(self, virtual_user, intended_time=None):
+        """Run a journey or a single request for a virtual user and return the results"""
+        if self.feeders:
+            virtual_user.feed_values = self.feeders.next_values(virtual_user.user_id)
+        
+        # Decide whether to use a journey based on probability
+        use_journey = random.random() <= self.test.journey_probability
+        
+        journey = self.journey_plans.choose() if use_journey else None
+        if journey:
+            virtual_user.start_paced_iteration(journey, intended_time)
+            return await self.execute_journey(virtual_user, journey, intended_time)
+        if self.target_url:
+            result = await self.make_request(virtual_user, intended_time)
+            return [result] if result else []
+        return []
+    
+    async def make_request(self, virtual_user, intended_time=None):
+        """Make a single request to the target URL"""
+        # Wait a realistic amount of time before making the request, unless
+        # the arrival schedule decides when it is sent
+        if intended_time is None:
+            wait_time = virtual_user.get_realistic_wait_time(self.request_plan.think_time)
+            if wait_time > 0 and not await self.sleep(wait_time, virtual_user):
+                return None
+        else:
+            wait_time = 0
+        virtual_user.last_request_time = time.time()
+        
+        result = self.tester.new_result(virtual_user, wait_time)
+        lag = self.tester.get_schedule_lag(intended_time)
+        
+        request = self.request_plan.fill(self.test, virtual_user.feed_values)
+        url = request.url
+        step_result = await virtual_user.fetch(
+            request.method,
+            url,
+            self.journey_plans.reads_previous_page,
+            request.assertions,
+            lag,
+            data=request.body,
+            headers=request.headers
+        )
+        
+        # Update virtual user's state
+        virtual_user.last_page = url
+        virtual_user.cookies = virtual_user.get_cookies()
+        virtual_user.current_url = url
+        
+        result.update(step_result)
+        result['url'] = url
+        self.tester.apply_schedule_lag(result, lag)
+        return result
+    
+    async def execute_journey(self, virtual_user, journey, intended_time=None):
+        """Execute a complete user journey"""
+        journey_results = []
+        
+        for step in journey.steps:
+            # Check if we should stop
+            if self.is_stopping(virtual_user):
+                break
+            
+            # Only the first step of an arrival is scheduled
+            result = await self.execute_journey_step(virtual_user, step, journey, intended_time)
+            if result is None:
+                break
+            journey_results.append(result)
+            intended_time = None
+            
+            # If the step failed, stop the journey
+            if not result['success']:
+                break
+        
+        return journey_results
+    
+    async def execute_journey_step(self, virtual_user, step, journey, intended_time=None):
+        """Execute a single step in a user journey"""
+        # Wait before executing the step (a scheduled arrival starts right away)
+        if intended_time is None:
+            wait_time = step.think_time.sample()
+            if not await self.sleep(wait_time, virtual_user):
+                return None
+        else:
+            wait_time = 0
+        
+        result = self.tester.new_result(
+            virtual_user,
+            wait_time,
+            journey_id=journey.id,
+            journey_name=journey.name,
+            journey_step_id=step.id,
+            step_type=step.step_type
+        )
+        lag = self.tester.get_schedule_lag(intended_time)
+        assertions = self.tester.get_step_assertions(step)
+        
+        try:
+            if step.step_type == 'navigate':
+                url = render_placeholders(step.url, virtual_user.feed_values)
+                result.update(await virtual_user.navigate_to(url, journey.base_url, step.keep_page, assertions, lag))
+            
+            elif step.step_type == 'click':
+                if not virtual_user.page_content:
+                    result.update({
+                        'success': False,
+                        'error': 'No page loaded to click element on',
+                        'url': virtual_user.current_url
+                    })
+                else:
+                    url = virtual_user.find_link(step.matcher)
+                    if url:
+                        result.update(await virtual_user.navigate_to(url, journey.base_url, step.keep_page, assertions, lag))
+                    else:
+                        result.update({
+                            'success': False,
+                            'error': f'Could not find element with selector: {step.selector}',
+                            'url': virtual_user.current_url
+                        })
+            
+            elif step.step_type == 'input':
+                if not virtual_user.page_content:
+                    result.update({
+                        'success': False,
+                        'error': 'No page loaded to input text on',
+                        'url': virtual_user.current_url
+                    })
+                else:
+                    # Store the input value in the journey state
+                    field_name = virtual_user.get_field_name(step.matcher, step.field_name)
+                    virtual_user.journey_state[field_name] = render_placeholders(step.value, virtual_user.feed_values)
+                    result.update({
+                        'success': True,
+                        'url': virtual_user.current_url
+                    })
+            
+            elif step.step_type == 'submit':
+                if not virtual_user.page_content:
+                    result.update({
+                        'success': False,
+                        'error': 'No page loaded to submit form on',
+                        'url': virtual_user.current_url
+                    })
+                else:
+                    result.update(await virtual_user.submit_form(step.matcher, virtual_user.journey_state, step.keep_page, assertions, lag))
+                    virtual_user.journey_state = {}
+            
+            elif step.step_type == 'wait':
+                result.update({
+                    'success': True,
+                    'url': virtual_user.current_url
+                })
+            
+            else:
+                result.update({
+                    'success': False,
+                    'error': f'Unknown step type: {step.step_type}',
+                    'url': virtual_user.current_url
+                })
+        
+        except Exception as e:
+            result.update({
+                'success': False,
+                'error': f'Error executing step: {str(e)}',
+                'error_class': classify_exception(e),
+                'url': virtual_user.current_url
+            })
+        
+        self.tester.apply_schedule_lag(result, lag)
+        return result
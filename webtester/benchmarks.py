@@ -0,0 +1,428 @@
+import asyncio
+import multiprocessing
+import os
+import platform
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from .metrics import PERCENTILES
+from .plans import JourneyPlans
+
+# A rate is sustained when at least this share of the scheduled arrivals
+# were sent, the 95th percentile schedule lag stays under the limit and at
+# most MAX_ERROR_RATE percent of the requests failed
+SUSTAINED_RATIO = 0.95
+MAX_SCHEDULE_LAG_MS = 25.0
+MAX_ERROR_RATE = 1.0
+
+# Extra runs halving the gap between the last sustained and the first failed rate
+REFINE_STEPS = 2
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Answers every request with a 200 response after a fixed latency, on a kept-alive connection"""
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+    payload = b''
+    
+    def handle_request(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        if self.latency:
+            time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(self.payload)))
+        self.end_headers()
+        if self.payload:
+            self.wfile.write(self.payload)
+    
+    do_GET = do_POST = do_PUT = do_DELETE = handle_request
+    
+    def log_message(self, format, *args):
+        pass
+
+class StandInHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    reuse_port = False
+    
+    def server_bind(self):
+        # Lets several server processes accept connections on the same port
+        if self.reuse_port:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+def serve_stand_in(port_queue, port, latency, payload_size, reuse_port):
+    """Run the stand-in HTTP server on a local port (in a process of its own)"""
+    StandInHandler.latency = latency
+    StandInHandler.payload = b'x' * payload_size
+    StandInHTTPServer.reuse_port = reuse_port
+    server = StandInHTTPServer(('127.0.0.1', port), StandInHandler)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+class LocalServer:
+    """Context manager running the stand-in server in separate processes
+    
+    The server gets interpreters of its own so that it does not compete with
+    the engine being measured for the GIL. With several processes they share
+    one port (where the platform has SO_REUSEPORT), for targets a single
+    process cannot keep up with. Every response takes latency seconds and
+    carries payload_size bytes.
+    """
+    
+    def __init__(self, latency=0.0, payload_size=0, processes=1):
+        self.latency = latency
+        self.payload_size = payload_size
+        self.processes = processes if hasattr(socket, 'SO_REUSEPORT') else 1
+    
+    def __enter__(self):
+        context = multiprocessing.get_context('spawn')
+        port_queue = context.Queue()
+        self.workers = []
+        port = 0
+        for index in range(self.processes):
+            process = context.Process(
+                target=serve_stand_in,
+                args=(port_queue, port, self.latency, self.payload_size, self.processes > 1),
+                daemon=True
+            )
+            process.start()
+            self.workers.append(process)
+            # The first process picks a free port, the others join it
+            port = port_queue.get(timeout=30)
+        self.url = f'http://127.0.0.1:{port}/'
+        return self
+    
+    def __exit__(self, *exc_info):
+        for process in self.workers:
+            process.terminate()
+            process.join()
+
+def summarize(durations, cpu_time, wall_time):
+    """Summarize per-request durations (in seconds) as milliseconds (all zero without any request)"""
+    durations = sorted(durations)
+    count = len(durations)
+    if not count:
+        # The target was down or every request failed
+        summary = {'requests': 0, 'mean_ms': 0.0, 'cpu_us_per_request': 0.0, 'requests_per_second': 0.0}
+        summary.update((f'{key}_ms', 0.0) for key, percentile in PERCENTILES)
+        return summary
+    summary = {
+        'requests': count,
+        'mean_ms': sum(durations) / count * 1000,
+        'cpu_us_per_request': cpu_time / count * 1000000,
+        'requests_per_second': count / wall_time if wall_time > 0 else 0.0,
+    }
+    for key, percentile in PERCENTILES:
+        index = min(count - 1, int(count * percentile / 100))
+        summary[f'{key}_ms'] = durations[index] * 1000
+    return summary
+
+def build_tester(url, method='GET', headers=None, body=None, **fields):
+    """Create a LoadTester for an unsaved single-request test (fields override the LoadTest defaults)"""
+    from .models import LoadTest
+    from .utils import LoadTester
+    fields.setdefault('num_users', 1)
+    test = LoadTest(name='benchmark', target_url=url, http_method=method, headers=headers, body=body, **fields)
+    tester = LoadTester(test)
+    tester.journey_plans = JourneyPlans()
+    return tester
+
+def measure(send, count, warmup):
+    """Time count calls of send() after a few warm-up calls"""
+    for _ in range(warmup):
+        send()
+    durations = []
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    for _ in range(count):
+        request_started = time.perf_counter()
+        send()
+        durations.append(time.perf_counter() - request_started)
+    return summarize(durations, time.process_time() - cpu_started, time.perf_counter() - started)
+
+def benchmark_requests(request, count, warmup=100):
+    """Baseline: a bare requests session sending the same request"""
+    session = requests.Session()
+    session.headers.update(request.session_headers)
+    
+    def send():
+        session.request(request.method, request.url, data=request.body, headers=request.headers, timeout=30).content
+    
+    try:
+        return measure(send, count, warmup)
+    finally:
+        session.close()
+
+def benchmark_thread_engine(url, count, warmup=100, **request):
+    """The thread engine's request path: build, send, time and aggregate one request"""
+    tester = build_tester(url, **request)
+    virtual_user = tester.new_virtual_user(0)
+    
+    def send():
+        # A scheduled request skips the think time
+        tester.record_results([tester.make_request(virtual_user, time.time())])
+    
+    try:
+        return measure(send, count, warmup)
+    finally:
+        virtual_user.session.close()
+
+async def measure_async(send, count, warmup):
+    """Time count awaits of send() after a few warm-up calls"""
+    for _ in range(warmup):
+        await send()
+    durations = []
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    for _ in range(count):
+        request_started = time.perf_counter()
+        await send()
+        durations.append(time.perf_counter() - request_started)
+    return summarize(durations, time.process_time() - cpu_started, time.perf_counter() - started)
+
+def benchmark_aiohttp(request, count, warmup=100):
+    """Baseline: a bare aiohttp session sending the same request"""
+    import aiohttp
+    
+    async def main():
+        async with aiohttp.ClientSession(headers=request.session_headers) as session:
+            async def send():
+                async with session.request(request.method, request.url, data=request.body, headers=request.headers) as response:
+                    await response.read()
+            return await measure_async(send, count, warmup)
+    
+    return asyncio.run(main())
+
+def benchmark_async_engine(url, count, warmup=100, **request):
+    """The async engine's request path: build, send, time and aggregate one request"""
+    from .async_engine import AsyncLoadRunner
+    tester = build_tester(url, **request)
+    runner = AsyncLoadRunner(tester)
+    
+    async def main():
+        virtual_user = runner.new_virtual_user(0)
+        
+        async def send():
+            tester.record_results([await runner.make_request(virtual_user, time.time())])
+        
+        try:
+            return await measure_async(send, count, warmup)
+        finally:
+            await virtual_user.close()
+    
+    return asyncio.run(main())
+
+def run_overhead_benchmark(count=2000, engines=('thread', 'async'), **request):
+    """Measure the per-request overhead of each engine over its bare HTTP client
+    
+    Every request goes to a local stand-in server answering at once one at a time, so the time
+    per request is client-side work plus a loopback round trip, which the
+    baseline pays as well.
+    """
+    results = {}
+    with LocalServer() as server:
+        plan = build_tester(server.url, **request).get_request_plan()
+        for engine in engines:
+            if engine == 'async':
+                baseline = benchmark_aiohttp(plan, count)
+                measured = benchmark_async_engine(server.url, count, **request)
+            else:
+                baseline = benchmark_requests(plan, count)
+                measured = benchmark_thread_engine(server.url, count, **request)
+            results[engine] = {
+                'baseline': baseline,
+                'engine': measured,
+                'overhead_ms': measured['mean_ms'] - baseline['mean_ms'],
+                'overhead_cpu_us': measured['cpu_us_per_request'] - baseline['cpu_us_per_request'],
+            }
+    return results
+
+def get_rss():
+    """Get the resident memory of this process in bytes (None where it cannot be read)"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+class MemorySampler:
+    """Context manager sampling the resident memory of this process, keeping the peak"""
+    
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.baseline = None
+        self.peak = None
+    
+    def __enter__(self):
+        self.baseline = self.peak = get_rss()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        if self.baseline is not None:
+            self.thread.start()
+        return self
+    
+    def sample(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, get_rss() or 0)
+    
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+def run_load(tester, duration):
+    """Run an unsaved test in this process and get its results summary and the CPU time it used
+    
+    Runs the engine directly, like a worker process does, so nothing is
+    written to the database.
+    """
+    cpu_started = time.process_time()
+    tester.started_at = time.time()
+    tester.run_engine(tester.started_at + duration)
+    tester.finished_at = time.time()
+    cpu_time = time.process_time() - cpu_started
+    return tester.process_results(), cpu_time
+
+def to_ms(values):
+    return {key: value * 1000 for key, value in values.items()}
+
+def run_rate_step(url, engine, rate, users, duration, max_lag=MAX_SCHEDULE_LAG_MS, **request):
+    """Send arrivals at a fixed rate for duration seconds and check whether the engine kept up"""
+    tester = build_tester(
+        url, engine=engine, load_model='open', arrival_rate=rate, num_users=users, duration=duration, **request
+    )
+    results, cpu_time = run_load(tester, duration)
+    total = results['total_requests']
+    achieved = total / duration
+    error_rate = results['failed_requests'] / total * 100 if total else 100.0
+    schedule_lag = to_ms(results['schedule_lag'])
+    return {
+        'target_rate': rate,
+        'achieved_rate': achieved,
+        'requests': total,
+        'error_rate': error_rate,
+        'cpu_us_per_request': cpu_time / total * 1000000 if total else None,
+        'latency_ms': to_ms(results['percentiles']),
+        'schedule_lag_ms': schedule_lag,
+        'sustained': bool(total) and achieved >= rate * SUSTAINED_RATIO
+            and schedule_lag.get('p95', 0) <= max_lag and error_rate <= MAX_ERROR_RATE,
+    }
+
+def find_max_rate(url, engine, users, start_rate, max_rate, step_factor, step_duration, max_lag=MAX_SCHEDULE_LAG_MS, **request):
+    """Raise the arrival rate step by step until the engine falls behind
+    
+    Returns the last sustained step (None if even the start rate was not)
+    and every step that was run.
+    """
+    steps = []
+    best = failed = None
+    rate = start_rate
+    while rate <= max_rate:
+        step = run_rate_step(url, engine, rate, users, step_duration, max_lag, **request)
+        steps.append(step)
+        if not step['sustained']:
+            failed = step
+            break
+        best = step
+        rate *= step_factor
+    
+    if best and failed:
+        low, high = best['target_rate'], failed['target_rate']
+        for _ in range(REFINE_STEPS):
+            step = run_rate_step(url, engine, (low + high) / 2, users, step_duration, max_lag, **request)
+            steps.append(step)
+            if step['sustained']:
+                best, low = step, step['target_rate']
+            else:
+                high = step['target_rate']
+    return best, steps
+
+def measure_memory(url, engine, users, duration, **request):
+    """Start users virtual users at once and measure the memory each one takes (None if unavailable)"""
+    tester = build_tester(url, engine=engine, num_users=users, spawn_rate=users, duration=duration, **request)
+    with MemorySampler() as sampler:
+        run_load(tester, duration)
+    if sampler.baseline is None:
+        return None
+    return {
+        'users': users,
+        'baseline_rss_bytes': sampler.baseline,
+        'peak_rss_bytes': sampler.peak,
+        'bytes_per_user': (sampler.peak - sampler.baseline) / users,
+    }
+
+def run_capacity_benchmark(engines=('thread', 'async'), latency=0.0, payload_size=0, users=200, start_rate=50,
+                           max_rate=20000, step_factor=1.5, step_duration=5, max_lag=MAX_SCHEDULE_LAG_MS,
+                           memory_users=500, memory_duration=5, server_processes=1, label='', **request):
+    """Measure how much load this machine can generate with each engine
+    
+    A local stand-in server answers after latency seconds with payload_size
+    bytes. For each engine an open model test is run at increasing arrival
+    rates to find the highest sustained rate; the CPU time per request and
+    the schedule lag are those of that rate. A closed model test starting
+    memory_users users at once gives the memory taken by each virtual user.
+    The result is a JSON-serializable dict, so that runs on different
+    versions or machines can be compared.
+    """
+    results = {
+        'label': label,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': {
+            'latency': latency,
+            'payload_size': payload_size,
+            'users': users,
+            'start_rate': start_rate,
+            'max_rate': max_rate,
+            'step_factor': step_factor,
+            'step_duration': step_duration,
+            'max_schedule_lag_ms': max_lag,
+            'memory_users': memory_users,
+            'server_processes': server_processes,
+            'request': request,
+        },
+        'engines': {},
+    }
+    with LocalServer(latency, payload_size, server_processes) as server:
+        for engine in engines:
+            best, steps = find_max_rate(
+                server.url, engine, users, start_rate, max_rate, step_factor, step_duration, max_lag, **request
+            )
+            results['engines'][engine] = {
+                'max_sustained_rps': best['achieved_rate'] if best else 0,
+                'cpu_us_per_request': best['cpu_us_per_request'] if best else None,
+                'schedule_lag_ms': best['schedule_lag_ms'] if best else {},
+                # Every rate up to max_rate was sustained, the real limit is higher
+                'reached_max_rate': bool(best) and all(step['sustained'] for step in steps),
+                'memory': measure_memory(server.url, engine, memory_users, memory_duration, **request),
+                'steps': steps,
+            }
+    return results
+
+def compare_capacity(baseline, current):
+    """Get the change of each engine's headline numbers between two capacity benchmark results"""
+    def change(before, after):
+        if not before or after is None:
+            return None
+        return (after - before) / before * 100
+    
+    changes = {}
+    for engine, result in current['engines'].items():
+        previous = baseline.get('engines', {}).get(engine)
+        if not previous:
+            continue
+        memory = (result.get('memory') or {}).get('bytes_per_user')
+        previous_memory = (previous.get('memory') or {}).get('bytes_per_user')
+        changes[engine] = {
+            'max_sustained_rps': change(previous['max_sustained_rps'], result['max_sustained_rps']),
+            'cpu_us_per_request': change(previous['cpu_us_per_request'], result['cpu_us_per_request']),
+            'bytes_per_user': change(previous_memory, memory),
+            'schedule_lag_p95_ms': change(previous['schedule_lag_ms'].get('p95'), result['schedule_lag_ms'].get('p95')),
+        }
+    return changes
@@ -0,0 +1,401 @@
+import logging
+import queue
+import threading
+import time
+from urllib.parse import urlparse
+from django.conf import settings
+from .pages import normalize_selector
+
+logger = logging.getLogger(__name__)
+
+# Seconds a page may take to load, like the timeout of HTTP requests
+PAGE_LOAD_TIMEOUT = 30
+
+# Seconds to wait for the element of a click, input or submit step
+ELEMENT_TIMEOUT = 10
+
+# Seconds after a click or submit within which a navigation must start;
+# after that the page is taken to have handled the action itself
+NAVIGATION_GRACE = 0.5
+
+WAIT_POLL_INTERVAL = 0.05
+
+# Share of the available memory the pool may fill with browsers
+MEMORY_HEADROOM = 0.8
+
+# Marks the page as unloading once a click or submit starts a navigation
+WATCH_NAVIGATION_SCRIPT = """
+window.__webtesterLeaving = false;
+if (!window.__webtesterWatching) {
+    window.__webtesterWatching = true;
+    window.addEventListener('beforeunload', function () { window.__webtesterLeaving = true; });
+}
+"""
+
+LOADED_SCRIPT = """
+var entry = performance.getEntriesByType('navigation')[0];
+return document.readyState === 'complete' && (!entry || entry.loadEventEnd > 0);
+"""
+
+# Navigation timing of the current document, plus its Largest Contentful
+# Paint (only reported to a buffered observer)
+PAGE_TIMINGS_SCRIPT = """
+var done = arguments[arguments.length - 1];
+var entry = performance.getEntriesByType('navigation')[0];
+if (!entry) {
+    done(null);
+    return;
+}
+var timings = {
+    timeOrigin: performance.timeOrigin,
+    connectStart: entry.connectStart,
+    connectEnd: entry.connectEnd,
+    secureConnectionStart: entry.secureConnectionStart,
+    requestStart: entry.requestStart,
+    responseStart: entry.responseStart,
+    responseEnd: entry.responseEnd,
+    domContentLoadedEventEnd: entry.domContentLoadedEventEnd,
+    loadEventEnd: entry.loadEventEnd,
+    encodedBodySize: entry.encodedBodySize,
+    responseStatus: entry.responseStatus || null,
+    lcp: null
+};
+var observer = null;
+try {
+    observer = new PerformanceObserver(function (list) {
+        var entries = list.getEntries();
+        if (entries.length) {
+            timings.lcp = entries[entries.length - 1].startTime;
+        }
+    });
+    observer.observe({type: 'largest-contentful-paint', buffered: true});
+} catch (e) {}
+setTimeout(function () {
+    if (observer) {
+        observer.disconnect();
+    }
+    done(timings);
+}, 50);
+"""
+
+def get_browser_memory():
+    """Memory (in bytes) set aside for each headless browser"""
+    return getattr(settings, 'WEBTESTER_BROWSER_MEMORY_MB', 300) * 1024 * 1024
+
+def get_available_memory():
+    """Memory (in bytes) available to new processes, or None if it is unknown"""
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+def get_browser_pool_size(requested=None, processes=1):
+    """Number of browsers a pool may start: the requested size, capped by the available memory
+    
+    processes is the number of pools started on this machine at the same
+    time, which share the memory.
+    """
+    size = requested or getattr(settings, 'WEBTESTER_MAX_BROWSERS', 8)
+    available = get_available_memory()
+    if available is not None:
+        size = min(size, int(available * MEMORY_HEADROOM / get_browser_memory() / max(1, processes)))
+    return max(1, size)
+
+def create_driver():
+    """Start a headless Chrome"""
+    from selenium import webdriver
+    from selenium.webdriver.chrome.options import Options
+    
+    options = Options()
+    options.add_argument('--headless=new')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    options.add_argument('--disable-gpu')
+    options.add_argument('--disable-extensions')
+    options.add_argument('--window-size=1366,768')
+    binary = getattr(settings, 'WEBTESTER_BROWSER_BINARY', None)
+    if binary:
+        options.binary_location = binary
+    
+    driver = webdriver.Chrome(options=options)
+    driver.set_page_load_timeout(PAGE_LOAD_TIMEOUT)
+    return driver
+
+def reset_browser(driver, origins=()):
+    """Remove everything a virtual user left in a browser: cookies, storage and cache"""
+    driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+    driver.execute_cdp_cmd('Network.clearBrowserCache', {})
+    for origin in origins:
+        driver.execute_cdp_cmd('Storage.clearDataForOrigin', {'origin': origin, 'storageTypes': 'all'})
+    driver.get('about:blank')
+
+class BrowserPool:
+    """Headless browsers shared by the virtual users of a test
+    
+    Starting a browser takes seconds and hundreds of megabytes, so browsers
+    are started only as virtual users need them, up to size, and each one
+    is leased to a virtual user for a whole journey. When a lease ends the
+    browser's cookies, storage and cache are cleared so nothing leaks into
+    the next virtual user's journey; a browser that cannot be reset is
+    replaced. Virtual users wait while every browser is leased.
+    """
+    
+    def __init__(self, size):
+        self.size = size
+        self.idle = queue.LifoQueue()  # The most recently used browsers are reused first
+        self.drivers = []
+        self.lock = threading.Lock()
+        self.closed = False
+    
+    @classmethod
+    def for_test(cls, test, processes=1):
+        """Create the pool of a browser journey test run by one of processes pools on this machine"""
+        size = get_browser_pool_size(test.browser_pool_size, processes)
+        logger.info(f"Browser pool for test {test.name}: up to {size} headless browsers")
+        return cls(size)
+    
+    def acquire(self, stopped=None):
+        """Lease a browser; returns None if stopped is set while every browser is leased"""
+        while not self.closed:
+            try:
+                return self.idle.get_nowait()
+            except queue.Empty:
+                pass
+            
+            with self.lock:
+                start = len(self.drivers) < self.size
+                if start:
+                    # Reserve the slot while the browser starts
+                    self.drivers.append(None)
+            if start:
+                return self.start_driver()
+            
+            try:
+                return self.idle.get(timeout=WAIT_POLL_INTERVAL * 10)
+            except queue.Empty:
+                if stopped is not None and stopped.is_set():
+                    return None
+        return None
+    
+    def start_driver(self):
+        try:
+            driver = create_driver()
+        except Exception:
+            with self.lock:
+                self.drivers.remove(None)
+            raise
+        with self.lock:
+            self.drivers[self.drivers.index(None)] = driver
+        return driver
+    
+    def release(self, driver, origins=()):
+        """Clear what the lease left in a browser and give it back to the pool"""
+        if self.closed:
+            self.discard(driver)
+            return
+        try:
+            reset_browser(driver, origins)
+        except Exception as e:
+            logger.warning(f"Replacing a browser that could not be reset: {str(e)}")
+            self.discard(driver)
+            return
+        self.idle.put(driver)
+    
+    def discard(self, driver):
+        """Quit a browser and free its slot"""
+        with self.lock:
+            if driver in self.drivers:
+                self.drivers.remove(driver)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+    
+    def close(self):
+        """Quit every browser (leased ones are quit when they are released)"""
+        self.closed = True
+        while True:
+            try:
+                self.discard(self.idle.get_nowait())
+            except queue.Empty:
+                break
+
+class BrowserSession:
+    """A virtual user's journey in a leased browser
+    
+    Every step is timed from the action until the page it leads to has
+    loaded. Steps that load a new document also get the navigation timings
+    of that document (connect, TLS, TTFB, transfer) and its page load
+    milestones (DOMContentLoaded, load and Largest Contentful Paint).
+    """
+    
+    def __init__(self, driver, user_agent=None):
+        self.driver = driver
+        self.origins = set()  # Origins whose storage is cleared when the lease ends
+        self.time_origin = None  # performance.timeOrigin of the last measured document
+        if user_agent:
+            driver.execute_cdp_cmd('Network.setUserAgentOverride', {'userAgent': user_agent})
+    
+    @property
+    def current_url(self):
+        try:
+            return self.driver.current_url
+        except Exception:
+            return None
+    
+    def navigate(self, url):
+        """Load a URL"""
+        start_time = time.time()
+        self.driver.get(url)
+        self.wait_for_load(start_time)
+        return self.finish(start_time, time.time(), navigated=True)
+    
+    def click(self, selector):
+        """Click an element, waiting for the page it leads to if it starts a navigation"""
+        from selenium.webdriver.support import expected_conditions
+        
+        element = self.find(selector, expected_conditions.element_to_be_clickable)
+        return self.interact(element.click)
+    
+    def input(self, selector, value):
+        """Type a value into a field"""
+        from selenium.webdriver.support import expected_conditions
+        
+        element = self.find(selector, expected_conditions.visibility_of_element_located)
+        start_time = time.time()
+        element.clear()
+        element.send_keys(value)
+        return self.finish(start_time, time.time(), navigated=False)
+    
+    def submit(self, selector):
+        """Submit a form (or click its submit button), running the page's submit handlers"""
+        from selenium.webdriver.support import expected_conditions
+        
+        element = self.find(selector, expected_conditions.presence_of_element_located)
+        if element.tag_name.lower() == 'form':
+            return self.interact(lambda: self.driver.execute_script(
+                "arguments[0].requestSubmit ? arguments[0].requestSubmit() : arguments[0].submit();", element
+            ))
+        return self.interact(element.click)
+    
+    def find(self, selector, condition):
+        """Wait for the element matching a journey step selector"""
+        from selenium.common.exceptions import TimeoutException
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        
+        try:
+            return WebDriverWait(self.driver, ELEMENT_TIMEOUT, poll_frequency=WAIT_POLL_INTERVAL).until(
+                condition((By.CSS_SELECTOR, normalize_selector(selector)))
+            )
+        except TimeoutException:
+            raise LookupError(f"Could not find element with selector: {selector}")
+    
+    def interact(self, action):
+        """Run a click or submit and time it until the page it navigates to has loaded"""
+        from selenium.common.exceptions import TimeoutException
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        
+        document = self.driver.find_element(By.TAG_NAME, 'html')
+        self.driver.execute_script(WATCH_NAVIGATION_SCRIPT)
+        
+        start_time = time.time()
+        action()
+        acted_at = time.time()
+        
+        try:
+            WebDriverWait(self.driver, NAVIGATION_GRACE, poll_frequency=WAIT_POLL_INTERVAL).until(
+                lambda driver: self.is_leaving(document)
+            )
+        except TimeoutException:
+            # The page handled the action itself
+            return self.finish(start_time, acted_at, navigated=False)
+        
+        self.wait_for_load(start_time, document)
+        return self.finish(start_time, time.time(), navigated=True)
+    
+    def is_leaving(self, document):
+        """Check whether the page started unloading (or was already replaced)"""
+        from selenium.common.exceptions import WebDriverException
+        
+        try:
+            document.is_enabled()
+            return self.driver.execute_script("return window.__webtesterLeaving === true;")
+        except WebDriverException:
+            # The document is stale, or scripts cannot run while the browser switches documents
+            return True
+    
+    def wait_for_load(self, start_time, previous=None):
+        """Wait until a new document replaced previous (if given) and fired its load event"""
+        from selenium.common.exceptions import StaleElementReferenceException, TimeoutException, WebDriverException
+        from selenium.webdriver.support.ui import WebDriverWait
+        
+        def loaded(driver):
+            try:
+                if previous is not None:
+                    try:
+                        previous.is_enabled()
+                        return False
+                    except StaleElementReferenceException:
+                        pass
+                return driver.execute_script(LOADED_SCRIPT)
+            except WebDriverException:
+                return False
+        
+        timeout = max(0.0, start_time + PAGE_LOAD_TIMEOUT - time.time())
+        try:
+            WebDriverWait(self.driver, timeout, poll_frequency=WAIT_POLL_INTERVAL).until(loaded)
+        except TimeoutException:
+            raise TimeoutError(f"Page did not load within {PAGE_LOAD_TIMEOUT} seconds")
+    
+    def finish(self, start_time, end_time, navigated):
+        """Build the result of a step"""
+        url = self.current_url
+        if url and url.startswith(('http://', 'https://')):
+            parsed = urlparse(url)
+            self.origins.add(f"{parsed.scheme}://{parsed.netloc}")
+        
+        result = {
+            'success': True,
+            'response_time': end_time - start_time,
+            'url': url
+        }
+        if navigated:
+            result.update(self.get_page_timings())
+            if (result.get('status_code') or 0) >= 400:
+                result['success'] = False
+        return result
+    
+    def get_page_timings(self):
+        """Get the navigation timings and page load milestones of a newly loaded document"""
+        timings = self.driver.execute_async_script(PAGE_TIMINGS_SCRIPT)
+        if not timings or timings['timeOrigin'] == self.time_origin:
+            return {}
+        self.time_origin = timings['timeOrigin']
+        
+        def span(start, end):
+            if not end or start is None or end < start:
+                return None
+            return (end - start) / 1000
+        
+        secure_start = timings['secureConnectionStart']
+        return {
+            'status_code': timings['responseStatus'],
+            'connect_time': span(timings['connectStart'], timings['connectEnd']),
+            'tls_time': span(secure_start, timings['connectEnd']) if secure_start else None,
+            'ttfb': span(timings['requestStart'], timings['responseStart']),
+            'transfer_time': span(timings['responseStart'], timings['responseEnd']),
+            'connection_reused': timings['connectStart'] == timings['connectEnd'],
+            'content_length': timings['encodedBodySize'] or None,
+            'dom_content_loaded': span(0, timings['domContentLoadedEventEnd']),
+            'load_time': span(0, timings['loadEventEnd']),
+            'lcp': span(0, timings['lcp']),
+        }
+    
+    def get_page_source(self):
+        return self.driver.page_source
@@ -0,0 +1,196 @@
+import math
+from .metrics import PERCENTILES, LatencyHistogram
+
+# Largest p-value reported as a significant difference
+SIGNIFICANCE_LEVEL = 0.05
+
+# Smallest change in latency or throughput (in percent) reported as a
+# regression. With many requests even a tiny shift is significant, so
+# significance alone would flag noise between deploys.
+MIN_CHANGE_PERCENT = 5.0
+
+def normal_p_value(z):
+    """Two-sided p-value of a standard normal z statistic"""
+    return math.erfc(abs(z) / math.sqrt(2))
+
+def ks_p_value(statistic, baseline_count, candidate_count):
+    """Asymptotic p-value of a two-sample Kolmogorov-Smirnov statistic"""
+    effective = math.sqrt(baseline_count * candidate_count / (baseline_count + candidate_count))
+    scaled = (effective + 0.12 + 0.11 / effective) * statistic
+    if scaled < 0.2:
+        return 1.0
+    p_value = 0.0
+    for k in range(1, 101):
+        term = 2 * (-1) ** (k - 1) * math.exp(-2 * k * k * scaled * scaled)
+        p_value += term
+        if abs(term) < 1e-10:
+            break
+    return min(1.0, max(0.0, p_value))
+
+def ks_test(baseline, candidate):
+    """Two-sample Kolmogorov-Smirnov test on two latency histograms
+    
+    Both histograms use the same buckets, so their distribution functions
+    are compared bucket by bucket. Returns (statistic, p_value).
+    """
+    statistic = 0.0
+    baseline_seen = candidate_seen = 0
+    for index in sorted(set(baseline.counts) | set(candidate.counts)):
+        baseline_seen += baseline.counts.get(index, 0)
+        candidate_seen += candidate.counts.get(index, 0)
+        statistic = max(statistic, abs(baseline_seen / baseline.total - candidate_seen / candidate.total))
+    return statistic, ks_p_value(statistic, baseline.total, candidate.total)
+
+def proportion_test(baseline_hits, baseline_total, candidate_hits, candidate_total):
+    """Two-proportion z-test; returns the p-value"""
+    pooled = (baseline_hits + candidate_hits) / (baseline_total + candidate_total)
+    variance = pooled * (1 - pooled) * (1 / baseline_total + 1 / candidate_total)
+    if variance <= 0:
+        return 1.0
+    z = (candidate_hits / candidate_total - baseline_hits / baseline_total) / math.sqrt(variance)
+    return normal_p_value(z)
+
+def rate_test(baseline_count, baseline_duration, candidate_count, candidate_duration):
+    """Compare two Poisson event rates (requests per second); returns the p-value"""
+    variance = baseline_count / baseline_duration ** 2 + candidate_count / candidate_duration ** 2
+    if variance <= 0:
+        return 1.0
+    z = (candidate_count / candidate_duration - baseline_count / baseline_duration) / math.sqrt(variance)
+    return normal_p_value(z)
+
+def percent_change(baseline, candidate):
+    """Get the change from baseline to candidate in percent of baseline (None if undefined)"""
+    if baseline is None or candidate is None or baseline == 0:
+        return None
+    return (candidate - baseline) / baseline * 100
+
+def get_test_summary(test):
+    """Get what a comparison needs from a completed LoadTest's stored summary"""
+    if test.status != 'completed':
+        raise ValueError(f"Test {test.name!r} has not completed")
+    histogram = LatencyHistogram.from_dict(test.get_metrics_data_dict().get('latency_histogram'))
+    if not histogram.total:
+        raise ValueError(f"Test {test.name!r} has no stored latency histogram")
+    
+    duration = None
+    if test.requests_per_second:
+        duration = test.total_requests / test.requests_per_second
+    return {
+        'id': test.pk,
+        'name': test.name,
+        'completed_at': test.completed_at,
+        'total_requests': test.total_requests,
+        'failed_requests': test.failed_requests,
+        'duration': duration or test.get_duration(),
+        'stopped_early': test.stopped_early,
+        'histogram': histogram,
+    }
+
+def classify(significant, change, worse_when_higher, min_change):
+    """Label a metric change as a regression, an improvement or no significant change"""
+    if not significant or change is None or abs(change) < min_change:
+        return 'unchanged'
+    if (change > 0) == worse_when_higher:
+        return 'regression'
+    return 'improvement'
+
+def compare_latency(baseline, candidate, alpha, min_change):
+    """Compare the latency distributions of two tests"""
+    statistic, p_value = ks_test(baseline['histogram'], candidate['histogram'])
+    significant = p_value < alpha
+    
+    rows = [{
+        'key': 'avg',
+        'baseline': baseline['histogram'].mean(),
+        'candidate': candidate['histogram'].mean(),
+    }]
+    for key, percentile in PERCENTILES:
+        rows.append({
+            'key': key,
+            'baseline': baseline['histogram'].percentile(percentile),
+            'candidate': candidate['histogram'].percentile(percentile),
+        })
+    for row in rows:
+        row['change'] = percent_change(row['baseline'], row['candidate'])
+    
+    # The median and the tail can move apart; the larger change decides
+    changes = [row['change'] for row in rows if row['key'] in ('p50', 'p95') and row['change'] is not None]
+    deciding = max(changes, key=abs, default=None)
+    return {
+        'percentiles': rows,
+        'ks_statistic': statistic,
+        'p_value': p_value,
+        'significant': significant,
+        'verdict': classify(significant, deciding, True, min_change),
+    }
+
+def compare_throughput(baseline, candidate, alpha, min_change):
+    """Compare the request rates of two tests"""
+    if not baseline['duration'] or not candidate['duration']:
+        return None
+    baseline_rate = baseline['total_requests'] / baseline['duration']
+    candidate_rate = candidate['total_requests'] / candidate['duration']
+    p_value = rate_test(baseline['total_requests'], baseline['duration'], candidate['total_requests'], candidate['duration'])
+    change = percent_change(baseline_rate, candidate_rate)
+    return {
+        'baseline': baseline_rate,
+        'candidate': candidate_rate,
+        'change': change,
+        'p_value': p_value,
+        'significant': p_value < alpha,
+        'verdict': classify(p_value < alpha, change, False, min_change),
+    }
+
+def compare_error_rate(baseline, candidate, alpha):
+    """Compare the share of failed requests of two tests"""
+    baseline_rate = baseline['failed_requests'] / baseline['total_requests']
+    candidate_rate = candidate['failed_requests'] / candidate['total_requests']
+    p_value = proportion_test(
+        baseline['failed_requests'], baseline['total_requests'], candidate['failed_requests'], candidate['total_requests']
+    )
+    significant = p_value < alpha
+    verdict = 'unchanged'
+    if significant and candidate_rate != baseline_rate:
+        verdict = 'regression' if candidate_rate > baseline_rate else 'improvement'
+    return {
+        'baseline': baseline_rate * 100,
+        'candidate': candidate_rate * 100,
+        'change': (candidate_rate - baseline_rate) * 100,  # Percentage points
+        'p_value': p_value,
+        'significant': significant,
+        'verdict': verdict,
+    }
+
+def compare_tests(baseline, candidate, alpha=SIGNIFICANCE_LEVEL, min_change=MIN_CHANGE_PERCENT):
+    """Compare two completed LoadTests and flag regressions of the candidate
+    
+    Only the stored summaries are read (the latency histogram, request
+    counts and rate), never the raw results, so a comparison takes the
+    same time whatever the size of the tests. Latency distributions are
+    compared with a Kolmogorov-Smirnov test, error rates with a
+    two-proportion z-test and throughput as Poisson rates. A change is a
+    regression when it is significant at alpha and, for latency and
+    throughput, larger than min_change percent. Raises ValueError if either test
+    has no stored summary.
+    """
+    baseline_summary = get_test_summary(baseline)
+    candidate_summary = get_test_summary(candidate)
+    
+    comparison = {
+        'baseline': {key: value for key, value in baseline_summary.items() if key != 'histogram'},
+        'candidate': {key: value for key, value in candidate_summary.items() if key != 'histogram'},
+        'alpha': alpha,
+        'min_change': min_change,
+        'latency': compare_latency(baseline_summary, candidate_summary, alpha, min_change),
+        'throughput': compare_throughput(baseline_summary, candidate_summary, alpha, min_change),
+        'error_rate': compare_error_rate(baseline_summary, candidate_summary, alpha),
+    }
+    
+    metrics = ('latency', 'throughput', 'error_rate')
+    comparison['regressions'] = [
+        metric for metric in metrics if comparison[metric] and comparison[metric]['verdict'] == 'regression'
+    ]
+    comparison['improvements'] = [
+        metric for metric in metrics if comparison[metric] and comparison[metric]['verdict'] == 'improvement'
+    ]
+    return comparison
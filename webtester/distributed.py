@@ -0,0 +1,283 @@
+import json
+import logging
+import queue
+import socket
+import threading
+import time
+from multiprocessing.connection import Client, Listener, wait
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from .plans import JourneyPlans
+from .feeders import FeederSet
+
+logger = logging.getLogger(__name__)
+
+# Seconds between registering the last worker and starting the shared test
+# clock, long enough for the plan to reach every worker
+REMOTE_START_DELAY = 2
+
+# LoadTest fields that are not part of the test configuration sent to workers
+LOCAL_FIELDS = {
+    'created_at', 'updated_at', 'status', 'started_at', 'completed_at', 'total_requests',
+    'successful_requests', 'failed_requests', 'avg_response_time', 'min_response_time',
+    'max_response_time', 'requests_per_second', 'users_data', 'metrics_data',
+}
+
+def get_coordinator_address():
+    """Get the (host, port) the coordinator listens on"""
+    return (
+        getattr(settings, 'WEBTESTER_COORDINATOR_HOST', '127.0.0.1'),
+        getattr(settings, 'WEBTESTER_COORDINATOR_PORT', 7741),
+    )
+
+def get_authkey():
+    """Get the shared secret workers authenticate with; raises ImproperlyConfigured when none is set"""
+    authkey = getattr(settings, 'WEBTESTER_COORDINATOR_AUTHKEY', None)
+    if not authkey:
+        raise ImproperlyConfigured(
+            "Distributed tests need WEBTESTER_COORDINATOR_AUTHKEY, a secret shared by the coordinator and its workers"
+        )
+    return authkey.encode() if isinstance(authkey, str) else authkey
+
+def send_message(conn, message):
+    """Send a (kind, worker_index, payload) message as JSON"""
+    conn.send_bytes(json.dumps(message, cls=DjangoJSONEncoder).encode())
+
+def receive_message(conn):
+    """Receive a (kind, worker_index, payload) message sent by send_message()
+    
+    Messages are JSON rather than pickles, so even an authenticated peer
+    cannot make the other side run code. Raises ValueError for anything else.
+    """
+    message = json.loads(conn.recv_bytes())
+    if not isinstance(message, list) or len(message) != 3:
+        raise ValueError("Malformed message")
+    return message
+
+def serialize_test(test):
+    """Get the configuration of a LoadTest as a dict of field values"""
+    return {
+        field.attname: field.value_from_object(test)
+        for field in test._meta.concrete_fields
+        if field.name not in LOCAL_FIELDS
+    }
+
+def deserialize_test(config):
+    """Rebuild an unsaved LoadTest from serialize_test() output"""
+    from .models import LoadTest
+    return LoadTest(**config)
+
+class ConnectionQueue:
+    """Queue-like wrapper sending messages over a connection from several threads"""
+    
+    def __init__(self, conn):
+        self.conn = conn
+        self.lock = threading.Lock()
+    
+    def put(self, message):
+        with self.lock:
+            send_message(self.conn, message)
+
+class Coordinator:
+    """Django side of a distributed test: hands the plan to remote workers and collects their results
+    
+    Workers started with `manage.py webtester_worker` connect to the
+    coordinator, which gives each one a worker index, the test
+    configuration, its journey plans and a start time. Workers then
+    stream the same ('results' | 'done' | 'error', worker_index, payload)
+    messages as local worker processes, encoded as JSON.
+    """
+    
+    def __init__(self, tester, worker_count, address=None, authkey=None):
+        self.tester = tester
+        self.worker_count = worker_count
+        self.address = address or get_coordinator_address()
+        self.authkey = authkey or get_authkey()
+        self.register_timeout = getattr(settings, 'WEBTESTER_WORKER_REGISTER_TIMEOUT', 60)
+        self.connections = {}
+    
+    def accept_workers(self, listener):
+        """Wait until every worker has connected and registered"""
+        accepted = queue.Queue()
+        closed = threading.Event()
+        
+        def accept():
+            while not closed.is_set():
+                try:
+                    conn = listener.accept()
+                except OSError as e:
+                    # Includes failed authentication by a stray client
+                    if closed.is_set():
+                        break
+                    logger.warning(f"Rejected worker connection: {str(e)}")
+                    continue
+                if closed.is_set():
+                    conn.close()
+                    break
+                accepted.put(conn)
+        
+        acceptor = threading.Thread(target=accept, daemon=True)
+        acceptor.start()
+        
+        deadline = time.time() + self.register_timeout
+        try:
+            while len(self.connections) < self.worker_count:
+                if self.tester.stop_event.is_set():
+                    raise RuntimeError("Test stopped while waiting for remote workers")
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise RuntimeError(
+                        f"Only {len(self.connections)} of {self.worker_count} remote workers registered"
+                    )
+                
+                try:
+                    conn = accepted.get(timeout=min(remaining, 0.5))
+                except queue.Empty:
+                    continue
+                
+                try:
+                    if not conn.poll(remaining):
+                        conn.close()
+                        continue
+                    kind, worker_index, payload = receive_message(conn)
+                except (EOFError, OSError, ValueError):
+                    conn.close()
+                    continue
+                if kind != 'register' or not isinstance(payload, dict):
+                    conn.close()
+                    continue
+                
+                worker_index = len(self.connections)
+                self.connections[worker_index] = conn
+                logger.info(f"Remote worker {worker_index} registered: {payload.get('name')}")
+        finally:
+            closed.set()
+            # Wake up the blocked accept() so the thread can exit
+            try:
+                host, port = self.address
+                Client(('127.0.0.1' if host in ('', '0.0.0.0') else host, port), authkey=self.authkey).close()
+            except Exception:
+                pass
+            acceptor.join(timeout=1)
+    
+    def send_plan(self, start_time, end_time):
+        """Send every worker its index, the test configuration and the shared test window"""
+        plan = {
+            'test': serialize_test(self.tester.test),
+            'plans': self.tester.load_plans().to_dict(),
+            'feeders': self.tester.feeders.to_dict(),
+            'worker_count': self.worker_count,
+            'duration': end_time - start_time,
+        }
+        for worker_index, conn in self.connections.items():
+            # Workers' clocks may differ from ours, so the start is sent as a delay
+            send_message(conn, ('plan', worker_index, dict(plan, start_in=start_time - time.time())))
+    
+    def run(self, duration):
+        """Run the test on the remote workers and merge the results they stream back
+        
+        The test lasts duration seconds from the moment every worker has
+        registered. Returns the list of worker errors.
+        """
+        errors = []
+        with Listener(self.address, authkey=self.authkey) as listener:
+            logger.info(f"Waiting for {self.worker_count} remote workers on {self.address[0]}:{self.address[1]}")
+            self.accept_workers(listener)
+        
+        start_time = time.time() + REMOTE_START_DELAY
+        self.tester.started_at = start_time
+        
+        try:
+            self.send_plan(start_time, start_time + duration)
+            
+            running = dict(self.connections)
+            stop_sent = False
+            while running:
+                if self.tester.stop_event.is_set() and not stop_sent:
+                    for conn in running.values():
+                        send_message(conn, ('stop', None, None))
+                    stop_sent = True
+                
+                for conn in wait(list(running.values()), timeout=0.5):
+                    worker_index = next(index for index, worker in running.items() if worker is conn)
+                    try:
+                        kind, _, payload = receive_message(conn)
+                    except (EOFError, OSError, ValueError):
+                        del running[worker_index]
+                        self.tester.worker_active_users[worker_index] = 0
+                        errors.append(f"Remote worker {worker_index} disconnected")
+                        continue
+                    
+                    if self.tester.handle_worker_message(kind, worker_index, payload, errors):
+                        del running[worker_index]
+        finally:
+            for conn in self.connections.values():
+                conn.close()
+        
+        return errors
+
+def run_remote_worker(address, authkey, name=None):
+    """Register with a coordinator, run this worker's share of the test and stream its results
+    
+    Returns once the test is over. Raises ConnectionRefusedError when no
+    coordinator is listening.
+    """
+    from .utils import LoadTester
+    
+    conn = Client(address, authkey=authkey)
+    try:
+        send_message(conn, ('register', None, {'name': name or socket.gethostname()}))
+        kind, worker_index, plan = receive_message(conn)
+        if kind != 'plan':
+            raise RuntimeError(f"Unexpected message from coordinator: {kind}")
+        
+        start_time = time.time() + plan['start_in']
+        end_time = start_time + plan['duration']
+        results = ConnectionQueue(conn)
+        
+        try:
+            tester = LoadTester(deserialize_test(plan['test']))
+            tester.journey_plans = JourneyPlans.from_dict(plan['plans'])
+            # Feeder files are opened at the same path, e.g. on shared storage
+            tester.feeders = FeederSet.from_dict(plan['feeders'])
+            tester.started_at = start_time
+        except Exception as e:
+            results.put(('error', worker_index, str(e)))
+            raise
+        
+        def listen():
+            # Stop early when asked to, or when the coordinator goes away
+            try:
+                while True:
+                    kind, _, _ = receive_message(conn)
+                    if kind == 'stop':
+                        break
+            except (EOFError, OSError, ValueError):
+                pass
+            tester.stop_event.set()
+        
+        threading.Thread(target=listen, daemon=True).start()
+        
+        logger.info(f"Running as worker {worker_index} of {plan['worker_count']}")
+        finished = threading.Event()
+        streamer = threading.Thread(target=tester.stream_results, args=(results, worker_index, finished))
+        streamer.start()
+        
+        error = None
+        try:
+            tester.run_engine(end_time, start_time, worker_index, plan['worker_count'])
+        except Exception as e:
+            logger.error(f"Error in remote worker {worker_index}: {str(e)}")
+            error = str(e)
+        finally:
+            finished.set()
+            streamer.join()
+            tester.feeders.close()
+        
+        if error:
+            results.put(('error', worker_index, error))
+        else:
+            results.put(('done', worker_index, None))
+    finally:
+        conn.close()
@@ -0,0 +1,129 @@
+import errno
+import http.client
+import re
+import socket
+import ssl
+
+# Transport errors by class, as (class, exception types, errnos), tried in
+# order on an exception and the exceptions it was raised from
+EXCEPTION_CLASSES = [
+    ('dns', (socket.gaierror,), ()),
+    ('tls', (ssl.SSLError, ssl.CertificateError), ()),
+    ('timeout', (TimeoutError,), (errno.ETIMEDOUT,)),
+    ('connection_refused', (ConnectionRefusedError,), (errno.ECONNREFUSED,)),
+    ('connection_reset', (
+        ConnectionResetError, ConnectionAbortedError, BrokenPipeError, http.client.IncompleteRead
+    ), (errno.ECONNRESET, errno.ECONNABORTED, errno.EPIPE)),
+]
+
+# Exceptions followed from an exception, at most
+MAX_EXCEPTION_CHAIN = 10
+
+# Transport errors by class, as (class, pattern), tried in order on error
+# messages without an exception to go by. The messages come from requests,
+# aiohttp and the browser (e.g. "[Errno 111] Connection refused", "Cannot
+# connect to host ... [Name or service not known]", "Server disconnected").
+ERROR_PATTERNS = [
+    # Journey step errors quote the step's selector, so only their start is matched
+    ('journey_step', re.compile(r'^(?:Error executing step: )?(?:No page loaded|Could not find element|Unknown step type)')),
+    ('dns', re.compile(
+        r'name or service not known|nodename nor servname|name resolution|failed to resolve|getaddrinfo|'
+        r'no address associated|NameResolutionError|ERR_NAME_NOT_RESOLVED', re.IGNORECASE
+    )),
+    ('tls', re.compile(
+        r'\[SSL|SSLError|SSLCertVerification|certificate|handshake|wrong version number|ERR_SSL|ERR_CERT', re.IGNORECASE
+    )),
+    ('timeout', re.compile(r'timed? ?out|timeout|did not load within', re.IGNORECASE)),
+    ('connection_refused', re.compile(
+        r'connection refused|connect call failed|Errno 111|ECONNREFUSED|actively refused|ERR_CONNECTION_REFUSED', re.IGNORECASE
+    )),
+    ('connection_reset', re.compile(
+        r'connection reset|Errno 104|ECONNRESET|server disconnected|RemoteDisconnected|connection aborted|broken pipe|'
+        r'IncompleteRead|ERR_CONNECTION_RESET|ERR_EMPTY_RESPONSE', re.IGNORECASE
+    )),
+]
+
+# URLs and host names in error messages, which may contain anything
+LOCATIONS = re.compile(
+    r'[a-z][a-z0-9+.-]*://[^\s\'"<>]+|'
+    r'\b(?:url|host)(?:=|: ?| )(?:\'[^\']*\'|"[^"]*"|[^\s,)]+)',
+    re.IGNORECASE
+)
+
+# Every class an error can be counted in
+ERROR_CLASSES = [error_class for error_class, pattern in ERROR_PATTERNS] + ['assertion', 'http_4xx', 'http_5xx', 'other']
+
+# Example messages kept per error class, and the length they are cut to
+MAX_ERROR_EXAMPLES = 5
+MAX_ERROR_MESSAGE_LENGTH = 300
+
+# Error messages stored on raw results are cut to this length
+MAX_STORED_ERROR_LENGTH = 1000
+
+# Distinct status codes counted per test (the rest are counted as 'other')
+MAX_STATUS_CODES = 50
+
+def classify_exception(error):
+    """Get the transport error class of an exception raised by an HTTP client (None if it is not one)
+    
+    Clients wrap the socket error that caused a failure in their own
+    exceptions, so the exceptions it was raised from are checked as well.
+    """
+    for cause in iter_causes(error):
+        for error_class, types, errnos in EXCEPTION_CLASSES:
+            if isinstance(cause, types) or (isinstance(cause, OSError) and cause.errno in errnos):
+                return error_class
+    return None
+
+def iter_causes(error):
+    """Yield an exception and the exceptions it was raised from, outermost first"""
+    seen = set()
+    pending = [error]
+    while pending and len(seen) < MAX_EXCEPTION_CHAIN:
+        error = pending.pop(0)
+        if id(error) in seen:
+            continue
+        seen.add(id(error))
+        yield error
+        
+        # urllib3 keeps the cause of a failed retry in reason, aiohttp in os_error
+        linked = [error.__cause__, error.__context__, getattr(error, 'reason', None), getattr(error, 'os_error', None)]
+        linked.extend(error.args)
+        pending.extend(cause for cause in linked if isinstance(cause, BaseException))
+
+def classify_error(result):
+    """Get the class of a failed result: a transport error, a failed assertion or an HTTP error status
+    
+    The class the engine found from the exception (result['error_class'])
+    is used when there is one, otherwise the error message is matched with
+    its URLs and host names left out.
+    """
+    # An assertion's message may quote anything, so it is never matched
+    if result.get('assertion_failures'):
+        return 'assertion'
+    if result.get('error_class'):
+        return result['error_class']
+    
+    error = LOCATIONS.sub('', result.get('error') or '')
+    for error_class, pattern in ERROR_PATTERNS:
+        if pattern.search(error):
+            return error_class
+    
+    status_code = result.get('status_code')
+    if status_code and status_code >= 500:
+        return 'http_5xx'
+    if status_code and status_code >= 400:
+        return 'http_4xx'
+    return 'other'
+
+# Object addresses make otherwise identical messages distinct
+OBJECT_ADDRESS = re.compile(r' at 0x[0-9a-fA-F]+')
+
+def normalize_message(message):
+    """Shorten an error message to an example, without the object addresses requests puts in it"""
+    return truncate_message(OBJECT_ADDRESS.sub('', message))
+
+def truncate_message(message, length=MAX_ERROR_MESSAGE_LENGTH):
+    if message and len(message) > length:
+        return message[:length - 3] + '...'
+    return message
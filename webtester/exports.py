@@ -0,0 +1,172 @@
+import csv
+import json
+import math
+import struct
+import sys
+import zlib
+from array import array
+
+# Exported TestResult columns, as (field, type). Types of the columnar format:
+# f8 is a float (NaN for null), i8 a signed integer (NULL_INT for null),
+# bool a byte (-1 for null), time a float of seconds since the epoch and
+# str a dictionary-encoded string.
+EXPORT_COLUMNS = [
+    ('id', 'i8'),
+    ('timestamp', 'time'),
+    ('virtual_user_id', 'i8'),
+    ('journey_step_id', 'i8'),
+    ('step_type', 'str'),
+    ('url', 'str'),
+    ('success', 'bool'),
+    ('status_code', 'i8'),
+    ('error', 'str'),
+    ('error_class', 'str'),
+    ('response_time', 'f8'),
+    ('wait_time', 'f8'),
+    ('connect_time', 'f8'),
+    ('tls_time', 'f8'),
+    ('ttfb', 'f8'),
+    ('transfer_time', 'f8'),
+    ('connection_reused', 'bool'),
+    ('content_length', 'i8'),
+    ('body_checksum', 'str'),
+    ('dom_content_loaded', 'f8'),
+    ('load_time', 'f8'),
+    ('lcp', 'f8'),
+    ('user_agent', 'str'),
+    ('cookies', 'str'),
+]
+
+# Rows fetched from the database at a time
+EXPORT_CHUNK_SIZE = 2000
+
+# Rows per row group of the columnar format (each group is one chunk of the response)
+ROW_GROUP_SIZE = 20000
+
+COLUMNAR_MAGIC = b'WTCOL1\n'
+COLUMNAR_CONTENT_TYPE = 'application/x-webtester-columnar'
+NULL_INT = -2 ** 63
+
+def iter_result_rows(test):
+    """Yield the raw results of a test as tuples in EXPORT_COLUMNS order, without caching the queryset"""
+    fields = [field for field, column_type in EXPORT_COLUMNS]
+    return test.results.order_by('id').values_list(*fields).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+class Echo:
+    """File-like object whose write() returns the line instead of buffering it"""
+    
+    def write(self, value):
+        return value
+
+def iter_csv(test):
+    """Yield the raw results of a test as CSV, EXPORT_CHUNK_SIZE lines at a time"""
+    writer = csv.writer(Echo())
+    yield writer.writerow([field for field, column_type in EXPORT_COLUMNS])
+    lines = []
+    for row in iter_result_rows(test):
+        lines.append(writer.writerow(row))
+        if len(lines) >= EXPORT_CHUNK_SIZE:
+            yield ''.join(lines)
+            lines = []
+    if lines:
+        yield ''.join(lines)
+
+def encode_column(values, column_type):
+    """Encode one column of a row group (before compression)"""
+    if column_type == 'str':
+        # Dictionary encoding: the distinct values, then a code per row
+        codes = {None: 0}
+        data = array('I', (codes.setdefault(value, len(codes)) for value in values))
+        dictionary = json.dumps(list(codes)).encode('utf-8')
+        return struct.pack('<I', len(dictionary)) + dictionary + to_little_endian(data)
+    if column_type == 'f8':
+        data = array('d', (math.nan if value is None else value for value in values))
+    elif column_type == 'time':
+        data = array('d', (math.nan if value is None else value.timestamp() for value in values))
+    elif column_type == 'bool':
+        data = array('b', (-1 if value is None else int(value) for value in values))
+    else:
+        data = array('q', (NULL_INT if value is None else value for value in values))
+    return to_little_endian(data)
+
+def to_little_endian(data):
+    if sys.byteorder == 'big':
+        data.byteswap()
+    return data.tobytes()
+
+def encode_row_group(rows):
+    """Encode and compress a row group, one column after the other"""
+    parts = [b'RG', struct.pack('<I', len(rows))]
+    for index, (field, column_type) in enumerate(EXPORT_COLUMNS):
+        compressed = zlib.compress(encode_column([row[index] for row in rows], column_type))
+        parts.append(struct.pack('<I', len(compressed)))
+        parts.append(compressed)
+    return b''.join(parts)
+
+def iter_columnar(test, row_group_size=ROW_GROUP_SIZE):
+    """Yield the raw results of a test in the columnar format
+    
+    The format is a magic line, a length-prefixed JSON header describing
+    the columns, then row groups of up to row_group_size rows, each column
+    stored contiguously and compressed with zlib. A row group of zero rows
+    ends the file. Only one row group is held in memory at a time.
+    """
+    header = json.dumps({
+        'test_id': test.pk,
+        'test_name': test.name,
+        'columns': [{'name': field, 'type': column_type} for field, column_type in EXPORT_COLUMNS],
+        'null_int': NULL_INT,
+    }).encode('utf-8')
+    yield COLUMNAR_MAGIC + struct.pack('<I', len(header)) + header
+    
+    rows = []
+    for row in iter_result_rows(test):
+        rows.append(row)
+        if len(rows) >= row_group_size:
+            yield encode_row_group(rows)
+            rows = []
+    if rows:
+        yield encode_row_group(rows)
+    yield b'RG' + struct.pack('<I', 0)
+
+def decode_column(data, column_type):
+    """Decode one column of a row group into a list (nulls become None)"""
+    if column_type == 'str':
+        length = struct.unpack_from('<I', data)[0]
+        dictionary = json.loads(data[4:4 + length])
+        codes = from_little_endian('I', data[4 + length:])
+        return [dictionary[code] for code in codes]
+    if column_type in ('f8', 'time'):
+        return [None if math.isnan(value) else value for value in from_little_endian('d', data)]
+    if column_type == 'bool':
+        return [None if value < 0 else bool(value) for value in from_little_endian('b', data)]
+    return [None if value == NULL_INT else value for value in from_little_endian('q', data)]
+
+def from_little_endian(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+def read_columnar(stream):
+    """Read a columnar export, yielding each row group as a dict of column lists
+    
+    Timestamps are returned as seconds since the epoch. Raises ValueError
+    if the stream is not a columnar export.
+    """
+    if stream.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+        raise ValueError("Not a webtester columnar export")
+    header = json.loads(stream.read(struct.unpack('<I', stream.read(4))[0]))
+    
+    while True:
+        if stream.read(2) != b'RG':
+            raise ValueError("Truncated columnar export")
+        row_count = struct.unpack('<I', stream.read(4))[0]
+        if not row_count:
+            return
+        group = {}
+        for column in header['columns']:
+            length = struct.unpack('<I', stream.read(4))[0]
+            group[column['name']] = decode_column(zlib.decompress(stream.read(length)), column['type'])
+        yield group
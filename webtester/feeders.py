@@ -0,0 +1,195 @@
+import csv
+import io
+import itertools
+import json
+import os
+import random
+import re
+from array import array
+
+# {{ column }} or {{ feeder.column }} placeholders in URLs, headers, bodies and step values
+PLACEHOLDER = re.compile(r'\{\{\s*([\w.-]+)\s*\}\}')
+
+# How the records of a feeder are handed out to the virtual users
+STRATEGIES = ('round_robin', 'random', 'unique')
+
+def render_placeholders(text, values):
+    """Fill the placeholders of a string with feeder values (unknown ones are left as they are)"""
+    if not text or not values or '{{' not in text:
+        return text
+    
+    def replace(match):
+        value = values.get(match.group(1))
+        return match.group(0) if value is None else str(value)
+    
+    return PLACEHOLDER.sub(replace, text)
+
+class Feeder:
+    """Records of a CSV or JSON Lines file, read from disk one at a time
+    
+    Opening a feeder makes a single pass over the file to index where each
+    record starts, so memory use grows with the number of records but not
+    with their size. A CSV record ends at the first line break outside
+    quotes, so quoted fields may span lines. Records are then read with os.pread(), which lets any
+    number of threads share the file without a lock.
+    
+    round_robin hands the records out in file order (starting over at the
+    end), random picks any record, and unique gives every virtual user a
+    record of its own for the whole test.
+    """
+    
+    def __init__(self, name, path, strategy='round_robin'):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown feeder strategy: {strategy}")
+        self.name = name
+        self.path = path
+        self.strategy = strategy
+        self.is_csv = not path.lower().endswith(('.jsonl', '.ndjson', '.json'))
+        self.fields = None
+        self.offsets = array('q')  # Start and end offsets of every record
+        self.fd = None
+        self.counter = itertools.count()
+        self.worker_index = 0
+        self.worker_count = 1
+    
+    def __len__(self):
+        return len(self.offsets) // 2
+    
+    def open(self):
+        """Open the file and index its records"""
+        if self.fd is not None:
+            return self
+        try:
+            self.fd = os.open(self.path, os.O_RDONLY)
+        except OSError as e:
+            raise ValueError(f"Feeder {self.name!r}: cannot open {self.path}: {e.strerror}")
+        
+        offset = 0
+        start = None
+        quotes = 0
+        with open(self.path, 'rb') as data:
+            for line in data:
+                if start is None:
+                    if not line.strip():
+                        offset += len(line)
+                        continue
+                    start = offset
+                offset += len(line)
+                
+                # An odd number of quotes so far leaves a quoted field open ("" escapes count twice)
+                if self.is_csv:
+                    quotes += line.count(b'"')
+                    if quotes % 2:
+                        continue
+                    quotes = 0
+                
+                if self.is_csv and self.fields is None:
+                    data.seek(start)
+                    self.fields = self.parse_csv(data.read(offset - start).decode('utf-8-sig'))
+                    data.seek(offset)
+                else:
+                    self.offsets.append(start)
+                    self.offsets.append(offset)
+                start = None
+        
+        if start is not None:
+            raise ValueError(f"Feeder {self.name!r}: a quoted field is not closed before the end of the file")
+        if not len(self):
+            raise ValueError(f"Feeder {self.name!r} has no records")
+        return self
+    
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+    
+    def set_worker(self, worker_index, worker_count):
+        """Give this process its own share of the round-robin sequence"""
+        self.worker_index = worker_index
+        self.worker_count = worker_count
+    
+    def read(self, index):
+        """Read and parse record number index"""
+        start, end = self.offsets[2 * index], self.offsets[2 * index + 1]
+        line = os.pread(self.fd, end - start, start).decode('utf-8')
+        if self.is_csv:
+            return dict(zip(self.fields, self.parse_csv(line)))
+        
+        record = json.loads(line)
+        if not isinstance(record, dict):
+            raise ValueError(f"Feeder {self.name!r}: JSON Lines records must be objects")
+        return record
+    
+    @staticmethod
+    def parse_csv(text):
+        """Parse one CSV record, which may span lines"""
+        return next(csv.reader(io.StringIO(text, newline='')))
+    
+    def next_record(self, user_id):
+        """Get the record a virtual user should use for its next iteration"""
+        if self.strategy == 'unique':
+            index = user_id
+        elif self.strategy == 'random':
+            index = random.randrange(len(self))
+        else:
+            # Workers interleave so that every process sends different records
+            index = next(self.counter) * self.worker_count + self.worker_index
+        return self.read(index % len(self))
+    
+    def to_dict(self):
+        return {'name': self.name, 'path': self.path, 'strategy': self.strategy}
+
+class FeederSet:
+    """The feeders of a test, providing the placeholder values of each iteration"""
+    
+    def __init__(self, feeders=()):
+        self.feeders = list(feeders)
+    
+    def __bool__(self):
+        return bool(self.feeders)
+    
+    @classmethod
+    def for_test(cls, test):
+        """Open the data feeders of a LoadTest"""
+        return cls(
+            Feeder(feeder.name, feeder.data_file.path, feeder.strategy).open()
+            for feeder in test.feeders.all()
+        )
+    
+    def check_users(self, num_users):
+        """Make sure unique feeders have a record for every virtual user"""
+        for feeder in self.feeders:
+            if feeder.strategy == 'unique' and len(feeder) < num_users:
+                raise ValueError(
+                    f"Feeder {feeder.name!r} has {len(feeder)} records but the test runs {num_users} unique users"
+                )
+    
+    def set_worker(self, worker_index, worker_count):
+        for feeder in self.feeders:
+            feeder.set_worker(worker_index, worker_count)
+    
+    def next_values(self, user_id):
+        """Get the placeholder values for a virtual user's next iteration
+        
+        Every column is available as {{ column }} and as {{ feeder.column }}
+        when several feeders have columns with the same name.
+        """
+        values = {}
+        for feeder in self.feeders:
+            for column, value in feeder.next_record(user_id).items():
+                values.setdefault(column, value)
+                values[f'{feeder.name}.{column}'] = value
+        return values
+    
+    def close(self):
+        for feeder in self.feeders:
+            feeder.close()
+    
+    def to_dict(self):
+        """Serialize the feeders so another process can open the same files"""
+        return {'feeders': [feeder.to_dict() for feeder in self.feeders]}
+    
+    @classmethod
+    def from_dict(cls, data):
+        """Open the feeders described by to_dict() output"""
+        return cls(Feeder(**feeder).open() for feeder in data.get('feeders', []))
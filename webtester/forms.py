@@ -1,12 +1,26 @@
 from django import forms
-from .models import LoadTest, UserJourney, JourneyStep
+from .models import LoadTest, UserJourney, JourneyStep, DataFeeder
 import json
+import math
+import soupsieve
+from .pages import compile_selector
+from .assertions import AssertionSet
+from .thinktime import ThinkTime
+
+def clean_assertions_field(assertions):
+    """Compile assertions to report any invalid one as a validation error"""
+    if assertions:
+        try:
+            AssertionSet.parse(assertions)
+        except ValueError as e:
+            raise forms.ValidationError(f"Invalid assertions: {e}")
+    return assertions
 
 class LoadTestForm(forms.ModelForm):
     """Form for creating and editing load tests"""
     class Meta:
         model = LoadTest
-        fields = ['name', 'target_url', 'journey', 'journeys', 'journey_probability', 'num_users', 'spawn_rate', 'duration', 'http_method', 'headers', 'body']
+        fields = ['name', 'target_url', 'journey', 'journeys', 'journey_probability', 'num_users', 'spawn_rate', 'duration', 'http_method', 'headers', 'body', 'min_wait', 'max_wait', 'wait_distribution', 'wait_samples', 'engine', 'worker_processes', 'remote_workers', 'keep_raw_results', 'load_model', 'arrival_rate', 'arrival_rate_end', 'stages', 'connection_pool', 'pool_size', 'keep_alive', 'body_mode', 'journey_mode', 'browser_pool_size', 'assertions']
         widgets = {
             'name': forms.TextInput(attrs={
                 'class': 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-blue-500 focus:border-blue-500 dark:bg-gray-700 dark:border-gray-600 dark:text-white',
@@ -44,6 +58,80 @@ class LoadTestForm(forms.ModelForm):
             'http_method': forms.Select(attrs={
                 'class': 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-blue-500 focus:border-blue-500 dark:bg-gray-700 dark:border-gray-600 dark:text-white',
             }),
+            'min_wait': forms.NumberInput(attrs={
+                'class': 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-blue-500 focus:border-blue-500 dark:bg-gray-700 dark:border-gray-600 dark:text-white',
+                'min': '0',
+                'step': '0.1'
+            }),
+            'max_wait': forms.NumberInput(attrs={
+                'class': 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-blue-500 focus:border-blue-500 dark:bg-gray-700 dark:border-gray-600 dark:text-white',
+                'min': '0',
+                'step': '0.1'
+            }),
+            'wait_distribution': forms.Select(attrs={
+                'class': 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-blue-500 focus:border-blue-500 dark:bg-gray-700 dark:border-gray-600 dark:text-white',
+            }),
+            'wait_samples': forms.Textarea(attrs={
+                'class': 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-blue-500 focus:border-blue-500 dark:bg-gray-700 dark:border-gray-600 dark:text-white',
+                'rows': '2',
+                'placeholder': '[0.8, 1.2, 2.5, 4.0, 11.3]'
+            }),
+            'engine': forms.Select(attrs={
+                'class': 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-blue-500 focus:border-blue-500 dark:bg-gray-700 dark:border-gray-600 dark:text-white',
+            }),
+            'worker_processes': forms.NumberInput(attrs={
+                'class': 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-blue-500 focus:border-blue-500 dark:bg-gray-700 dark:border-gray-600 dark:text-white',
+                'min': '1',
+            }),
+            'remote_workers': forms.NumberInput(attrs={
+                'class': 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-blue-500 focus:border-blue-500 dark:bg-gray-700 dark:border-gray-600 dark:text-white',
+                'min': '0',
+            }),
+            'keep_raw_results': forms.CheckboxInput(attrs={
+                'class': 'h-4 w-4 text-blue-600 focus:ring-blue-500 border-gray-300 rounded dark:bg-gray-700 dark:border-gray-600'
+            }),
+            'load_model': forms.Select(attrs={
+                'class': 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-blue-500 focus:border-blue-500 dark:bg-gray-700 dark:border-gray-600 dark:text-white',
+            }),
+            'arrival_rate': forms.NumberInput(attrs={
+                'class': 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-blue-500 focus:border-blue-500 dark:bg-gray-700 dark:border-gray-600 dark:text-white',
+                'min': '0',
+                'step': '0.1',
+                'placeholder': 'Arrivals per second'
+            }),
+            'arrival_rate_end': forms.NumberInput(attrs={
+                'class': 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-blue-500 focus:border-blue-500 dark:bg-gray-700 dark:border-gray-600 dark:text-white',
+                'min': '0',
+                'step': '0.1',
+                'placeholder': 'Same as start rate'
+            }),
+            'connection_pool': forms.Select(attrs={
+                'class': 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-blue-500 focus:border-blue-500 dark:bg-gray-700 dark:border-gray-600 dark:text-white',
+            }),
+            'pool_size': forms.NumberInput(attrs={
+                'class': 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-blue-500 focus:border-blue-500 dark:bg-gray-700 dark:border-gray-600 dark:text-white',
+                'min': '1',
+                'placeholder': 'Automatic'
+            }),
+            'body_mode': forms.Select(attrs={
+                'class': 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-blue-500 focus:border-blue-500 dark:bg-gray-700 dark:border-gray-600 dark:text-white',
+            }),
+            'journey_mode': forms.Select(attrs={
+                'class': 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-blue-500 focus:border-blue-500 dark:bg-gray-700 dark:border-gray-600 dark:text-white',
+            }),
+            'browser_pool_size': forms.NumberInput(attrs={
+                'class': 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-blue-500 focus:border-blue-500 dark:bg-gray-700 dark:border-gray-600 dark:text-white',
+                'min': '1',
+                'placeholder': 'Fit available memory'
+            }),
+            'keep_alive': forms.CheckboxInput(attrs={
+                'class': 'h-4 w-4 text-blue-600 focus:ring-blue-500 border-gray-300 rounded dark:bg-gray-700 dark:border-gray-600'
+            }),
+            'stages': forms.Textarea(attrs={
+                'class': 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-blue-500 focus:border-blue-500 dark:bg-gray-700 dark:border-gray-600 dark:text-white',
+                'rows': '3',
+                'placeholder': '[{"duration": 30, "target": 50}, {"duration": 60, "target": 50}, {"duration": 30, "target": 0}]'
+            }),
             'headers': forms.Textarea(attrs={
                 'class': 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-blue-500 focus:border-blue-500 dark:bg-gray-700 dark:border-gray-600 dark:text-white',
                 'rows': '3',
@@ -54,6 +142,11 @@ class LoadTestForm(forms.ModelForm):
                 'rows': '3',
                 'placeholder': 'Enter request body'
             }),
+            'assertions': forms.Textarea(attrs={
+                'class': 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-blue-500 focus:border-blue-500 dark:bg-gray-700 dark:border-gray-600 dark:text-white',
+                'rows': '3',
+                'placeholder': '[{"type": "status", "value": [200]}, {"type": "json_path", "path": "$.ok", "value": true}]'
+            }),
         }
     
     def clean_headers(self):
@@ -66,6 +159,10 @@ class LoadTestForm(forms.ModelForm):
                 raise forms.ValidationError("Headers must be valid JSON")
         return headers
     
+    def clean_assertions(self):
+        """Validate that assertions are a JSON list of valid checks"""
+        return clean_assertions_field(self.cleaned_data.get('assertions'))
+    
     def clean_body(self):
         """Validate that body is valid JSON for POST/PUT requests"""
         body = self.cleaned_data.get('body')
@@ -79,6 +176,27 @@ class LoadTestForm(forms.ModelForm):
         
         return body
     
+    def clean_stages(self):
+        """Validate that stages are a JSON list of durations and targets"""
+        stages = self.cleaned_data.get('stages')
+        if stages:
+            try:
+                parsed = json.loads(stages)
+            except json.JSONDecodeError:
+                raise forms.ValidationError("Stages must be valid JSON")
+            
+            if not isinstance(parsed, list) or not parsed:
+                raise forms.ValidationError("Stages must be a non-empty list")
+            for stage in parsed:
+                try:
+                    duration = float(stage['duration'])
+                    target = float(stage['target'])
+                except (KeyError, TypeError, ValueError):
+                    raise forms.ValidationError('Every stage needs a numeric "duration" and "target"')
+                if duration < 0 or target < 0:
+                    raise forms.ValidationError("Stage durations and targets cannot be negative")
+        return stages
+    
     def clean(self):
         """Validate that either target_url or journey/journeys is provided"""
         cleaned_data = super().clean()
@@ -89,13 +207,42 @@ class LoadTestForm(forms.ModelForm):
         if not target_url and not journey and not journeys:
             raise forms.ValidationError("Either Target URL or at least one User Journey must be provided")
         
+        # The think time between simple requests must be drawable before the test can run
+        min_wait = cleaned_data.get('min_wait')
+        max_wait = cleaned_data.get('max_wait')
+        if min_wait is not None and max_wait is not None:
+            try:
+                ThinkTime.parse(cleaned_data.get('wait_distribution'), min_wait, max_wait, cleaned_data.get('wait_samples'))
+            except ValueError as e:
+                field = 'wait_samples' if cleaned_data.get('wait_distribution') == 'replay' else 'wait_distribution'
+                self.add_error(field, str(e))
+        
+        # Browsers are driven from threads, one leased browser per journey
+        if cleaned_data.get('journey_mode') == 'browser':
+            if cleaned_data.get('engine') == 'async':
+                self.add_error('journey_mode', "Browser journeys run on the thread engine")
+            if not journey and not journeys:
+                self.add_error('journey_mode', "Browser mode needs at least one User Journey")
+        
+        # Stages decide the duration (and the peak number of users in the closed model)
+        stages = cleaned_data.get('stages')
+        if stages:
+            parsed = json.loads(stages)
+            cleaned_data['duration'] = max(1, math.ceil(sum(float(stage['duration']) for stage in parsed)))
+            if cleaned_data.get('load_model') != 'open':
+                cleaned_data['num_users'] = max(1, math.ceil(max(float(stage['target']) for stage in parsed)))
+        
+        # The open model needs a rate to schedule arrivals at
+        elif cleaned_data.get('load_model') == 'open' and (cleaned_data.get('arrival_rate') or 0) <= 0:
+            self.add_error('arrival_rate', "A positive arrival rate is required for the open load model")
+        
         return cleaned_data
 
 class UserJourneyForm(forms.ModelForm):
     """Form for creating and editing user journeys"""
     class Meta:
         model = UserJourney
-        fields = ['name', 'description', 'base_url']
+        fields = ['name', 'description', 'base_url', 'weight', 'pacing']
         widgets = {
             'name': forms.TextInput(attrs={
                 'class': 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-blue-500 focus:border-blue-500 dark:bg-gray-700 dark:border-gray-600 dark:text-white',
@@ -110,13 +257,23 @@ class UserJourneyForm(forms.ModelForm):
                 'class': 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-blue-500 focus:border-blue-500 dark:bg-gray-700 dark:border-gray-600 dark:text-white',
                 'placeholder': 'https://example.com'
             }),
+            'weight': forms.NumberInput(attrs={
+                'class': 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-blue-500 focus:border-blue-500 dark:bg-gray-700 dark:border-gray-600 dark:text-white',
+                'min': '0',
+            }),
+            'pacing': forms.NumberInput(attrs={
+                'class': 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-blue-500 focus:border-blue-500 dark:bg-gray-700 dark:border-gray-600 dark:text-white',
+                'min': '0',
+                'step': '0.1',
+                'placeholder': 'No pacing'
+            }),
         }
 
 class JourneyStepForm(forms.ModelForm):
     """Form for creating and editing journey steps"""
     class Meta:
         model = JourneyStep
-        fields = ['step_type', 'order', 'url', 'selector', 'value', 'min_wait', 'max_wait']
+        fields = ['step_type', 'order', 'url', 'selector', 'value', 'min_wait', 'max_wait', 'wait_distribution', 'wait_samples', 'assertions']
         widgets = {
             'step_type': forms.Select(attrs={
                 'class': 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-blue-500 focus:border-blue-500 dark:bg-gray-700 dark:border-gray-600 dark:text-white',
@@ -147,8 +304,35 @@ class JourneyStepForm(forms.ModelForm):
                 'min': '0',
                 'step': '0.1'
             }),
+            'wait_distribution': forms.Select(attrs={
+                'class': 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-blue-500 focus:border-blue-500 dark:bg-gray-700 dark:border-gray-600 dark:text-white',
+            }),
+            'wait_samples': forms.Textarea(attrs={
+                'class': 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-blue-500 focus:border-blue-500 dark:bg-gray-700 dark:border-gray-600 dark:text-white',
+                'rows': '2',
+                'placeholder': '[0.8, 1.2, 2.5, 4.0, 11.3]'
+            }),
+            'assertions': forms.Textarea(attrs={
+                'class': 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-blue-500 focus:border-blue-500 dark:bg-gray-700 dark:border-gray-600 dark:text-white',
+                'rows': '3',
+                'placeholder': '[{"type": "status", "value": [200]}, {"type": "json_path", "path": "$.ok", "value": true}]'
+            }),
         }
     
+    def clean_selector(self):
+        """Validate that the selector is a valid CSS selector"""
+        selector = self.cleaned_data.get('selector')
+        if selector:
+            try:
+                compile_selector(selector)
+            except soupsieve.SelectorSyntaxError as e:
+                raise forms.ValidationError(f"Invalid CSS selector: {e}")
+        return selector
+    
+    def clean_assertions(self):
+        """Validate that assertions are a JSON list of valid checks"""
+        return clean_assertions_field(self.cleaned_data.get('assertions'))
+    
     def clean(self):
         """Validate that the appropriate fields are filled based on step type"""
         cleaned_data = super().clean()
@@ -166,8 +350,53 @@ class JourneyStepForm(forms.ModelForm):
         if step_type == 'input' and not value:
             self.add_error('value', "Value is required for input step type")
         
+        # The think time must be drawable before the step can run
+        min_wait = cleaned_data.get('min_wait')
+        max_wait = cleaned_data.get('max_wait')
+        if min_wait is not None and max_wait is not None:
+            try:
+                ThinkTime.parse(cleaned_data.get('wait_distribution'), min_wait, max_wait, cleaned_data.get('wait_samples'))
+            except ValueError as e:
+                field = 'wait_samples' if cleaned_data.get('wait_distribution') == 'replay' else 'wait_distribution'
+                self.add_error(field, str(e))
+        
         return cleaned_data
     
+class DataFeederForm(forms.ModelForm):
+    """Form for uploading a data feeder to a load test"""
+    class Meta:
+        model = DataFeeder
+        fields = ['name', 'data_file', 'strategy']
+        widgets = {
+            'name': forms.TextInput(attrs={
+                'class': 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-blue-500 focus:border-blue-500 dark:bg-gray-700 dark:border-gray-600 dark:text-white',
+                'placeholder': 'users'
+            }),
+            'data_file': forms.ClearableFileInput(attrs={
+                'class': 'w-full text-sm text-gray-700 dark:text-gray-300',
+                'accept': '.csv,.jsonl,.ndjson'
+            }),
+            'strategy': forms.Select(attrs={
+                'class': 'w-full px-3 py-2 border border-gray-300 rounded-md shadow-sm focus:outline-none focus:ring-blue-500 focus:border-blue-500 dark:bg-gray-700 dark:border-gray-600 dark:text-white',
+            }),
+        }
+    
+    def __init__(self, *args, test=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.test = test
+    
+    def clean_name(self):
+        name = self.cleaned_data.get('name')
+        if self.test and self.test.feeders.filter(name=name).exists():
+            raise forms.ValidationError("This test already has a feeder with this name")
+        return name
+    
+    def clean_data_file(self):
+        data_file = self.cleaned_data.get('data_file')
+        if data_file and not data_file.name.lower().endswith(('.csv', '.jsonl', '.ndjson')):
+            raise forms.ValidationError("Upload a .csv or .jsonl file")
+        return data_file
+
 class PublicTemplateForm(forms.ModelForm):
     """Form for making a test a public template"""
     class Meta:
@@ -0,0 +1,499 @@
+import gzip
+import json
+import math
+import re
+from datetime import datetime
+from urllib.parse import parse_qsl, urlsplit
+from django.db import transaction
+from .metrics import LatencyHistogram
+
+# Requests for these are made by the browser while rendering a page, not by
+# the user, so they are left out of journeys unless asked for
+STATIC_EXTENSIONS = frozenset([
+    '.css', '.js', '.mjs', '.map', '.png', '.jpg', '.jpeg', '.gif', '.webp', '.avif', '.svg', '.ico',
+    '.woff', '.woff2', '.ttf', '.otf', '.eot', '.mp4', '.webm', '.mp3', '.wav',
+])
+
+# HAR resource types (Chrome's _resourceType) that are user actions
+HAR_PAGE_TYPES = frozenset(['document', 'xhr', 'fetch'])
+
+# nginx/Apache common and combined log formats
+ACCESS_LOG_LINE = re.compile(
+    r'(?P<client>\S+) \S+ \S+ \[(?P<time>[^\]]+)\] "(?P<method>[A-Z]+) (?P<url>\S+)[^"]*" (?P<status>\d{3}) \S+'
+    r'(?: "(?P<referer>[^"]*)" "(?P<agent>[^"]*)")?'
+)
+ACCESS_LOG_TIME = '%d/%b/%Y:%H:%M:%S %z'
+
+HAR_ENTRIES = re.compile(r'"entries"\s*:\s*\[')
+HAR_CHUNK_SIZE = 1 << 20
+
+# Path segments that are identifiers (numbers, UUIDs, long hex strings),
+# replaced so that /orders/17 and /orders/42 are the same step
+ID_SEGMENT = re.compile(r'^(\d+|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|[0-9a-f]{16,})$', re.IGNORECASE)
+
+# A client's session ends after this many seconds without a request
+SESSION_TIMEOUT = 1800
+
+# Longer sessions are cut, so that one crawler cannot make a huge journey
+MAX_SESSION_STEPS = 50
+
+# Distinct journey shapes kept while reading; past this, the rarest are dropped
+MAX_SIGNATURES = 100000
+
+# How often (in requests) sessions idle for longer than the timeout are closed
+SWEEP_INTERVAL = 10000
+
+# Percentiles of the measured think times used as a step's wait range
+THINK_TIME_PERCENTILES = (10, 90)
+
+# Quantiles of the measured think times a step replays (evenly spaced)
+REPLAY_QUANTILES = 20
+
+# Methods of the requests replayed as journey steps. Logs and HAR exports
+# do not keep request bodies, and other requests are often XHR calls no
+# form on the page would make, so they are left out of imported journeys.
+REPLAYED_METHODS = frozenset(['GET'])
+
+# Distinct requests left out of a journey that are listed in its description
+MAX_SKIPPED_REQUESTS = 10
+
+def open_log(path):
+    """Open a log or HAR file as text, decompressing .gz files on the fly"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+    return open(path, 'r', encoding='utf-8', errors='replace')
+
+def detect_format(path):
+    """Guess whether a file is a HAR file or an access log from its first bytes"""
+    with open_log(path) as stream:
+        start = stream.read(1024).lstrip()
+    return 'har' if start.startswith('{') else 'access'
+
+def is_static(url):
+    path = urlsplit(url).path.lower()
+    return any(path.endswith(extension) for extension in STATIC_EXTENSIONS)
+
+def normalize_url(url):
+    """Get the shape of a URL: identifiers replaced and only the names of query parameters kept"""
+    split = urlsplit(url)
+    path = '/'.join('{id}' if ID_SEGMENT.match(segment) else segment for segment in split.path.split('/'))
+    if split.query:
+        path += '?' + '&'.join(sorted(set(f'{name}=' for name, value in parse_qsl(split.query, keep_blank_values=True))))
+    if split.netloc:
+        return f'{split.scheme}://{split.netloc}{path}'
+    return path
+
+class ImportStats:
+    """Counts of what an import read, skipped and kept"""
+    
+    def __init__(self):
+        self.lines = 0
+        self.requests = 0
+        self.unparsed = 0
+        self.static = 0
+        self.errors = 0
+        self.sessions = 0
+        self.truncated_sessions = 0
+        self.pruned_sessions = 0
+        self.unreplayed_sessions = 0
+    
+    def to_dict(self):
+        return dict(self.__dict__)
+
+def iter_access_log(lines, stats, include_static=False):
+    """Yield (client, timestamp, method, url) for each request of an access log
+    
+    Clients are told apart by address and user agent. Requests that failed
+    (4xx/5xx) are skipped, as are static files unless include_static.
+    """
+    last_time = timestamp = None
+    for line in lines:
+        stats.lines += 1
+        match = ACCESS_LOG_LINE.match(line)
+        if not match:
+            stats.unparsed += 1
+            continue
+        
+        # Consecutive lines mostly share the same second, parse it once
+        if match.group('time') != last_time:
+            try:
+                timestamp = datetime.strptime(match.group('time'), ACCESS_LOG_TIME).timestamp()
+            except ValueError:
+                stats.unparsed += 1
+                continue
+            last_time = match.group('time')
+        
+        url = match.group('url')
+        if int(match.group('status')) >= 400:
+            stats.errors += 1
+        elif not include_static and is_static(url):
+            stats.static += 1
+        else:
+            stats.requests += 1
+            yield (match.group('client'), match.group('agent') or ''), timestamp, match.group('method'), url
+
+def iter_har_entries(stream, chunk_size=HAR_CHUNK_SIZE):
+    """Yield the entries of a HAR file one at a time without loading the whole file
+    
+    Only the log.entries array is decoded. The file is read in chunks and
+    each entry is decoded as soon as it is complete, so memory holds one
+    entry (and one chunk) at a time. Raises ValueError for a file without
+    entries or one that ends in the middle of an entry.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    while True:
+        match = HAR_ENTRIES.search(buffer)
+        if match:
+            buffer = buffer[match.end():]
+            break
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            raise ValueError("No log.entries array found in the HAR file")
+        # Keep a tail in case the key is split across two chunks
+        buffer = buffer[-32:] + chunk
+    
+    position = 0
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        if position < len(buffer):
+            try:
+                entry, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                pass
+            else:
+                yield entry
+                # Drop the entries already decoded
+                if position >= chunk_size:
+                    buffer = buffer[position:]
+                    position = 0
+                continue
+        
+        # The next entry is incomplete: read more, at least as much as is
+        # buffered so that a very large entry is not decoded over and over
+        chunk = stream.read(max(chunk_size, len(buffer) - position))
+        if not chunk:
+            raise ValueError("The HAR file ends in the middle of an entry")
+        buffer = buffer[position:] + chunk
+        position = 0
+
+def iter_har(stream, stats, include_static=False, client='har'):
+    """Yield (client, timestamp, method, url) for each user request of a HAR file
+    
+    A HAR file records one browser, so all of its requests belong to one
+    client (name each file's client differently). Resources the browser loads by itself are skipped unless
+    include_static, using Chrome's resource type when it is recorded.
+    """
+    for entry in iter_har_entries(stream):
+        stats.lines += 1
+        try:
+            request = entry['request']
+            url = request['url']
+            method = request['method'].upper()
+            timestamp = datetime.fromisoformat(entry['startedDateTime'].replace('Z', '+00:00')).timestamp()
+            status = entry.get('response', {}).get('status') or 0
+        except (KeyError, TypeError, AttributeError, ValueError):
+            stats.unparsed += 1
+            continue
+        
+        resource_type = entry.get('_resourceType')
+        if not url.startswith(('http://', 'https://')):
+            stats.unparsed += 1
+        elif status >= 400 or status <= 0:
+            stats.errors += 1
+        elif not include_static and (resource_type not in HAR_PAGE_TYPES if resource_type else is_static(url)):
+            stats.static += 1
+        else:
+            stats.requests += 1
+            yield client, timestamp, method, url
+
+class OpenSession:
+    """Requests of a client's session that has not ended yet"""
+    
+    def __init__(self):
+        self.requests = []
+        self.last_seen = None
+        self.truncated = False
+
+def iter_sessions(requests, stats, timeout=SESSION_TIMEOUT, max_steps=MAX_SESSION_STEPS):
+    """Group requests into sessions, yielding each session's [(timestamp, method, url)] once it ends
+    
+    A client's session ends after timeout seconds without a request. Only
+    the open sessions are kept in memory: sessions idle for longer than
+    the timeout are closed every SWEEP_INTERVAL requests. Requests are
+    expected in roughly chronological order, as logs are written.
+    """
+    open_sessions = {}
+    latest = None
+    for count, (client, timestamp, method, url) in enumerate(requests, 1):
+        session = open_sessions.get(client)
+        if session is not None and timestamp - session.last_seen > timeout:
+            del open_sessions[client]
+            stats.sessions += 1
+            yield session.requests
+            session = None
+        if session is None:
+            session = open_sessions[client] = OpenSession()
+        session.last_seen = timestamp if session.last_seen is None else max(session.last_seen, timestamp)
+        
+        if len(session.requests) < max_steps:
+            session.requests.append((timestamp, method, url))
+        elif not session.truncated:
+            session.truncated = True
+            stats.truncated_sessions += 1
+        
+        latest = timestamp if latest is None else max(latest, timestamp)
+        if count % SWEEP_INTERVAL == 0:
+            for client in [client for client, session in open_sessions.items() if latest - session.last_seen > timeout]:
+                stats.sessions += 1
+                yield open_sessions.pop(client).requests
+    
+    for session in open_sessions.values():
+        stats.sessions += 1
+        yield session.requests
+
+class JourneyCluster:
+    """Sessions that made the same sequence of replayed requests, with their measured think times
+    
+    Requests that are not replayed (see REPLAYED_METHODS) do not take part
+    in the shape, they are only counted by method and path shape.
+    """
+    
+    def __init__(self, signature, session):
+        self.signature = signature
+        self.count = 0
+        # The first session's URLs are replayed, the shapes only group sessions
+        self.urls = [url for timestamp, method, url in session]
+        self.think_times = [LatencyHistogram() for _ in session]
+        self.skipped = {}  # (method, path shape) -> requests left out
+    
+    def add(self, session, skipped=()):
+        self.count += 1
+        previous = None
+        for index, (timestamp, method, url) in enumerate(session):
+            if previous is not None:
+                self.think_times[index].add(max(0.0, timestamp - previous))
+            previous = timestamp
+        
+        for timestamp, method, url in skipped:
+            key = (method, urlsplit(normalize_url(url)).path or '/')
+            if key in self.skipped or len(self.skipped) < MAX_SKIPPED_REQUESTS:
+                self.skipped[key] = self.skipped.get(key, 0) + 1
+    
+    def get_wait_range(self, index):
+        """Get the (min_wait, max_wait) of a step from the think times measured before it"""
+        histogram = self.think_times[index]
+        if not histogram.total:
+            return 0.0, 0.0
+        low, high = THINK_TIME_PERCENTILES
+        return round(histogram.percentile(low), 3), round(histogram.percentile(high), 3)
+    
+    def get_wait_samples(self, index):
+        """Get evenly spaced quantiles of the think times measured before a step, to replay them (None without any)"""
+        histogram = self.think_times[index]
+        if not histogram.total:
+            return None
+        return [
+            round(histogram.percentile((quantile + 0.5) * 100 / REPLAY_QUANTILES), 3)
+            for quantile in range(REPLAY_QUANTILES)
+        ]
+
+class TrafficImport:
+    """Streams requests into sessions, clusters the sessions and records when they start
+    
+    Memory depends on the number of open sessions and distinct journey
+    shapes, never on the size of the input. When more than max_signatures
+    shapes are kept, the ones seen least are dropped (and counted in
+    stats.pruned_sessions), so rare shapes may be undercounted.
+    """
+    
+    def __init__(self, stage_seconds=60, max_signatures=MAX_SIGNATURES):
+        self.stats = ImportStats()
+        self.stage_seconds = stage_seconds
+        self.max_signatures = max_signatures
+        self.clusters = {}
+        self.session_starts = {}  # Stage index -> sessions started in it
+        self.started_at = None
+        self.origins = {}  # Origin of absolute URLs -> requests
+    
+    def add_session(self, session):
+        if not session:
+            return
+        
+        # Time around requests that are not replayed counts as thinking before the next page
+        replayed = [request for request in session if request[1] in REPLAYED_METHODS]
+        if not replayed:
+            self.stats.unreplayed_sessions += 1
+            return
+        skipped = [request for request in session if request[1] not in REPLAYED_METHODS]
+        
+        signature = tuple((method, normalize_url(url)) for timestamp, method, url in replayed)
+        cluster = self.clusters.get(signature)
+        if cluster is None:
+            if len(self.clusters) >= self.max_signatures:
+                self.prune()
+            cluster = self.clusters[signature] = JourneyCluster(signature, replayed)
+        cluster.add(replayed, skipped)
+        
+        start = session[0][0]
+        if self.started_at is None or start < self.started_at:
+            # Sessions are closed roughly in order, move earlier ones to the new first stage
+            self.shift_stages(start)
+        stage = int((start - self.started_at) // self.stage_seconds)
+        self.session_starts[stage] = self.session_starts.get(stage, 0) + 1
+        
+        for timestamp, method, url in session:
+            split = urlsplit(url)
+            if split.netloc:
+                origin = f'{split.scheme}://{split.netloc}'
+                self.origins[origin] = self.origins.get(origin, 0) + 1
+    
+    def shift_stages(self, start):
+        if self.started_at is not None:
+            offset = int((self.started_at - start) // self.stage_seconds) + 1
+            self.session_starts = {stage + offset: count for stage, count in self.session_starts.items()}
+            start = self.started_at - offset * self.stage_seconds
+        self.started_at = start
+    
+    def prune(self):
+        """Drop the least seen half of the journey shapes"""
+        counts = sorted(cluster.count for cluster in self.clusters.values())
+        threshold = counts[len(counts) // 2]
+        for signature in [signature for signature, cluster in self.clusters.items() if cluster.count <= threshold]:
+            self.stats.pruned_sessions += self.clusters.pop(signature).count
+    
+    def read(self, requests, session_timeout=SESSION_TIMEOUT, max_steps=MAX_SESSION_STEPS):
+        """Consume (client, timestamp, method, url) requests"""
+        for session in iter_sessions(requests, self.stats, session_timeout, max_steps):
+            self.add_session(session)
+        return self
+    
+    def get_base_url(self):
+        """Get the origin most requests went to (None for relative URLs only, as in access logs)"""
+        if not self.origins:
+            return None
+        return max(self.origins, key=self.origins.get) + '/'
+    
+    def top_clusters(self, max_journeys=20, min_sessions=1):
+        """Get the most common journey shapes, most common first"""
+        clusters = [cluster for cluster in self.clusters.values() if cluster.count >= min_sessions]
+        clusters.sort(key=lambda cluster: cluster.count, reverse=True)
+        return clusters[:max_journeys]
+    
+    def get_mean_session_duration(self):
+        """Get the mean time from the first to the last request of the clustered sessions"""
+        total = sum(cluster.count for cluster in self.clusters.values())
+        if not total:
+            return 0.0
+        return sum(
+            cluster.count * sum(histogram.mean() for histogram in cluster.think_times if histogram.total)
+            for cluster in self.clusters.values()
+        ) / total
+    
+    def get_stages(self, time_scale=1.0):
+        """Get the session start rate over time as open model load stages
+        
+        Each stage ramps to the sessions started per second in one
+        stage_seconds window. time_scale shortens (below 1) or stretches
+        the replay; the rates are scaled so the same sessions are started.
+        Think times are not scaled, so a shortened replay runs more sessions
+        at once than the recording did.
+        """
+        if not self.session_starts:
+            return []
+        duration = max(1, round(self.stage_seconds * time_scale))
+        return [
+            {'duration': duration, 'target': round(self.session_starts.get(stage, 0) / duration, 3)}
+            for stage in range(max(self.session_starts) + 1)
+        ]
+
+def relative_url(url, base_url):
+    """Make a URL relative to the base URL when it is on the same origin"""
+    if base_url and url.startswith(base_url.rstrip('/') + '/'):
+        return url[len(base_url.rstrip('/')):]
+    return url
+
+def describe_cluster(cluster):
+    paths = [normalize_url(url).split('?')[0] for url in cluster.urls]
+    paths = [urlsplit(path).path or '/' for path in paths]
+    if len(paths) == 1:
+        return paths[0]
+    return f"{paths[0]} -> {paths[-1]} ({len(paths)} steps)"
+
+def describe_skipped(cluster):
+    """Describe the requests left out of a cluster's journey, most common first"""
+    return ', '.join(
+        f"{method} {path} (x{count})"
+        for (method, path), count in sorted(cluster.skipped.items(), key=lambda item: -item[1])
+    )
+
+def create_journeys(traffic, user, base_url, max_journeys=20, min_sessions=1, name_prefix='Imported'):
+    """Create a weighted UserJourney (and its steps) for each of the most common session shapes
+    
+    GET requests become navigate steps waiting the measured think time.
+    Other requests are left out (see REPLAYED_METHODS) and listed in the
+    journey description.
+    """
+    from .models import JourneyStep, UserJourney
+    journeys = []
+    with transaction.atomic():
+        for cluster in traffic.top_clusters(max_journeys, min_sessions):
+            description = f"Imported from {cluster.count} recorded sessions"
+            if cluster.skipped:
+                description += f". Not replayed, as their bodies were not recorded: {describe_skipped(cluster)}"
+            
+            journey = UserJourney.objects.create(
+                name=f"{name_prefix} #{len(journeys) + 1}: {describe_cluster(cluster)}"[:100],
+                description=description,
+                base_url=base_url,
+                weight=cluster.count,
+                created_by=user,
+            )
+            steps = []
+            for index, url in enumerate(cluster.urls):
+                min_wait, max_wait = cluster.get_wait_range(index)
+                step = JourneyStep(step_type='navigate', url=relative_url(url, base_url))
+                step.journey = journey
+                step.order = index + 1
+                step.min_wait = min_wait
+                step.max_wait = max_wait
+                
+                # Replay the measured think times, long tail included
+                samples = cluster.get_wait_samples(index)
+                if samples:
+                    step.wait_distribution = 'replay'
+                    step.wait_samples = json.dumps(samples)
+                steps.append(step)
+            JourneyStep.objects.bulk_create(steps)
+            journeys.append(journey)
+    return journeys
+
+def create_replay_test(traffic, journeys, user, name, time_scale=1.0, engine='async', num_users=None):
+    """Create an open model LoadTest starting the imported journeys at the recorded session rate
+    
+    Without num_users, the test gets enough virtual users for the peak rate
+    times the mean session duration, with some headroom.
+    """
+    from .models import LoadTest
+    stages = traffic.get_stages(time_scale)
+    peak_rate = max((stage['target'] for stage in stages), default=0)
+    if not num_users:
+        num_users = max(10, math.ceil(peak_rate * max(1.0, traffic.get_mean_session_duration()) * 1.5))
+    base_url = journeys[0].base_url if journeys else None
+    test = LoadTest.objects.create(
+        name=name[:100],
+        target_url=base_url,
+        num_users=num_users,
+        duration=sum(stage['duration'] for stage in stages) or 60,
+        engine=engine,
+        load_model='open',
+        arrival_rate=stages[0]['target'] if stages else 1,
+        stages=json.dumps(stages),
+        journey_probability=1.0,
+        created_by=user,
+    )
+    test.journeys.set(journeys)
+    return test
@@ -0,0 +1,216 @@
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+from urllib.parse import urlparse
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+from .models import LoadTest, TestJob
+from .utils import LoadTester
+
+logger = logging.getLogger(__name__)
+
+def get_max_jobs_per_host():
+    return getattr(settings, 'WEBTESTER_MAX_JOBS_PER_HOST', 1)
+
+def get_heartbeat_interval():
+    return getattr(settings, 'WEBTESTER_JOB_HEARTBEAT_INTERVAL', 5)
+
+def get_stale_after():
+    return getattr(settings, 'WEBTESTER_JOB_STALE_AFTER', 60)
+
+def get_runner_name():
+    """Name a runner process after its host and pid"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def get_target_host(test):
+    """Get the host a test sends its load to (a journey's base URL when there is no target URL)"""
+    url = test.target_url
+    if not url:
+        journey = test.journeys.exclude(base_url='').first() or test.journey
+        url = journey.base_url if journey else ''
+    return urlparse(url or '').netloc.lower()
+
+def enqueue_test(test, user=None):
+    """Queue a test for a runner; raises ValueError if it is already queued or running"""
+    with transaction.atomic():
+        # Lock the test row so two clicks cannot queue it twice
+        test = LoadTest.objects.select_for_update().get(pk=test.pk)
+        if test.status == 'running' or test.jobs.filter(status__in=TestJob.ACTIVE_STATUSES).exists():
+            raise ValueError(f"Test '{test.name}' is already queued or running")
+        return TestJob.objects.create(test=test, target_host=get_target_host(test), requested_by=user)
+
+def cancel_job(job):
+    """Cancel a queued job, or ask the runner executing a running job to stop it"""
+    if TestJob.objects.filter(pk=job.pk, status='queued').update(status='cancelled', finished_at=timezone.now()):
+        job.status = 'cancelled'
+        return job
+    TestJob.objects.filter(pk=job.pk, status='running').update(cancel_requested=True)
+    job.refresh_from_db()
+    return job
+
+def claim_next_job(runner_name, max_per_host=None):
+    """Claim the oldest queued job whose host is below the concurrency limit (None if there is none)
+    
+    Claiming is a conditional update from queued to running, so two runners
+    polling at the same time never execute the same job. Two runners can
+    still claim different jobs for the same host at once; the later claim
+    then gives its job back to the queue.
+    """
+    if max_per_host is None:
+        max_per_host = get_max_jobs_per_host()
+    running = TestJob.objects.filter(status='running').values('target_host').annotate(count=Count('pk'))
+    busy_hosts = [row['target_host'] for row in running if row['count'] >= max_per_host]
+    
+    for job in TestJob.objects.filter(status='queued').exclude(target_host__in=busy_hosts).select_related('test'):
+        now = timezone.now()
+        claimed = TestJob.objects.filter(pk=job.pk, status='queued').update(
+            status='running', runner=runner_name, started_at=now, heartbeat_at=now
+        )
+        if not claimed:
+            continue
+        
+        # Keep the job only if it is among the first max_per_host running on its host
+        first = TestJob.objects.filter(status='running', target_host=job.target_host).order_by('started_at', 'pk')
+        if job.pk not in first.values_list('pk', flat=True)[:max_per_host]:
+            TestJob.objects.filter(pk=job.pk, status='running').update(
+                status='queued', runner='', started_at=None, heartbeat_at=None
+            )
+            continue
+        
+        job.refresh_from_db()
+        return job
+    return None
+
+def recover_orphaned_jobs(stale_after=None):
+    """Fail jobs and tests left running by a runner or web worker that died
+    
+    A running job is orphaned when its runner has not sent a heartbeat for
+    stale_after seconds. A running test without a running job (e.g. started
+    in a web worker that was recycled) is orphaned once it has run stale_after
+    seconds longer than planned. Returns the number of tests failed.
+    """
+    if stale_after is None:
+        stale_after = get_stale_after()
+    now = timezone.now()
+    recovered = 0
+    
+    for job in TestJob.objects.filter(status='running', heartbeat_at__lt=now - timedelta(seconds=stale_after)).select_related('test'):
+        error = f"Runner {job.runner} stopped sending heartbeats"
+        if not TestJob.objects.filter(pk=job.pk, status='running').update(status='failed', error=error, finished_at=now):
+            continue
+        logger.warning(f"Recovering orphaned job {job.pk} of test {job.test_id}: {error}")
+        if job.test.status == 'running':
+            job.test.fail_test(error)
+            recovered += 1
+    
+    for test in LoadTest.objects.filter(status='running').exclude(jobs__status='running'):
+        if not test.started_at:
+            continue
+        deadline = test.started_at + timedelta(seconds=test.get_planned_duration() + stale_after)
+        if deadline < now:
+            logger.warning(f"Recovering orphaned test {test.pk}: still running after its planned duration")
+            test.fail_test("The test was interrupted (no process is running it)")
+            recovered += 1
+    return recovered
+
+class JobRunner:
+    """Claims queued jobs and runs each test in its own thread
+    
+    Runs at most concurrency tests at once, sends a heartbeat for every
+    running job and recovers jobs orphaned by runners that died. A tester
+    stops its own test when it sees its job was cancelled.
+    """
+    
+    def __init__(self, concurrency=1, poll_interval=1.0, name=None):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.name = name or get_runner_name()
+        self.active = {}  # job pk -> (job, tester, thread)
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.last_heartbeat = 0
+    
+    def run(self, once=False):
+        """Poll for jobs until stopped (with once, until the queue is empty and every job finished)"""
+        logger.info(f"Job runner {self.name} started (concurrency {self.concurrency})")
+        recover_orphaned_jobs()
+        try:
+            while not self.stopped.is_set():
+                self.reap()
+                if time.time() - self.last_heartbeat >= get_heartbeat_interval():
+                    self.heartbeat()
+                    recover_orphaned_jobs()
+                
+                if len(self.active) < self.concurrency:
+                    claimed = claim_next_job(self.name)
+                    if claimed:
+                        self.start_job(claimed)
+                        continue
+                
+                if once and not self.active:
+                    break
+                self.stopped.wait(self.poll_interval)
+        finally:
+            # Stop running tests so they save what they measured as partial runs
+            self.stop_tests()
+            for job, tester, thread in list(self.active.values()):
+                thread.join()
+            self.reap()
+        logger.info(f"Job runner {self.name} stopped")
+    
+    def stop(self):
+        """Ask the runner to stop (safe to call from a signal handler)"""
+        self.stopped.set()
+    
+    def stop_tests(self):
+        with self.lock:
+            for job, tester, thread in self.active.values():
+                tester.stop()
+    
+    def start_job(self, job):
+        """Run the job's test in a new thread"""
+        logger.info(f"Starting job {job.pk}: test {job.test.name} against {job.target_host or 'unknown host'}")
+        tester = LoadTester(job.test)
+        thread = threading.Thread(target=self.execute, args=(job, tester), name=f"webtester-job-{job.pk}", daemon=True)
+        with self.lock:
+            self.active[job.pk] = (job, tester, thread)
+        thread.start()
+    
+    def execute(self, job, tester):
+        """Run a test and record how its job ended"""
+        try:
+            result = tester.run_test()
+            job.test.refresh_from_db(fields=['status'])
+            if job.test.status != 'completed':
+                status = 'failed'
+            else:
+                # A stopped test keeps the partial results it completed with
+                status = 'cancelled' if tester.stopped_early else 'completed'
+            error = result.get('error', '') if isinstance(result, dict) else ''
+            TestJob.objects.filter(pk=job.pk, status='running').update(status=status, error=error, finished_at=timezone.now())
+        except Exception as e:
+            logger.error(f"Error executing job {job.pk}: {str(e)}")
+            TestJob.objects.filter(pk=job.pk, status='running').update(status='failed', error=str(e), finished_at=timezone.now())
+        finally:
+            # Each job thread has its own database connection
+            connection.close()
+    
+    def heartbeat(self):
+        """Report the running jobs as alive"""
+        self.last_heartbeat = time.time()
+        with self.lock:
+            active = list(self.active)
+        if active:
+            TestJob.objects.filter(pk__in=active, status='running').update(heartbeat_at=timezone.now())
+    
+    def reap(self):
+        """Forget jobs whose thread has finished"""
+        with self.lock:
+            for pk, (job, tester, thread) in list(self.active.items()):
+                if not thread.is_alive():
+                    del self.active[pk]
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from webtester.benchmarks import run_overhead_benchmark
+import json
+
+class Command(BaseCommand):
+    help = 'Measures the per-request overhead of the load test engines against a local no-op HTTP server'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Requests sent by each engine and baseline')
+        parser.add_argument('--engine', choices=['thread', 'async', 'all'], default='all', help='Engine to measure')
+        parser.add_argument('--method', default='GET', choices=['GET', 'POST', 'PUT', 'DELETE'], help='HTTP method of the request')
+        parser.add_argument('--headers', help='Request headers in JSON format')
+        parser.add_argument('--body', help='Request body for POST/PUT requests')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    
+    def handle(self, *args, **options):
+        engines = ('thread', 'async') if options['engine'] == 'all' else (options['engine'],)
+        results = run_overhead_benchmark(
+            options['requests'],
+            engines,
+            method=options['method'],
+            headers=options['headers'],
+            body=options['body']
+        )
+        
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        
+        for engine, result in results.items():
+            self.stdout.write(self.style.SUCCESS(f'{engine} engine'))
+            for label, summary in (('bare client', result['baseline']), ('engine', result['engine'])):
+                self.stdout.write(
+                    f"  {label:<12} {summary['mean_ms']:.3f} ms/request (p50 {summary['p50_ms']:.3f}, "
+                    f"p99 {summary['p99_ms']:.3f}), {summary['cpu_us_per_request']:.0f} us CPU/request, "
+                    f"{summary['requests_per_second']:.0f} requests/s"
+                )
+            self.stdout.write(
+                f"  overhead     {result['overhead_ms']:.3f} ms and {result['overhead_cpu_us']:.0f} us CPU per request"
+            )
@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from webtester.models import LoadTest
+from webtester.comparison import MIN_CHANGE_PERCENT, SIGNIFICANCE_LEVEL, compare_tests
+import json
+
+class Command(BaseCommand):
+    help = 'Compares two completed load tests and exits with status 1 if the candidate regressed'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('baseline', type=int, help='ID of the earlier (baseline) test')
+        parser.add_argument('candidate', type=int, help='ID of the test to check for regressions')
+        parser.add_argument('--alpha', type=float, default=SIGNIFICANCE_LEVEL, help='Significance level of the tests')
+        parser.add_argument('--min-change', type=float, default=MIN_CHANGE_PERCENT, help='Smallest latency or throughput change (in percent) reported as a regression')
+        parser.add_argument('--json', action='store_true', help='Print the comparison as JSON')
+    
+    def handle(self, *args, **options):
+        try:
+            baseline = LoadTest.objects.get(pk=options['baseline'])
+            candidate = LoadTest.objects.get(pk=options['candidate'])
+        except LoadTest.DoesNotExist as e:
+            raise CommandError(str(e))
+        
+        try:
+            comparison = compare_tests(baseline, candidate, options['alpha'], options['min_change'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        
+        if options['json']:
+            self.stdout.write(json.dumps(comparison, indent=2, cls=DjangoJSONEncoder))
+        else:
+            self.write_report(comparison)
+        
+        if comparison['regressions']:
+            raise SystemExit(1)
+    
+    def write_report(self, comparison):
+        self.stdout.write(f"{comparison['baseline']['name']} -> {comparison['candidate']['name']}")
+        
+        latency = comparison['latency']
+        for row in latency['percentiles']:
+            self.stdout.write(
+                f"  latency {row['key']:<5} {row['baseline']:.4f}s -> {row['candidate']:.4f}s ({self.format_change(row['change'], '%')})"
+            )
+        self.write_verdict('latency', latency, f"KS D={latency['ks_statistic']:.3f}")
+        
+        throughput = comparison['throughput']
+        if throughput:
+            self.stdout.write(
+                f"  requests/s    {throughput['baseline']:.2f} -> {throughput['candidate']:.2f} ({self.format_change(throughput['change'], '%')})"
+            )
+            self.write_verdict('throughput', throughput)
+        
+        errors = comparison['error_rate']
+        self.stdout.write(
+            f"  error rate    {errors['baseline']:.2f}% -> {errors['candidate']:.2f}% ({self.format_change(errors['change'], ' points')})"
+        )
+        self.write_verdict('error rate', errors)
+    
+    @staticmethod
+    def format_change(change, unit):
+        if change is None:
+            return 'n/a'
+        return f"{change:+.1f}{unit}"
+    
+    def write_verdict(self, metric, result, detail=''):
+        message = f"  {metric}: {result['verdict']} (p={result['p_value']:.4f}{', ' + detail if detail else ''})"
+        if result['verdict'] == 'regression':
+            self.stdout.write(self.style.ERROR(message))
+        elif result['verdict'] == 'improvement':
+            self.stdout.write(self.style.SUCCESS(message))
+        else:
+            self.stdout.write(message)
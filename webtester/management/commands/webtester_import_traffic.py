@@ -0,0 +1,87 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from webtester.importers import (
+    MAX_SESSION_STEPS, SESSION_TIMEOUT, TrafficImport, create_journeys, create_replay_test, describe_cluster, detect_format,
+    iter_access_log, iter_har, open_log
+)
+import itertools
+
+class Command(BaseCommand):
+    help = 'Creates weighted user journeys (and optionally a replay test) from HAR files or nginx/Apache access logs'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help='HAR files or access logs (.gz files are decompressed on the fly)')
+        parser.add_argument('--user', required=True, help='Username that owns the created journeys')
+        parser.add_argument('--format', choices=['auto', 'har', 'access'], default='auto', help='Input format (detected from each file by default)')
+        parser.add_argument('--base-url', help='Base URL of the journeys (required for access logs, which only record paths)')
+        parser.add_argument('--session-timeout', type=float, default=SESSION_TIMEOUT, help='Seconds without a request after which a session ends')
+        parser.add_argument('--max-steps', type=int, default=MAX_SESSION_STEPS, help='Requests kept per session')
+        parser.add_argument('--max-journeys', type=int, default=20, help='Most common session shapes turned into journeys')
+        parser.add_argument('--min-sessions', type=int, default=2, help='Sessions a shape needs to become a journey')
+        parser.add_argument('--include-static', action='store_true', help='Keep requests for static files (CSS, scripts, images, fonts)')
+        parser.add_argument('--name', default='Imported', help='Prefix of the journey names')
+        parser.add_argument('--create-test', action='store_true', help='Also create an open model test replaying the recorded session rate')
+        parser.add_argument('--stage-seconds', type=int, default=60, help='Width of each replay stage in seconds of the recording')
+        parser.add_argument('--time-scale', type=float, default=1.0, help='Replay duration relative to the recording (0.1 replays an hour in 6 minutes)')
+        parser.add_argument('--dry-run', action='store_true', help='Only print what would be created')
+    
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['user']}")
+        if options['stage_seconds'] < 1 or options['time_scale'] <= 0:
+            raise CommandError('--stage-seconds must be at least 1 and --time-scale positive')
+        
+        traffic = TrafficImport(options['stage_seconds'])
+        streams = []
+        try:
+            requests = []
+            for index, path in enumerate(options['files']):
+                file_format = detect_format(path) if options['format'] == 'auto' else options['format']
+                stream = open_log(path)
+                streams.append(stream)
+                if file_format == 'har':
+                    requests.append(iter_har(stream, traffic.stats, options['include_static'], client=f'har-{index}'))
+                else:
+                    requests.append(iter_access_log(stream, traffic.stats, options['include_static']))
+            traffic.read(itertools.chain(*requests), options['session_timeout'], options['max_steps'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        finally:
+            for stream in streams:
+                stream.close()
+        
+        base_url = options['base_url'] or traffic.get_base_url()
+        if not base_url:
+            raise CommandError('Access logs only record paths, pass the site with --base-url')
+        
+        stats = traffic.stats
+        self.stdout.write(
+            f"Read {stats.lines} lines: {stats.requests} requests kept, {stats.static} static, "
+            f"{stats.errors} failed, {stats.unparsed} unparsed"
+        )
+        self.stdout.write(
+            f"{stats.sessions} sessions ({stats.truncated_sessions} cut at {options['max_steps']} requests) "
+            f"in {len(traffic.clusters)} distinct shapes ({stats.unreplayed_sessions} without a GET request to replay)"
+        )
+        
+        clusters = traffic.top_clusters(options['max_journeys'], options['min_sessions'])
+        if not clusters:
+            raise CommandError('No session shape was seen often enough to create a journey (see --min-sessions)')
+        covered = sum(cluster.count for cluster in clusters)
+        self.stdout.write(f"{len(clusters)} journeys cover {covered / max(1, stats.sessions) * 100:.1f}% of the sessions")
+        
+        if options['dry_run']:
+            for cluster in clusters:
+                self.stdout.write(f"  {cluster.count:>8} sessions: {describe_cluster(cluster)}")
+            return
+        
+        journeys = create_journeys(traffic, user, base_url, options['max_journeys'], options['min_sessions'], options['name'])
+        self.stdout.write(self.style.SUCCESS(f"Created {len(journeys)} journeys against {base_url}"))
+        
+        if options['create_test']:
+            test = create_replay_test(traffic, journeys, user, f"{options['name']} traffic replay", options['time_scale'])
+            self.stdout.write(self.style.SUCCESS(
+                f"Created test '{test.name}' (ID {test.pk}): {test.duration}s in {len(test.get_stages())} stages"
+            ))
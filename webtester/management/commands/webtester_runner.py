@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from webtester.jobs import JobRunner
+import signal
+
+class Command(BaseCommand):
+    help = 'Runs queued load tests outside the web server, with per-host limits, heartbeats and cancellation'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1, help='Tests this runner executes at the same time')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between checks of the queue')
+        parser.add_argument('--name', help='Name of the runner shown on its jobs (defaults to host:pid)')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty and every claimed test finished')
+    
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency must be at least 1')
+        
+        runner = JobRunner(options['concurrency'], options['poll_interval'], options['name'])
+        
+        # Stop claiming jobs and end the running tests on shutdown
+        def stop(signum, frame):
+            self.stdout.write('Stopping the runner, running tests are ended early')
+            runner.stop()
+        
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        
+        self.stdout.write(f'Runner {runner.name} waiting for queued tests')
+        runner.run(once=options['once'])
+        self.stdout.write(self.style.SUCCESS('Runner stopped'))
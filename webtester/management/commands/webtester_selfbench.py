@@ -0,0 +1,97 @@
+from django.core.management.base import BaseCommand, CommandError
+from webtester.benchmarks import MAX_SCHEDULE_LAG_MS, compare_capacity, run_capacity_benchmark
+import json
+
+class Command(BaseCommand):
+    help = 'Measures how much load this machine can generate with each engine against a local stand-in server'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--engine', choices=['thread', 'async', 'all'], default='all', help='Engine to measure')
+        parser.add_argument('--latency', type=float, default=0.0, help='Milliseconds the stand-in server waits before answering')
+        parser.add_argument('--payload', type=int, default=0, help='Bytes in each response body')
+        parser.add_argument('--server-processes', type=int, default=1, help='Processes serving the stand-in server (raise if it is the bottleneck)')
+        parser.add_argument('--users', type=int, default=200, help='Virtual users available to the open model runs')
+        parser.add_argument('--start-rate', type=float, default=50, help='First arrival rate tried (requests per second)')
+        parser.add_argument('--max-rate', type=float, default=20000, help='Highest arrival rate tried')
+        parser.add_argument('--step-factor', type=float, default=1.5, help='Factor the arrival rate grows by at each step')
+        parser.add_argument('--step-duration', type=int, default=5, help='Seconds each arrival rate is held')
+        parser.add_argument('--max-lag', type=float, default=MAX_SCHEDULE_LAG_MS, help='Largest 95th percentile schedule lag (ms) of a sustained rate')
+        parser.add_argument('--memory-users', type=int, default=500, help='Virtual users started to measure memory per user')
+        parser.add_argument('--method', default='GET', choices=['GET', 'POST', 'PUT', 'DELETE'], help='HTTP method of the request')
+        parser.add_argument('--body', help='Request body for POST/PUT requests')
+        parser.add_argument('--label', default='', help='Label stored with the results, e.g. a version or commit')
+        parser.add_argument('--output', default='webtester-selfbench.json', help='File the results are saved to as JSON')
+        parser.add_argument('--baseline', help='Earlier results file to compare with')
+    
+    def handle(self, *args, **options):
+        if options['start_rate'] <= 0 or options['step_factor'] <= 1:
+            raise CommandError('--start-rate must be positive and --step-factor greater than 1')
+        
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as baseline_file:
+                    baseline = json.load(baseline_file)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read {options['baseline']}: {e}")
+        
+        engines = ('thread', 'async') if options['engine'] == 'all' else (options['engine'],)
+        results = run_capacity_benchmark(
+            engines,
+            latency=options['latency'] / 1000,
+            payload_size=options['payload'],
+            users=options['users'],
+            start_rate=options['start_rate'],
+            max_rate=options['max_rate'],
+            step_factor=options['step_factor'],
+            step_duration=options['step_duration'],
+            max_lag=options['max_lag'],
+            memory_users=options['memory_users'],
+            server_processes=options['server_processes'],
+            label=options['label'],
+            method=options['method'],
+            body=options['body']
+        )
+        
+        with open(options['output'], 'w') as output:
+            json.dump(results, output, indent=2)
+        
+        for engine, result in results['engines'].items():
+            self.stdout.write(self.style.SUCCESS(f'{engine} engine'))
+            for step in result['steps']:
+                lag = step['schedule_lag_ms'].get('p95')
+                self.stdout.write(
+                    f"  {step['target_rate']:>9.0f}/s -> {step['achieved_rate']:>9.1f}/s, "
+                    f"lag p95 {self.format_number(lag, ' ms')}, errors {step['error_rate']:.1f}%"
+                    f"{'' if step['sustained'] else '  (not sustained)'}"
+                )
+            limit = '+' if result['reached_max_rate'] else ''
+            self.stdout.write(f"  max sustained     {result['max_sustained_rps']:.0f}{limit} requests/s")
+            self.stdout.write(f"  CPU per request   {self.format_number(result['cpu_us_per_request'], ' us')}")
+            lag = result['schedule_lag_ms']
+            self.stdout.write(
+                f"  schedule lag      p50 {self.format_number(lag.get('p50'), ' ms')}, "
+                f"p99 {self.format_number(lag.get('p99'), ' ms')}"
+            )
+            memory = result['memory']
+            if memory:
+                self.stdout.write(
+                    f"  memory per user   {memory['bytes_per_user'] / 1024:.1f} KiB ({memory['users']} users)"
+                )
+        
+        if baseline:
+            self.stdout.write(self.style.SUCCESS(f"Compared with {baseline.get('label') or options['baseline']}"))
+            if baseline.get('config') != results['config']:
+                self.stdout.write(self.style.WARNING('  The baseline was run with different settings'))
+            for engine, changes in compare_capacity(baseline, results).items():
+                self.stdout.write(f"  {engine}: " + ', '.join(
+                    f"{metric} {self.format_number(change, '%', '+.1f')}" for metric, change in changes.items()
+                ))
+        
+        self.stdout.write(f"Results saved to {options['output']}")
+    
+    @staticmethod
+    def format_number(value, unit, spec='.2f'):
+        if value is None:
+            return 'n/a'
+        return f'{value:{spec}}{unit}'
@@ -0,0 +1,48 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from multiprocessing import AuthenticationError
+from webtester.distributed import get_authkey, get_coordinator_address, run_remote_worker
+import time
+
+class Command(BaseCommand):
+    help = 'Runs a remote load test worker that takes its share of distributed tests from a coordinator'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--coordinator', help='Coordinator address as host:port (defaults to the configured port on localhost)')
+        parser.add_argument('--name', help='Name reported to the coordinator (defaults to the host name)')
+        parser.add_argument('--once', action='store_true', help='Exit after running one test')
+        parser.add_argument('--retry-interval', type=float, default=1.0, help='Seconds between attempts to reach the coordinator')
+    
+    def handle(self, *args, **options):
+        address = self.get_address(options['coordinator'])
+        try:
+            authkey = get_authkey()
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+        self.stdout.write(f'Waiting for tests from {address[0]}:{address[1]}')
+        
+        while True:
+            try:
+                run_remote_worker(address, authkey, options['name'])
+            except (ConnectionRefusedError, ConnectionResetError, EOFError):
+                # No test is waiting for workers yet
+                time.sleep(options['retry_interval'])
+                continue
+            except AuthenticationError:
+                raise CommandError('The coordinator rejected the authentication key')
+            except KeyboardInterrupt:
+                break
+            
+            self.stdout.write(self.style.SUCCESS('Test finished'))
+            if options['once']:
+                break
+    
+    def get_address(self, coordinator):
+        """Parse a host:port coordinator address"""
+        if not coordinator:
+            return ('127.0.0.1', get_coordinator_address()[1])
+        host, _, port = coordinator.rpartition(':')
+        try:
+            return (host or '127.0.0.1', int(port))
+        except ValueError:
+            raise CommandError(f'Invalid coordinator address: {coordinator}')
@@ -0,0 +1,631 @@
+import math
+import threading
+from .errors import MAX_ERROR_EXAMPLES, MAX_STATUS_CODES, classify_error, normalize_message
+
+# Relative width of a histogram bucket. Values are reported as the
+# geometric middle of their bucket, so the error is about half of this.
+HISTOGRAM_PRECISION = 0.01
+LOG_BASE = math.log(1 + HISTOGRAM_PRECISION)
+
+# Smallest latency the histogram tells apart (one microsecond)
+HISTOGRAM_RESOLUTION = 0.000001
+
+# Request phases (and page load milestones of browser journeys) timed separately, as (key, result field)
+PHASES = [
+    ('connect', 'connect_time'),
+    ('tls', 'tls_time'),
+    ('ttfb', 'ttfb'),
+    ('transfer', 'transfer_time'),
+    ('dom_content_loaded', 'dom_content_loaded'),
+    ('load', 'load_time'),
+    ('lcp', 'lcp'),
+]
+
+# Percentiles reported for every test, as (key, percentile)
+PERCENTILES = [
+    ('p50', 50),
+    ('p90', 90),
+    ('p95', 95),
+    ('p99', 99),
+    ('p999', 99.9),
+]
+
+# Distinct response body checksums counted per test
+MAX_BODY_CHECKSUMS = 20
+
+class LatencyHistogram:
+    """Log-bucketed latency histogram (HDR-style) using constant memory
+    
+    Latencies are counted in buckets whose width grows with the value, so
+    every percentile is accurate to about HISTOGRAM_PRECISION whatever the
+    number of samples. Histograms can be merged and serialized to JSON.
+    """
+    
+    def __init__(self):
+        self.counts = {}
+        self.total = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+    
+    def add(self, value):
+        """Record a single latency in seconds"""
+        index = self.bucket_index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.total += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+    
+    @staticmethod
+    def bucket_index(value):
+        """Get the bucket a latency falls into"""
+        if value <= HISTOGRAM_RESOLUTION:
+            return 0
+        return int(math.log(value / HISTOGRAM_RESOLUTION) / LOG_BASE) + 1
+    
+    @staticmethod
+    def bucket_value(index):
+        """Get the representative latency of a bucket"""
+        if index == 0:
+            return HISTOGRAM_RESOLUTION
+        return HISTOGRAM_RESOLUTION * math.exp((index - 0.5) * LOG_BASE)
+    
+    def mean(self):
+        """Get the mean latency"""
+        if not self.total:
+            return None
+        return self.sum / self.total
+    
+    def percentile(self, percentile):
+        """Get the latency below which the given percentage of samples fall"""
+        if not self.total:
+            return None
+        
+        rank = max(1, math.ceil(self.total * percentile / 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                # Never report a value outside what was actually measured
+                return min(max(self.bucket_value(index), self.min), self.max)
+        return self.max
+    
+    def percentiles(self):
+        """Get the standard percentiles as a dictionary"""
+        return {key: self.percentile(percentile) for key, percentile in PERCENTILES}
+    
+    def merge(self, other):
+        """Add the samples of another histogram to this one"""
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.total += other.total
+        self.sum += other.sum
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+    
+    def to_dict(self):
+        """Serialize the histogram to a JSON-friendly dictionary"""
+        return {
+            'counts': {str(index): count for index, count in self.counts.items()},
+            'total': self.total,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+        }
+    
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a histogram from to_dict() output"""
+        histogram = cls()
+        if data:
+            histogram.counts = {int(index): count for index, count in data.get('counts', {}).items()}
+            histogram.total = data.get('total', 0)
+            histogram.sum = data.get('sum', 0.0)
+            histogram.min = data.get('min')
+            histogram.max = data.get('max')
+        return histogram
+
+class TimeSeries:
+    """Per-second buckets of requests, errors, active users and latency
+    
+    Buckets are keyed by the number of whole seconds since the test
+    started. Finished buckets are drained by the caller and never come
+    back; results for a second that was already drained are counted in
+    the oldest open bucket instead.
+    """
+    
+    def __init__(self):
+        self.buckets = {}
+        self.drained_until = 0
+    
+    def bucket(self, second):
+        """Get the bucket for a second, creating it if needed"""
+        second = max(second, self.drained_until)
+        bucket = self.buckets.get(second)
+        if bucket is None:
+            bucket = self.buckets[second] = {
+                'requests': 0,
+                'errors': 0,
+                'active_users': 0,
+                'histogram': LatencyHistogram()
+            }
+        return bucket
+    
+    def add(self, second, success, response_time):
+        """Record a single request result"""
+        bucket = self.bucket(second)
+        bucket['requests'] += 1
+        if not success:
+            bucket['errors'] += 1
+        if response_time is not None:
+            bucket['histogram'].add(response_time)
+    
+    def set_active_users(self, second, active_users):
+        """Record the number of active users seen during a second"""
+        bucket = self.bucket(second)
+        bucket['active_users'] = max(bucket['active_users'], active_users)
+    
+    def drain(self, before=None):
+        """Remove and return (second, bucket) pairs older than a second (or all)"""
+        seconds = sorted(second for second in self.buckets if before is None or second < before)
+        drained = [(second, self.buckets.pop(second)) for second in seconds]
+        if seconds:
+            self.drained_until = max(self.drained_until, seconds[-1] + 1)
+        if before is not None:
+            self.drained_until = max(self.drained_until, before)
+        return drained
+    
+    def merge(self, other):
+        """Add the buckets of another time series to this one"""
+        for second, other_bucket in other.buckets.items():
+            bucket = self.bucket(second)
+            bucket['requests'] += other_bucket['requests']
+            bucket['errors'] += other_bucket['errors']
+            bucket['active_users'] = max(bucket['active_users'], other_bucket['active_users'])
+            bucket['histogram'].merge(other_bucket['histogram'])
+    
+    def to_dict(self):
+        """Serialize the time series to a JSON-friendly dictionary"""
+        return {
+            str(second): dict(bucket, histogram=bucket['histogram'].to_dict())
+            for second, bucket in self.buckets.items()
+        }
+    
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a time series from to_dict() output"""
+        timeline = cls()
+        for second, bucket in (data or {}).items():
+            timeline.buckets[int(second)] = dict(bucket, histogram=LatencyHistogram.from_dict(bucket['histogram']))
+        return timeline
+
+class ResultAggregator:
+    """Streaming aggregation of request results
+    
+    Keeps totals, a latency histogram, a per-second time series and
+    per-user, per-journey and per-step counters instead of the results
+    themselves. Raw results are only kept when keep_raw is set. Open model
+    tests also get a histogram of how late arrivals were sent. Request phases
+    (connect, TLS, TTFB, transfer) and the page load milestones of browser
+    journeys get a histogram each, next to counts of new and reused
+    connections. Response bodies are counted in bytes, and
+    checksummed bodies by checksum (up to MAX_BODY_CHECKSUMS distinct ones).
+    Every response assertion gets a count of the responses it checked and
+    of those that failed it. Results are counted by status code (up to
+    MAX_STATUS_CODES distinct ones) and failures by error class, each class
+    keeping its first MAX_ERROR_EXAMPLES messages, so a failure storm costs
+    no more than a handful of counters.
+    """
+    
+    def __init__(self, keep_raw=False):
+        self.keep_raw = keep_raw
+        self.total = 0
+        self.successful = 0
+        self.histogram = LatencyHistogram()
+        self.schedule_lag = LatencyHistogram()
+        self.phases = {key: LatencyHistogram() for key, field in PHASES}
+        self.connections = {'new': 0, 'reused': 0}
+        self.bytes_received = 0
+        self.body_checksums = {}
+        self.assertions = {}
+        self.status_codes = {}
+        self.errors = {}
+        self.timeline = TimeSeries()
+        self.users = {}
+        self.journeys = {}
+        self.raw_results = []
+    
+    def add(self, result, second=0):
+        """Record a single request result that finished during a given second of the test"""
+        success = result.get('success', False)
+        response_time = result.get('response_time')
+        
+        self.total += 1
+        if success:
+            self.successful += 1
+        if response_time is not None:
+            self.histogram.add(response_time)
+        self.timeline.add(second, success, response_time)
+        if result.get('schedule_lag') is not None:
+            self.schedule_lag.add(result['schedule_lag'])
+        
+        # Where the time went, and whether a connection had to be opened
+        for key, field in PHASES:
+            if result.get(field) is not None:
+                self.phases[key].add(result[field])
+        if result.get('connection_reused') is not None:
+            self.connections['reused' if result['connection_reused'] else 'new'] += 1
+        
+        self.bytes_received += result.get('content_length') or 0
+        if result.get('body_checksum'):
+            self.count_checksum(result['body_checksum'], 1)
+        
+        # Responses by status code, failures by error class
+        self.count_status(result.get('status_code'), 1)
+        if not success:
+            message = result.get('error') or (f"HTTP {result['status_code']}" if result.get('status_code') else '')
+            self.count_error(classify_error(result), 1, [message] if message else ())
+        
+        # Per assertion counters
+        labels = result.get('assertions')
+        if labels:
+            failures = result.get('assertion_failures') or ()
+            for label in labels:
+                counters = self.assertions.get(label)
+                if counters is None:
+                    counters = self.assertions[label] = {'checked': 0, 'failed': 0}
+                counters['checked'] += 1
+                if label in failures:
+                    counters['failed'] += 1
+        
+        # Per virtual user counters
+        user_id = result.get('virtual_user_id')
+        user = self.users.get(user_id)
+        if user is None:
+            user = self.users[user_id] = {'requests': 0, 'successful': 0, 'failed': 0}
+        self.count(user, success)
+        
+        # Per journey and per step counters
+        journey_id = result.get('journey_id')
+        if journey_id:
+            journey = self.journeys.get(journey_id)
+            if journey is None:
+                journey = self.journeys[journey_id] = {
+                    'name': result.get('journey_name', f'Journey {journey_id}'),
+                    'requests': 0,
+                    'successful': 0,
+                    'failed': 0,
+                    'steps': {}
+                }
+            self.count(journey, success)
+            
+            step_id = result.get('journey_step_id')
+            if step_id:
+                step = journey['steps'].get(step_id)
+                if step is None:
+                    step = journey['steps'][step_id] = {
+                        'step_type': result.get('step_type', 'unknown'),
+                        'requests': 0,
+                        'successful': 0,
+                        'failed': 0,
+                        'histogram': LatencyHistogram()
+                    }
+                self.count(step, success)
+                if response_time is not None:
+                    step['histogram'].add(response_time)
+        
+        if self.keep_raw:
+            self.raw_results.append(result)
+    
+    def count_checksum(self, checksum, count):
+        """Count responses with a body checksum, folding new ones into 'other' past the limit"""
+        if checksum not in self.body_checksums and len(self.body_checksums) >= MAX_BODY_CHECKSUMS:
+            checksum = 'other'
+        self.body_checksums[checksum] = self.body_checksums.get(checksum, 0) + count
+    
+    def count_status(self, status_code, count):
+        """Count results with a status code ('none' without a response), folding new ones into 'other' past the limit"""
+        key = str(status_code) if status_code else 'none'
+        if key not in self.status_codes and len(self.status_codes) >= MAX_STATUS_CODES:
+            key = 'other'
+        self.status_codes[key] = self.status_codes.get(key, 0) + count
+    
+    def count_error(self, error_class, count, messages=()):
+        """Count failures of an error class, keeping its first MAX_ERROR_EXAMPLES distinct messages"""
+        counters = self.errors.get(error_class)
+        if counters is None:
+            counters = self.errors[error_class] = {'count': 0, 'examples': []}
+        counters['count'] += count
+        examples = counters['examples']
+        for message in messages:
+            if len(examples) >= MAX_ERROR_EXAMPLES:
+                break
+            message = normalize_message(message)
+            if message not in examples:
+                examples.append(message)
+    
+    @staticmethod
+    def count(counters, success):
+        """Increment a requests/successful/failed counter set"""
+        counters['requests'] += 1
+        if success:
+            counters['successful'] += 1
+        else:
+            counters['failed'] += 1
+    
+    def merge(self, other):
+        """Add everything recorded by another aggregator to this one"""
+        self.total += other.total
+        self.successful += other.successful
+        self.histogram.merge(other.histogram)
+        self.schedule_lag.merge(other.schedule_lag)
+        for key, histogram in other.phases.items():
+            self.phases[key].merge(histogram)
+        for key, count in other.connections.items():
+            self.connections[key] += count
+        self.bytes_received += other.bytes_received
+        for checksum, count in other.body_checksums.items():
+            self.count_checksum(checksum, count)
+        for label, other_counters in other.assertions.items():
+            counters = self.assertions.setdefault(label, {'checked': 0, 'failed': 0})
+            counters['checked'] += other_counters['checked']
+            counters['failed'] += other_counters['failed']
+        for status_code, count in other.status_codes.items():
+            self.count_status(status_code, count)
+        for error_class, counters in other.errors.items():
+            self.count_error(error_class, counters['count'], counters['examples'])
+        self.timeline.merge(other.timeline)
+        
+        for user_id, counters in other.users.items():
+            user = self.users.setdefault(user_id, {'requests': 0, 'successful': 0, 'failed': 0})
+            for key in ('requests', 'successful', 'failed'):
+                user[key] += counters[key]
+        
+        for journey_id, other_journey in other.journeys.items():
+            journey = self.journeys.get(journey_id)
+            if journey is None:
+                journey = self.journeys[journey_id] = {
+                    'name': other_journey['name'],
+                    'requests': 0,
+                    'successful': 0,
+                    'failed': 0,
+                    'steps': {}
+                }
+            for key in ('requests', 'successful', 'failed'):
+                journey[key] += other_journey[key]
+            
+            for step_id, other_step in other_journey['steps'].items():
+                step = journey['steps'].get(step_id)
+                if step is None:
+                    step = journey['steps'][step_id] = {
+                        'step_type': other_step['step_type'],
+                        'requests': 0,
+                        'successful': 0,
+                        'failed': 0,
+                        'histogram': LatencyHistogram()
+                    }
+                for key in ('requests', 'successful', 'failed'):
+                    step[key] += other_step[key]
+                step['histogram'].merge(other_step['histogram'])
+        
+        self.raw_results.extend(other.raw_results)
+    
+    def to_dict(self):
+        """Serialize the aggregator so it can be sent to another process"""
+        journeys = {}
+        for journey_id, journey in self.journeys.items():
+            steps = {}
+            for step_id, step in journey['steps'].items():
+                steps[step_id] = dict(step, histogram=step['histogram'].to_dict())
+            journeys[journey_id] = dict(journey, steps=steps)
+        
+        return {
+            'keep_raw': self.keep_raw,
+            'total': self.total,
+            'successful': self.successful,
+            'histogram': self.histogram.to_dict(),
+            'schedule_lag': self.schedule_lag.to_dict(),
+            'phases': {key: histogram.to_dict() for key, histogram in self.phases.items()},
+            'connections': self.connections,
+            'bytes_received': self.bytes_received,
+            'body_checksums': self.body_checksums,
+            'assertions': self.assertions,
+            'status_codes': self.status_codes,
+            'errors': self.errors,
+            'timeline': self.timeline.to_dict(),
+            'users': self.users,
+            'journeys': journeys,
+            'raw_results': self.raw_results,
+        }
+    
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild an aggregator from to_dict() output"""
+        aggregator = cls(keep_raw=data.get('keep_raw', False))
+        aggregator.total = data.get('total', 0)
+        aggregator.successful = data.get('successful', 0)
+        aggregator.histogram = LatencyHistogram.from_dict(data.get('histogram'))
+        aggregator.schedule_lag = LatencyHistogram.from_dict(data.get('schedule_lag'))
+        for key, histogram in data.get('phases', {}).items():
+            aggregator.phases[key] = LatencyHistogram.from_dict(histogram)
+        aggregator.connections.update(data.get('connections', {}))
+        aggregator.bytes_received = data.get('bytes_received', 0)
+        aggregator.body_checksums = data.get('body_checksums', {})
+        aggregator.assertions = data.get('assertions', {})
+        aggregator.status_codes = data.get('status_codes', {})
+        aggregator.errors = data.get('errors', {})
+        aggregator.timeline = TimeSeries.from_dict(data.get('timeline'))
+        aggregator.users = data.get('users', {})
+        for journey_id, journey in data.get('journeys', {}).items():
+            steps = {}
+            for step_id, step in journey['steps'].items():
+                steps[step_id] = dict(step, histogram=LatencyHistogram.from_dict(step['histogram']))
+            aggregator.journeys[journey_id] = dict(journey, steps=steps)
+        aggregator.raw_results = data.get('raw_results', [])
+        return aggregator
+    
+    def summary(self, duration=None):
+        """Build the results summary expected by LoadTest.complete_test"""
+        if duration:
+            requests_per_second = self.total / duration
+        else:
+            requests_per_second = 0
+        
+        # Success rate for each user
+        users_data = {}
+        for user_id, counters in self.users.items():
+            data = dict(counters)
+            if data['requests'] > 0:
+                data['success_rate'] = (data['successful'] / data['requests']) * 100
+            else:
+                data['success_rate'] = 0
+            users_data[user_id] = data
+        
+        # Response times for each journey step
+        journeys_data = {}
+        for journey_id, journey in self.journeys.items():
+            steps = {}
+            for step_id, step in journey['steps'].items():
+                data = {key: value for key, value in step.items() if key != 'histogram'}
+                if step['histogram'].total:
+                    data['avg_response_time'] = step['histogram'].mean()
+                    data['p95_response_time'] = step['histogram'].percentile(95)
+                steps[step_id] = data
+            journeys_data[journey_id] = dict(journey, steps=steps)
+        
+        # How late scheduled arrivals were sent (open model only)
+        schedule_lag = {}
+        if self.schedule_lag.total:
+            schedule_lag = dict(self.schedule_lag.percentiles(), avg=self.schedule_lag.mean(), max=self.schedule_lag.max)
+        
+        # Average and tail latency of each request phase
+        phases = {}
+        for key, histogram in self.phases.items():
+            if histogram.total:
+                phases[key] = {
+                    'avg': histogram.mean(),
+                    'p50': histogram.percentile(50),
+                    'p95': histogram.percentile(95),
+                    'p99': histogram.percentile(99),
+                }
+        
+        # Failure rate of each assertion
+        assertions = {}
+        for label, counters in self.assertions.items():
+            assertions[label] = dict(counters, failure_rate=counters['failed'] / counters['checked'] * 100)
+        
+        # Share of all results failed by each error class, most frequent first
+        errors = {}
+        for error_class, counters in sorted(self.errors.items(), key=lambda item: -item[1]['count']):
+            errors[error_class] = dict(counters, percent=counters['count'] / self.total * 100 if self.total else 0)
+        
+        return {
+            'total_requests': self.total,
+            'successful_requests': self.successful,
+            'failed_requests': self.total - self.successful,
+            'avg_response_time': self.histogram.mean(),
+            'min_response_time': self.histogram.min,
+            'max_response_time': self.histogram.max,
+            'requests_per_second': requests_per_second,
+            'percentiles': self.histogram.percentiles(),
+            'latency_histogram': self.histogram.to_dict(),
+            'schedule_lag': schedule_lag,
+            'phases': phases,
+            'connections': dict(self.connections),
+            'bytes_received': self.bytes_received,
+            'body_checksums': dict(sorted(self.body_checksums.items(), key=lambda item: -item[1])),
+            'assertions': assertions,
+            'status_codes': dict(sorted(self.status_codes.items(), key=lambda item: -item[1])),
+            'errors': errors,
+            'users_data': users_data,
+            'journeys_data': journeys_data,
+            'detailed_results': self.raw_results
+        }
+
+class ShardedCounter:
+    """Counter that many threads update without sharing a lock
+    
+    Every thread only ever changes its own cell; the value is the sum of
+    all cells, worked out when it is read.
+    """
+    
+    def __init__(self):
+        self.local = threading.local()
+        self.cells = []
+    
+    def add(self, amount=1):
+        """Add to (or subtract from) the counter"""
+        cell = getattr(self.local, 'cell', None)
+        if cell is None:
+            cell = self.local.cell = [0]
+            self.cells.append(cell)
+        cell[0] += amount
+    
+    @property
+    def value(self):
+        """Get the current total"""
+        return sum(cell[0] for cell in list(self.cells))
+
+class AggregatorShard:
+    """The aggregator one thread records into, with the lock it swaps it under"""
+    
+    def __init__(self, keep_raw):
+        self.lock = threading.Lock()
+        self.aggregator = ResultAggregator(keep_raw=keep_raw)
+
+class ShardedAggregator:
+    """Per-thread result aggregators merged when they are read
+    
+    Each recording thread gets a shard of its own, so recording never waits
+    for another recording thread; a shard's lock is only contended by the
+    reader swapping it out. Readers collect() every shard into one merged
+    aggregator, which is guarded by lock.
+    """
+    
+    def __init__(self, keep_raw=False):
+        self.keep_raw = keep_raw
+        self.local = threading.local()
+        self.shards = []
+        self.lock = threading.RLock()
+        self.merged = ResultAggregator(keep_raw=keep_raw)
+    
+    def add(self, results, second=0):
+        """Record request results that finished during a given second of the test"""
+        shard = getattr(self.local, 'shard', None)
+        if shard is None:
+            shard = self.local.shard = AggregatorShard(self.keep_raw)
+            self.shards.append(shard)
+        
+        with shard.lock:
+            for result in results:
+                shard.aggregator.add(result, second)
+    
+    def merge(self, other):
+        """Add an aggregator recorded elsewhere (e.g. in a worker process)"""
+        with self.lock:
+            self.merged.merge(other)
+    
+    def collect(self):
+        """Merge everything the shards recorded so far and return the merged aggregator
+        
+        Hold lock while using the result if other threads may collect too.
+        """
+        with self.lock:
+            for shard in list(self.shards):
+                with shard.lock:
+                    aggregator = shard.aggregator
+                    shard.aggregator = ResultAggregator(keep_raw=self.keep_raw)
+                self.merged.merge(aggregator)
+            return self.merged
+    
+    def take(self):
+        """Collect everything recorded so far and start again from empty"""
+        with self.lock:
+            aggregator = self.collect()
+            self.merged = ResultAggregator(keep_raw=self.keep_raw)
+            return aggregator
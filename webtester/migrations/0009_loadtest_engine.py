@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webtester', '0008_alter_journeystep_url'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loadtest',
+            name='engine',
+            field=models.CharField(choices=[('thread', 'Threads (one per virtual user)'), ('async', 'Async (event loop)')], default='thread', help_text='Engine used to run the virtual users. The async engine scales to thousands of users.', max_length=10),
+        ),
+    ]
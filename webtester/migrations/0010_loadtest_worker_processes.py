@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webtester', '0009_loadtest_engine'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loadtest',
+            name='worker_processes',
+            field=models.PositiveIntegerField(default=1, help_text='Number of worker processes to split the virtual users across'),
+        ),
+    ]
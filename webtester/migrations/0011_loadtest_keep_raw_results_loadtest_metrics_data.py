@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webtester', '0010_loadtest_worker_processes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loadtest',
+            name='keep_raw_results',
+            field=models.BooleanField(default=False, help_text='Store every individual request result (uses much more memory and storage)'),
+        ),
+        migrations.AddField(
+            model_name='loadtest',
+            name='metrics_data',
+            field=models.TextField(blank=True, help_text='Aggregated metrics (percentiles, latency histogram, journey breakdown) in JSON format', null=True),
+        ),
+    ]
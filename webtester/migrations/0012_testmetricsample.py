@@ -0,0 +1,34 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webtester', '0011_loadtest_keep_raw_results_loadtest_metrics_data'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TestMetricSample',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('second', models.PositiveIntegerField(help_text='Seconds since the test started')),
+                ('requests', models.PositiveIntegerField(default=0, help_text='Requests completed during this second')),
+                ('errors', models.PositiveIntegerField(default=0, help_text='Failed requests completed during this second')),
+                ('active_users', models.PositiveIntegerField(default=0, help_text='Most virtual users active during this second')),
+                ('avg_response_time', models.FloatField(blank=True, null=True)),
+                ('p50_response_time', models.FloatField(blank=True, null=True)),
+                ('p90_response_time', models.FloatField(blank=True, null=True)),
+                ('p95_response_time', models.FloatField(blank=True, null=True)),
+                ('p99_response_time', models.FloatField(blank=True, null=True)),
+                ('test', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='metric_samples', to='webtester.loadtest')),
+            ],
+            options={
+                'ordering': ['test', 'second'],
+                'unique_together': {('test', 'second')},
+            },
+        ),
+    ]
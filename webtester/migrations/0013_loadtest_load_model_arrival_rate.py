@@ -0,0 +1,28 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webtester', '0012_testmetricsample'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loadtest',
+            name='arrival_rate',
+            field=models.FloatField(blank=True, help_text='Arrivals (requests or journeys) started per second in the open model', null=True),
+        ),
+        migrations.AddField(
+            model_name='loadtest',
+            name='arrival_rate_end',
+            field=models.FloatField(blank=True, help_text='Arrival rate reached at the end of the test (leave empty for a constant rate)', null=True),
+        ),
+        migrations.AddField(
+            model_name='loadtest',
+            name='load_model',
+            field=models.CharField(choices=[('closed', 'Closed (virtual users loop)'), ('open', 'Open (fixed arrival rate)')], default='closed', help_text='Closed: each virtual user waits for its last response before the next request. Open: requests start at a fixed rate whatever the response times.', max_length=10),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webtester', '0013_loadtest_load_model_arrival_rate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loadtest',
+            name='stages',
+            field=models.TextField(blank=True, help_text='Load stages in JSON format, e.g. [{"duration": 30, "target": 50}]. Each stage ramps linearly to its target number of users (or arrivals per second in the open model).', null=True),
+        ),
+    ]
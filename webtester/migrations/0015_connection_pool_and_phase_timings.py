@@ -0,0 +1,53 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webtester', '0014_loadtest_stages'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loadtest',
+            name='connection_pool',
+            field=models.CharField(choices=[('per_user', 'One pool per virtual user'), ('shared', 'Shared by all virtual users')], default='per_user', help_text='Give every virtual user its own connections (like separate browsers) or share one connection pool', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='loadtest',
+            name='keep_alive',
+            field=models.BooleanField(default=True, help_text='Reuse connections between requests (HTTP keep-alive)'),
+        ),
+        migrations.AddField(
+            model_name='loadtest',
+            name='pool_size',
+            field=models.PositiveIntegerField(blank=True, help_text='Connections kept open per host in each pool (leave empty for automatic)', null=True),
+        ),
+        migrations.AddField(
+            model_name='testresult',
+            name='connect_time',
+            field=models.FloatField(blank=True, help_text='Time spent opening the TCP connection, including the DNS lookup', null=True),
+        ),
+        migrations.AddField(
+            model_name='testresult',
+            name='connection_reused',
+            field=models.BooleanField(blank=True, help_text='Whether the request was sent over an already open connection', null=True),
+        ),
+        migrations.AddField(
+            model_name='testresult',
+            name='tls_time',
+            field=models.FloatField(blank=True, help_text='Time spent on the TLS handshake', null=True),
+        ),
+        migrations.AddField(
+            model_name='testresult',
+            name='transfer_time',
+            field=models.FloatField(blank=True, help_text='Time spent downloading the response body', null=True),
+        ),
+        migrations.AddField(
+            model_name='testresult',
+            name='ttfb',
+            field=models.FloatField(blank=True, help_text='Time from sending the request to receiving the response headers', null=True),
+        ),
+    ]
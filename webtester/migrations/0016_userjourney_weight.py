@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webtester', '0015_connection_pool_and_phase_timings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userjourney',
+            name='weight',
+            field=models.PositiveIntegerField(default=1, help_text='How often this journey is picked relative to the other journeys of a test (0 to never pick it)'),
+        ),
+    ]
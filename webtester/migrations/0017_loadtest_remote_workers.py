@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webtester', '0016_userjourney_weight'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loadtest',
+            name='remote_workers',
+            field=models.PositiveIntegerField(default=0, help_text='Number of remote workers (started with manage.py webtester_worker) to split the virtual users across; 0 runs the test on this server'),
+        ),
+    ]
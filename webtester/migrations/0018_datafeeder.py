@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webtester', '0017_loadtest_remote_workers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataFeeder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.SlugField(help_text='Name used in placeholders such as {{ name.column }}')),
+                ('data_file', models.FileField(help_text='CSV file with a header row, or JSON Lines file (.jsonl) with one object per line', upload_to='webtester/feeders/')),
+                ('strategy', models.CharField(choices=[('round_robin', 'Round robin (records in file order)'), ('random', 'Random record each iteration'), ('unique', 'Unique record per virtual user')], default='round_robin', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('test', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feeders', to='webtester.loadtest')),
+            ],
+            options={
+                'ordering': ['name'],
+                'unique_together': {('test', 'name')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webtester', '0018_datafeeder'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loadtest',
+            name='body_mode',
+            field=models.CharField(choices=[('discard', 'Discard (count bytes only)'), ('checksum', 'Checksum (count and hash bytes)'), ('keep', 'Keep (decode every page)')], default='discard', help_text='What to do with response bodies that no journey step reads. Discard and checksum stream the body without keeping it in memory.', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='testresult',
+            name='body_checksum',
+            field=models.CharField(blank=True, help_text='CRC-32 of the response body (checksum body mode)', max_length=8, null=True),
+        ),
+    ]
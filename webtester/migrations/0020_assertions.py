@@ -0,0 +1,23 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webtester', '0019_body_mode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='journeystep',
+            name='assertions',
+            field=models.TextField(blank=True, help_text="Checks on this step's response in JSON format, added to the test's assertions", null=True),
+        ),
+        migrations.AddField(
+            model_name='loadtest',
+            name='assertions',
+            field=models.TextField(blank=True, help_text='Checks applied to every response in JSON format, e.g. [{"type": "status", "value": [200, 201]}, {"type": "body_contains", "value": "Welcome"}]', null=True),
+        ),
+    ]
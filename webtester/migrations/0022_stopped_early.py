@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webtester', '0021_test_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loadtest',
+            name='stopped_early',
+            field=models.BooleanField(default=False, help_text='The test was stopped before its planned end, so the results cover part of the run'),
+        ),
+    ]
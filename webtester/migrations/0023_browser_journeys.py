@@ -0,0 +1,38 @@
+# Generated by Django 5.1.6 on 2026-10-18 14:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webtester', '0022_stopped_early'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loadtest',
+            name='browser_pool_size',
+            field=models.PositiveIntegerField(blank=True, help_text='Headless browsers shared by the virtual users of each process (leave empty to fit the available memory)', null=True),
+        ),
+        migrations.AddField(
+            model_name='loadtest',
+            name='journey_mode',
+            field=models.CharField(choices=[('http', 'HTTP (simulated clicks)'), ('browser', 'Headless browser')], default='http', help_text='HTTP replays journeys as requests. Headless browser runs every step in a real browser (scripts, assets and page load timings), leased from a shared pool.', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='testresult',
+            name='dom_content_loaded',
+            field=models.FloatField(blank=True, help_text='Time from the start of the navigation to the end of DOMContentLoaded (browser journeys)', null=True),
+        ),
+        migrations.AddField(
+            model_name='testresult',
+            name='lcp',
+            field=models.FloatField(blank=True, help_text='Largest Contentful Paint, from the start of the navigation (browser journeys)', null=True),
+        ),
+        migrations.AddField(
+            model_name='testresult',
+            name='load_time',
+            field=models.FloatField(blank=True, help_text='Time from the start of the navigation to the end of the load event (browser journeys)', null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.6 on 2026-10-18 14:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webtester', '0023_browser_journeys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='journeystep',
+            name='wait_distribution',
+            field=models.CharField(choices=[('uniform', 'Uniform between min and max'), ('exponential', 'Exponential from min (max is the 95th percentile)'), ('lognormal', 'Log-normal (min and max are the 5th and 95th percentiles)'), ('replay', 'Replay recorded think times')], default='uniform', help_text='Distribution the wait before this step is drawn from', max_length=12),
+        ),
+        migrations.AddField(
+            model_name='journeystep',
+            name='wait_samples',
+            field=models.TextField(blank=True, help_text='Recorded think times in seconds as a JSON list, replayed at random (replay distribution)', null=True),
+        ),
+        migrations.AddField(
+            model_name='userjourney',
+            name='pacing',
+            field=models.FloatField(blank=True, help_text='Seconds from the start of one iteration of this journey to the start of the next, whatever its think times (leave empty to start the next iteration right away)', null=True),
+        ),
+    ]
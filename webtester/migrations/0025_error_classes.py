@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 14:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webtester', '0024_think_time_distributions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='testresult',
+            name='error_class',
+            field=models.CharField(blank=True, help_text='Class of the error of a failed request (e.g. timeout, connection_refused, http_5xx)', max_length=20, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.6 on 2026-10-18 14:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webtester', '0025_error_classes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loadtest',
+            name='max_wait',
+            field=models.FloatField(default=15.0, help_text='Maximum think time in seconds between the requests of simple tests'),
+        ),
+        migrations.AddField(
+            model_name='loadtest',
+            name='min_wait',
+            field=models.FloatField(default=5.0, help_text='Minimum think time in seconds between the requests of simple tests (journey steps have their own)'),
+        ),
+        migrations.AddField(
+            model_name='loadtest',
+            name='wait_distribution',
+            field=models.CharField(choices=[('uniform', 'Uniform between min and max'), ('exponential', 'Exponential from min (max is the 95th percentile)'), ('lognormal', 'Log-normal (min and max are the 5th and 95th percentiles)'), ('replay', 'Replay recorded think times')], default='uniform', help_text='Distribution the think time between the requests of simple tests is drawn from', max_length=12),
+        ),
+        migrations.AddField(
+            model_name='loadtest',
+            name='wait_samples',
+            field=models.TextField(blank=True, help_text='Recorded think times in seconds as a JSON list, replayed at random (replay distribution)', null=True),
+        ),
+    ]
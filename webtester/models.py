@@ -1,15 +1,19 @@
-from django.db import models
+from django.db import models, transaction
+from django.conf import settings
 from django.contrib.auth.models import User
 import json
 import random
 from django.utils import timezone
 from django.urls import reverse
+from .errors import MAX_STORED_ERROR_LENGTH, classify_error, truncate_message
 
 class UserJourney(models.Model):
     """Model to define a user journey (sequence of steps)"""
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
     base_url = models.URLField(max_length=2000, help_text="Base URL for relative paths in journey steps")
+    weight = models.PositiveIntegerField(default=1, help_text="How often this journey is picked relative to the other journeys of a test (0 to never pick it)")
+    pacing = models.FloatField(null=True, blank=True, help_text="Seconds from the start of one iteration of this journey to the start of the next, whatever its think times (leave empty to start the next iteration right away)")
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='journeys')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -25,6 +29,14 @@ class UserJourney(models.Model):
     def get_absolute_url(self):
         return reverse('webtester:journey_detail', kwargs={'pk': self.pk})
 
+# Distributions think times are drawn from (see thinktime.ThinkTime)
+WAIT_DISTRIBUTIONS = [
+    ('uniform', 'Uniform between min and max'),
+    ('exponential', 'Exponential from min (max is the 95th percentile)'),
+    ('lognormal', 'Log-normal (min and max are the 5th and 95th percentiles)'),
+    ('replay', 'Replay recorded think times'),
+]
+
 class JourneyStep(models.Model):
     """Model to define a step in a user journey"""
     STEP_TYPES = [
@@ -43,6 +55,9 @@ class JourneyStep(models.Model):
     value = models.TextField(blank=True, null=True, help_text="Value to input (for input step type)")
     min_wait = models.FloatField(default=1.0, help_text="Minimum wait time in seconds before executing this step")
     max_wait = models.FloatField(default=3.0, help_text="Maximum wait time in seconds before executing this step")
+    wait_distribution = models.CharField(max_length=12, default='uniform', choices=WAIT_DISTRIBUTIONS, help_text="Distribution the wait before this step is drawn from")
+    wait_samples = models.TextField(blank=True, null=True, help_text="Recorded think times in seconds as a JSON list, replayed at random (replay distribution)")
+    assertions = models.TextField(blank=True, null=True, help_text="Checks on this step's response in JSON format, added to the test's assertions")
     
     class Meta:
         ordering = ['journey', 'order']
@@ -68,6 +83,41 @@ class LoadTest(models.Model):
     ], help_text="HTTP method for simple tests (not used for journey tests)")
     headers = models.TextField(blank=True, null=True, help_text="HTTP headers in JSON format")
     body = models.TextField(blank=True, null=True, help_text="Request body for POST/PUT requests (not used for journey tests)")
+    min_wait = models.FloatField(default=5.0, help_text="Minimum think time in seconds between the requests of simple tests (journey steps have their own)")
+    max_wait = models.FloatField(default=15.0, help_text="Maximum think time in seconds between the requests of simple tests")
+    wait_distribution = models.CharField(max_length=12, default='uniform', choices=WAIT_DISTRIBUTIONS, help_text="Distribution the think time between the requests of simple tests is drawn from")
+    wait_samples = models.TextField(blank=True, null=True, help_text="Recorded think times in seconds as a JSON list, replayed at random (replay distribution)")
+    engine = models.CharField(max_length=10, default='thread', choices=[
+        ('thread', 'Threads (one per virtual user)'),
+        ('async', 'Async (event loop)'),
+    ], help_text="Engine used to run the virtual users. The async engine scales to thousands of users.")
+    worker_processes = models.PositiveIntegerField(default=1, help_text="Number of worker processes to split the virtual users across")
+    remote_workers = models.PositiveIntegerField(default=0, help_text="Number of remote workers (started with manage.py webtester_worker) to split the virtual users across; 0 runs the test on this server")
+    keep_raw_results = models.BooleanField(default=False, help_text="Store every individual request result (uses much more memory and storage)")
+    load_model = models.CharField(max_length=10, default='closed', choices=[
+        ('closed', 'Closed (virtual users loop)'),
+        ('open', 'Open (fixed arrival rate)'),
+    ], help_text="Closed: each virtual user waits for its last response before the next request. Open: requests start at a fixed rate whatever the response times.")
+    arrival_rate = models.FloatField(null=True, blank=True, help_text="Arrivals (requests or journeys) started per second in the open model")
+    arrival_rate_end = models.FloatField(null=True, blank=True, help_text="Arrival rate reached at the end of the test (leave empty for a constant rate)")
+    connection_pool = models.CharField(max_length=10, default='per_user', choices=[
+        ('per_user', 'One pool per virtual user'),
+        ('shared', 'Shared by all virtual users'),
+    ], help_text="Give every virtual user its own connections (like separate browsers) or share one connection pool")
+    pool_size = models.PositiveIntegerField(null=True, blank=True, help_text="Connections kept open per host in each pool (leave empty for automatic)")
+    keep_alive = models.BooleanField(default=True, help_text="Reuse connections between requests (HTTP keep-alive)")
+    body_mode = models.CharField(max_length=10, default='discard', choices=[
+        ('discard', 'Discard (count bytes only)'),
+        ('checksum', 'Checksum (count and hash bytes)'),
+        ('keep', 'Keep (decode every page)'),
+    ], help_text="What to do with response bodies that no journey step reads. Discard and checksum stream the body without keeping it in memory.")
+    journey_mode = models.CharField(max_length=10, default='http', choices=[
+        ('http', 'HTTP (simulated clicks)'),
+        ('browser', 'Headless browser'),
+    ], help_text="HTTP replays journeys as requests. Headless browser runs every step in a real browser (scripts, assets and page load timings), leased from a shared pool.")
+    browser_pool_size = models.PositiveIntegerField(null=True, blank=True, help_text="Headless browsers shared by the virtual users of each process (leave empty to fit the available memory)")
+    stages = models.TextField(blank=True, null=True, help_text="Load stages in JSON format, e.g. [{\"duration\": 30, \"target\": 50}]. Each stage ramps linearly to its target number of users (or arrivals per second in the open model).")
+    assertions = models.TextField(blank=True, null=True, help_text="Checks applied to every response in JSON format, e.g. [{\"type\": \"status\", \"value\": [200, 201]}, {\"type\": \"body_contains\", \"value\": \"Welcome\"}]")
 
     # Public template fields
     is_public_template = models.BooleanField(default=False, help_text="Make this test available as a public template for other users")
@@ -92,6 +142,7 @@ class LoadTest(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     started_at = models.DateTimeField(null=True, blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
+    stopped_early = models.BooleanField(default=False, help_text="The test was stopped before its planned end, so the results cover part of the run")
     
     # Test results summary
     total_requests = models.PositiveIntegerField(default=0)
@@ -102,6 +153,7 @@ class LoadTest(models.Model):
     max_response_time = models.FloatField(null=True, blank=True)
     requests_per_second = models.FloatField(null=True, blank=True)
     users_data = models.TextField(blank=True, null=True, help_text="Virtual users data in JSON format")
+    metrics_data = models.TextField(blank=True, null=True, help_text="Aggregated metrics (percentiles, latency histogram, journey breakdown) in JSON format")
     
     class Meta:
         ordering = ['-created_at']
@@ -159,16 +211,65 @@ class LoadTest(models.Model):
         except json.JSONDecodeError:
             return {}
     
+    def get_metrics_data_dict(self):
+        """Convert metrics_data JSON string to dictionary"""
+        if not self.metrics_data:
+            return {}
+        try:
+            return json.loads(self.metrics_data)
+        except json.JSONDecodeError:
+            return {}
+    
+    def get_stages(self):
+        """Convert stages JSON string to a list of (duration, target) pairs"""
+        if not self.stages:
+            return []
+        try:
+            return [(float(stage['duration']), float(stage['target'])) for stage in json.loads(self.stages)]
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+            return []
+    
+    def get_load_points(self):
+        """Get the target load over time as (offset, target) points
+        
+        The target is a number of users in the closed model and arrivals per
+        second in the open model. Without stages, the closed model ramps up
+        at spawn_rate and the open model goes from arrival_rate to
+        arrival_rate_end.
+        """
+        stages = self.get_stages()
+        
+        if self.load_model == 'open':
+            start = self.arrival_rate or 0
+            if not stages:
+                end = start if self.arrival_rate_end is None else self.arrival_rate_end
+                stages = [(self.duration, end)]
+        else:
+            start = 0
+            if not stages:
+                ramp_up = self.num_users / self.spawn_rate
+                stages = [(ramp_up, self.num_users), (max(0, self.duration - ramp_up), self.num_users)]
+        
+        points = [(0, start)]
+        for duration, target in stages:
+            points.append((points[-1][0] + duration, target))
+        return points
+    
     def start_test(self):
         """Mark the test as started"""
         self.status = 'running'
         self.started_at = timezone.now()
+        self.stopped_early = False
         self.save()
+        
+        # Live metrics always describe the latest run
+        self.metric_samples.all().delete()
     
     def complete_test(self, results):
         """Mark the test as completed and store results"""
         self.status = 'completed'
         self.completed_at = timezone.now()
+        self.stopped_early = results.get('stopped_early', False)
         
         # Store summary results
         self.total_requests = results.get('total_requests', 0)
@@ -183,32 +284,30 @@ class LoadTest(models.Model):
         if 'users_data' in results:
             self.users_data = json.dumps(results['users_data'])
         
-        # Store detailed results
-        detailed_results = results.get('detailed_results', [])
-        if detailed_results:
-            for result in detailed_results:
-                # Convert cookies dict to JSON string
-                cookies_json = None
-                if 'cookies' in result and result['cookies']:
-                    try:
-                        cookies_json = json.dumps(result['cookies'])
-                    except:
-                        pass
-                    
-                TestResult.objects.create(
-                    test=self,
-                    timestamp=result.get('timestamp'),
-                    response_time=result.get('response_time'),
-                    status_code=result.get('status_code'),
-                    success=result.get('success', False),
-                    error=result.get('error', ''),
-                    user_agent=result.get('user_agent', ''),
-                    virtual_user_id=result.get('virtual_user_id'),
-                    cookies=cookies_json,
-                    content_length=result.get('content_length')
-                )
+        # Store aggregated metrics
+        self.metrics_data = json.dumps({
+            'percentiles': results.get('percentiles', {}),
+            'latency_histogram': results.get('latency_histogram'),
+            'journeys_data': results.get('journeys_data', {}),
+            'schedule_lag': results.get('schedule_lag', {}),
+            'phases': results.get('phases', {}),
+            'connections': results.get('connections', {}),
+            'bytes_received': results.get('bytes_received', 0),
+            'body_checksums': results.get('body_checksums', {}),
+            'assertions': results.get('assertions', {}),
+            'status_codes': results.get('status_codes', {}),
+            'errors': results.get('errors', {}),
+        })
         
-        self.save()
+        # Store detailed results in batches inside a single transaction
+        detailed_results = results.get('detailed_results', [])
+        with transaction.atomic():
+            if detailed_results:
+                writer = TestResultWriter(self)
+                writer.write(detailed_results)
+                writer.flush()
+            
+            self.save()
     
     def fail_test(self, error):
         """Mark the test as failed"""
@@ -223,6 +322,14 @@ class LoadTest(models.Model):
         )
         self.save()
     
+    def get_active_job(self):
+        """Get the queued or running job of this test (None if there is none)"""
+        return self.jobs.filter(status__in=TestJob.ACTIVE_STATUSES).first()
+    
+    def get_planned_duration(self):
+        """Get how long a run of this test should last in seconds"""
+        return max(self.duration, self.get_load_points()[-1][0])
+    
     def get_duration(self):
         """Get the actual duration of the test in seconds"""
         if self.started_at and self.completed_at:
@@ -235,6 +342,27 @@ class LoadTest(models.Model):
             return (self.successful_requests / self.total_requests) * 100
         return 0
 
+class DataFeeder(models.Model):
+    """CSV or JSON Lines file whose records fill the placeholders of a load test's requests"""
+    STRATEGY_CHOICES = [
+        ('round_robin', 'Round robin (records in file order)'),
+        ('random', 'Random record each iteration'),
+        ('unique', 'Unique record per virtual user'),
+    ]
+    
+    test = models.ForeignKey(LoadTest, on_delete=models.CASCADE, related_name='feeders')
+    name = models.SlugField(max_length=50, help_text="Name used in placeholders such as {{ name.column }}")
+    data_file = models.FileField(upload_to='webtester/feeders/', help_text="CSV file with a header row, or JSON Lines file (.jsonl) with one object per line")
+    strategy = models.CharField(max_length=20, choices=STRATEGY_CHOICES, default='round_robin')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['name']
+        unique_together = ['test', 'name']
+    
+    def __str__(self):
+        return f"{self.test.name} - {self.name}"
+
 class TestResult(models.Model):
     """Model to store individual test results"""
     test = models.ForeignKey(LoadTest, on_delete=models.CASCADE, related_name='results')
@@ -251,6 +379,16 @@ class TestResult(models.Model):
     url = models.URLField(max_length=2000, blank=True, null=True, help_text="URL that was accessed")
     step_type = models.CharField(max_length=20, blank=True, null=True, help_text="Type of step that was executed")
     wait_time = models.FloatField(null=True, blank=True, help_text="Time waited before executing this step")
+    connect_time = models.FloatField(null=True, blank=True, help_text="Time spent opening the TCP connection, including the DNS lookup")
+    tls_time = models.FloatField(null=True, blank=True, help_text="Time spent on the TLS handshake")
+    ttfb = models.FloatField(null=True, blank=True, help_text="Time from sending the request to receiving the response headers")
+    transfer_time = models.FloatField(null=True, blank=True, help_text="Time spent downloading the response body")
+    connection_reused = models.BooleanField(null=True, blank=True, help_text="Whether the request was sent over an already open connection")
+    body_checksum = models.CharField(max_length=8, blank=True, null=True, help_text="CRC-32 of the response body (checksum body mode)")
+    error_class = models.CharField(max_length=20, blank=True, null=True, help_text="Class of the error of a failed request (e.g. timeout, connection_refused, http_5xx)")
+    dom_content_loaded = models.FloatField(null=True, blank=True, help_text="Time from the start of the navigation to the end of DOMContentLoaded (browser journeys)")
+    load_time = models.FloatField(null=True, blank=True, help_text="Time from the start of the navigation to the end of the load event (browser journeys)")
+    lcp = models.FloatField(null=True, blank=True, help_text="Largest Contentful Paint, from the start of the navigation (browser journeys)")
     
     class Meta:
         ordering = ['timestamp']
@@ -268,6 +406,143 @@ class TestResult(models.Model):
             return {}
         
 
+class TestJob(models.Model):
+    """Queued run of a load test, claimed and executed by a runner process (manage.py webtester_runner)"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ]
+    ACTIVE_STATUSES = ('queued', 'running')
+    
+    test = models.ForeignKey(LoadTest, on_delete=models.CASCADE, related_name='jobs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    target_host = models.CharField(max_length=255, blank=True, help_text="Host under test, used to limit how many tests run against it at once")
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='test_jobs')
+    runner = models.CharField(max_length=255, blank=True, help_text="Runner process (host:pid) that claimed the job")
+    cancel_requested = models.BooleanField(default=False, help_text="Set to ask the runner to stop the test")
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True, help_text="Last time the runner reported the job as alive")
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['created_at']
+        indexes = [models.Index(fields=['status', 'created_at'])]
+    
+    def __str__(self):
+        return f"{self.test.name} ({self.get_status_display()})"
+    
+    def is_active(self):
+        """Check whether the job is waiting for a runner or running"""
+        return self.status in self.ACTIVE_STATUSES
+
+class TestMetricSample(models.Model):
+    """Model to store one second of live metrics for a running or finished test"""
+    test = models.ForeignKey(LoadTest, on_delete=models.CASCADE, related_name='metric_samples')
+    second = models.PositiveIntegerField(help_text="Seconds since the test started")
+    requests = models.PositiveIntegerField(default=0, help_text="Requests completed during this second")
+    errors = models.PositiveIntegerField(default=0, help_text="Failed requests completed during this second")
+    active_users = models.PositiveIntegerField(default=0, help_text="Most virtual users active during this second")
+    avg_response_time = models.FloatField(null=True, blank=True)
+    p50_response_time = models.FloatField(null=True, blank=True)
+    p90_response_time = models.FloatField(null=True, blank=True)
+    p95_response_time = models.FloatField(null=True, blank=True)
+    p99_response_time = models.FloatField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['test', 'second']
+        unique_together = ['test', 'second']
+    
+    def __str__(self):
+        return f"{self.test.name} at {self.second}s"
+    
+    @classmethod
+    def from_bucket(cls, test, second, bucket):
+        """Build an unsaved sample from a time series bucket"""
+        histogram = bucket['histogram']
+        return cls(
+            test=test,
+            second=second,
+            requests=bucket['requests'],
+            errors=bucket['errors'],
+            active_users=bucket['active_users'],
+            avg_response_time=histogram.mean(),
+            p50_response_time=histogram.percentile(50),
+            p90_response_time=histogram.percentile(90),
+            p95_response_time=histogram.percentile(95),
+            p99_response_time=histogram.percentile(99)
+        )
+    
+    def get_error_rate(self):
+        """Get the error rate as a percentage"""
+        if self.requests > 0:
+            return (self.errors / self.requests) * 100
+        return 0
+
+class TestResultWriter:
+    """Batched writer that stores result dicts as TestResult rows with bulk_create"""
+    
+    def __init__(self, test, batch_size=None):
+        self.test = test
+        self.batch_size = batch_size or getattr(settings, 'WEBTESTER_RESULT_BATCH_SIZE', 1000)
+        self.pending = []
+        self.written = 0
+    
+    def write(self, results):
+        """Queue results for writing, flushing every batch_size rows"""
+        for result in results:
+            self.pending.append(self.build(result))
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+    
+    def flush(self):
+        """Write all queued rows"""
+        if self.pending:
+            TestResult.objects.bulk_create(self.pending, batch_size=self.batch_size)
+            self.written += len(self.pending)
+            self.pending = []
+    
+    def build(self, result):
+        """Build an unsaved TestResult from a result dict"""
+        # Convert cookies dict to JSON string
+        cookies_json = None
+        if result.get('cookies'):
+            try:
+                cookies_json = json.dumps(result['cookies'])
+            except (TypeError, ValueError):
+                pass
+        
+        return TestResult(
+            test=self.test,
+            timestamp=result.get('timestamp') or timezone.now(),
+            response_time=result.get('response_time'),
+            status_code=result.get('status_code'),
+            success=result.get('success', False),
+            error=truncate_message(result.get('error', ''), MAX_STORED_ERROR_LENGTH),
+            error_class=None if result.get('success', False) else classify_error(result),
+            user_agent=result.get('user_agent', ''),
+            virtual_user_id=result.get('virtual_user_id'),
+            cookies=cookies_json,
+            content_length=result.get('content_length'),
+            journey_step_id=result.get('journey_step_id'),
+            url=result.get('url'),
+            step_type=result.get('step_type'),
+            wait_time=result.get('wait_time'),
+            connect_time=result.get('connect_time'),
+            tls_time=result.get('tls_time'),
+            ttfb=result.get('ttfb'),
+            transfer_time=result.get('transfer_time'),
+            connection_reused=result.get('connection_reused'),
+            body_checksum=result.get('body_checksum'),
+            dom_content_loaded=result.get('dom_content_loaded'),
+            load_time=result.get('load_time'),
+            lcp=result.get('lcp')
+        )
+
 class TestTemplate(models.Model):
     """Model to store test templates that can be cloned by users"""
     name = models.CharField(max_length=100)
@@ -329,7 +604,9 @@ class TestTemplate(models.Model):
                             selector=step_data.get('selector', ''),
                             value=step_data.get('value', ''),
                             min_wait=step_data.get('min_wait', 1.0),
-                            max_wait=step_data.get('max_wait', 3.0)
+                            max_wait=step_data.get('max_wait', 3.0),
+                            wait_distribution=step_data.get('wait_distribution', 'uniform'),
+                            wait_samples=step_data.get('wait_samples')
                         )
                 except json.JSONDecodeError:
                     pass
@@ -0,0 +1,101 @@
+import functools
+import re
+import soupsieve
+from bs4 import BeautifulSoup
+
+# Journeys written before CSS selectors were supported use bare attribute
+# fragments such as id="next" or name='user'
+LEGACY_SELECTOR = re.compile(r'''^\s*([\w:-]+)\s*=\s*(["']?)([^"']*)\2\s*$''')
+
+# Input types a browser never sends as part of a form submission
+SKIPPED_INPUT_TYPES = {'submit', 'button', 'reset', 'image', 'file'}
+
+def normalize_selector(selector):
+    """Turn a legacy attribute fragment into a CSS attribute selector"""
+    match = LEGACY_SELECTOR.match(selector or '')
+    if match:
+        name, quote, value = match.groups()
+        escaped = value.replace('\\', '\\\\').replace('"', '\\"')
+        return f'[{name}="{escaped}"]'
+    return selector.strip()
+
+@functools.lru_cache(maxsize=1024)
+def compile_selector(selector):
+    """Compile a CSS selector once; raises soupsieve.SelectorSyntaxError if it is invalid"""
+    return soupsieve.compile(normalize_selector(selector))
+
+class ParsedPage:
+    """A response body parsed once and queried with compiled CSS selectors"""
+    
+    def __init__(self, content, url=None):
+        self.url = url
+        self.soup = BeautifulSoup(content or '', 'html.parser')
+    
+    def select_one(self, selector, default='*'):
+        """Get the first element matching a selector (or the default selector when blank)
+        
+        The selector can be a string or an already compiled selector.
+        """
+        if not isinstance(selector, soupsieve.SoupSieve):
+            selector = compile_selector(selector or default)
+        return selector.select_one(self.soup)
+    
+    def find_link(self, selector):
+        """Get the href of the link matching a selector, or of the link around or inside it"""
+        element = self.select_one(selector, 'a[href]')
+        if element is None:
+            return None
+        if element.get('href'):
+            return element['href']
+        link = element.find_parent('a', href=True) or element.find('a', href=True)
+        return link['href'] if link else None
+    
+    def find_form(self, selector):
+        """Get the form matching a selector, or the form around the matching element"""
+        element = self.select_one(selector, 'form')
+        if element is None or element.name == 'form':
+            return element
+        return element.find_parent('form') or element.find('form')
+    
+    def get_form_data(self, selector):
+        """Get the values a browser would submit for a form"""
+        form = self.find_form(selector)
+        if form is None:
+            return {}
+        
+        form_data = {}
+        for field in form.find_all(['input', 'select', 'textarea']):
+            name = field.get('name')
+            if not name or field.has_attr('disabled'):
+                continue
+            
+            if field.name == 'input':
+                field_type = field.get('type', 'text').lower()
+                if field_type in SKIPPED_INPUT_TYPES:
+                    continue
+                if field_type in ('checkbox', 'radio') and not field.has_attr('checked'):
+                    continue
+                default = 'on' if field_type in ('checkbox', 'radio') else ''
+                form_data[name] = field.get('value', default)
+            elif field.name == 'select':
+                option = field.find('option', selected=True) or field.find('option')
+                if option is not None:
+                    form_data[name] = option.get('value', option.get_text())
+            else:
+                form_data[name] = field.get_text()
+        
+        return form_data
+    
+    def get_form_target(self, selector):
+        """Get the action URL and method of a form (None action when there is no form)"""
+        form = self.find_form(selector)
+        if form is None:
+            return None, 'post'
+        return form.get('action') or None, (form.get('method') or 'get').lower()
+    
+    def get_field_name(self, selector):
+        """Get the name of the form field matching a selector"""
+        element = self.select_one(selector, 'input')
+        if element is not None:
+            return element.get('name')
+        return None
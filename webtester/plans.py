@@ -0,0 +1,268 @@
+import itertools
+import json
+import random
+from collections import namedtuple
+from types import MappingProxyType
+from .pages import LEGACY_SELECTOR, compile_selector
+from .feeders import PLACEHOLDER, render_placeholders
+from .assertions import AssertionSet
+from .thinktime import ThinkTime
+
+# Step types whose selector is matched against the current page
+SELECTOR_STEP_TYPES = ('click', 'input', 'submit')
+
+# Step types that load a new page
+NAVIGATING_STEP_TYPES = ('navigate', 'click', 'submit')
+
+# Methods that send the test's request body
+BODY_METHODS = ('POST', 'PUT')
+
+# Headers sent with a JSON body
+JSON_HEADERS = MappingProxyType({'Content-Type': 'application/json'})
+
+class RequestPlan(namedtuple('RequestPlan', [
+    'method', 'url', 'headers', 'body', 'session_headers', 'templated', 'assertions', 'think_time'
+])):
+    """The single request of a test, parsed and serialized once before it starts
+    
+    body is the encoded JSON body (or None), headers the read-only headers
+    sent with every request and session_headers the test's headers, set
+    once on each virtual user's session. A request with placeholders is
+    built again from the test for every iteration, and then sends the
+    filled-in test headers with each request instead. assertions are the
+    test's compiled response checks (None when it has none) and think_time
+    the ThinkTime drawn between requests.
+    """
+    __slots__ = ()
+    
+    @classmethod
+    def from_test(cls, test, values=None, assertions=None, think_time=None):
+        """Build the request of a LoadTest, filling its placeholders with feeder values
+        
+        Raises ValueError if the test's assertions or think time are invalid.
+        """
+        if assertions is None:
+            assertions = AssertionSet.parse(test.assertions)
+        if think_time is None:
+            try:
+                think_time = ThinkTime.parse(test.wait_distribution, test.min_wait, test.max_wait, test.wait_samples)
+            except ValueError as e:
+                raise ValueError(f"Invalid think time: {e}")
+        
+        templated = any(
+            PLACEHOLDER.search(text) for text in (test.target_url, test.headers, test.body) if text
+        )
+        
+        test_headers = {}
+        if test.headers:
+            try:
+                test_headers = json.loads(render_placeholders(test.headers, values))
+            except json.JSONDecodeError:
+                pass
+            if not isinstance(test_headers, dict):
+                test_headers = {}
+        
+        body = None
+        if test.body and test.http_method in BODY_METHODS:
+            text = render_placeholders(test.body, values)
+            try:
+                body = json.loads(text)
+            except json.JSONDecodeError:
+                # Sent as a JSON string, like the json= argument of requests would
+                body = text
+            body = json.dumps(body).encode('utf-8')
+        
+        # The test's own Content-Type wins over the JSON default
+        has_content_type = any(name.lower() == 'content-type' for name in test_headers)
+        headers = dict(JSON_HEADERS) if body is not None and not has_content_type else {}
+        if templated:
+            headers.update(test_headers)
+            test_headers = {}
+        
+        return cls(
+            test.http_method,
+            render_placeholders(test.target_url, values),
+            MappingProxyType(headers) if headers else None,
+            body,
+            MappingProxyType(test_headers),
+            templated,
+            assertions,
+            think_time
+        )
+    
+    def fill(self, test, values):
+        """Get the request for an iteration's feeder values (this plan when there are no placeholders)"""
+        if self.templated and values:
+            return self.from_test(test, values, self.assertions, self.think_time)
+        return self
+
+class StepPlan(namedtuple('StepPlan', [
+    'id', 'order', 'step_type', 'url', 'selector', 'value', 'min_wait', 'max_wait', 'matcher', 'field_name', 'keep_page',
+    'assertion_specs', 'assertions', 'think_time'
+])):
+    """Immutable copy of a JourneyStep with its selector, assertions and think time distribution already compiled"""
+    __slots__ = ()
+    
+    @classmethod
+    def build(cls, id, order, step_type, url=None, selector=None, value=None, min_wait=1.0, max_wait=3.0, keep_page=True,
+              assertions=None, journey_name='', wait_distribution='uniform', wait_samples=None):
+        """Create a step plan, compiling its selector, assertions and think time (raises ValueError if they are invalid)"""
+        matcher = None
+        field_name = None
+        if selector and step_type in SELECTOR_STEP_TYPES:
+            try:
+                matcher = compile_selector(selector)
+            except Exception as e:
+                raise ValueError(f"Invalid selector {selector!r} in step {order}: {e}")
+            
+            # Field name used when the input element is not on the page
+            legacy = LEGACY_SELECTOR.match(selector)
+            field_name = legacy.group(3) if legacy else selector
+        
+        try:
+            # Labelled by step so the failure counters of each step are kept apart
+            compiled = AssertionSet.parse(assertions, f"{journey_name} step {order}: ")
+        except ValueError as e:
+            raise ValueError(f"Invalid assertions in step {order}: {e}")
+        
+        try:
+            think_time = ThinkTime.parse(wait_distribution, min_wait, max_wait, wait_samples)
+        except ValueError as e:
+            raise ValueError(f"Invalid think time in step {order}: {e}")
+        
+        return cls(
+            id, order, step_type, url, selector, value, min_wait, max_wait, matcher, field_name, keep_page,
+            assertions, compiled, think_time
+        )
+    
+    @classmethod
+    def from_step(cls, step, journey_name=''):
+        """Create a step plan from a JourneyStep
+        
+        Steps saved before think times were validated may have a max wait
+        below their min wait. JourneyStepForm rejects those now; stored ones
+        get their max wait raised to the min wait instead of failing the test.
+        """
+        max_wait = max(step.max_wait, step.min_wait)
+        return cls.build(
+            step.id, step.order, step.step_type, step.url, step.selector, step.value, step.min_wait, max_wait,
+            assertions=step.assertions, journey_name=journey_name, wait_distribution=step.wait_distribution,
+            wait_samples=step.wait_samples
+        )
+    
+    def to_dict(self):
+        """Serialize the step plan (without the compiled selector)"""
+        return {
+            'id': self.id,
+            'order': self.order,
+            'step_type': self.step_type,
+            'url': self.url,
+            'selector': self.selector,
+            'value': self.value,
+            'min_wait': self.min_wait,
+            'max_wait': self.max_wait,
+            'wait_distribution': self.think_time.distribution,
+            'wait_samples': self.think_time.samples,
+            'assertions': self.assertion_specs,
+        }
+    
+    @classmethod
+    def from_dict(cls, data, journey_name=''):
+        """Rebuild a step plan from to_dict() output"""
+        return cls.build(journey_name=journey_name, **data)
+
+def mark_kept_pages(steps, keep_last=False):
+    """Keep the response of a navigating step only when a later step reads the page
+    
+    keep_last keeps the page left at the end of the journey. Returns the
+    marked steps and whether the journey reads a page before loading one.
+    """
+    marked = []
+    needs_page = keep_last
+    for step in reversed(steps):
+        if step.step_type in NAVIGATING_STEP_TYPES:
+            step = step._replace(keep_page=needs_page)
+            needs_page = False
+        if step.step_type in SELECTOR_STEP_TYPES:
+            needs_page = True
+        marked.append(step)
+    return tuple(reversed(marked)), needs_page
+
+class JourneyPlan(namedtuple('JourneyPlan', ['id', 'name', 'base_url', 'weight', 'steps', 'pacing'])):
+    """Immutable copy of a UserJourney and its ordered steps"""
+    __slots__ = ()
+    
+    @classmethod
+    def from_journey(cls, journey):
+        """Create a journey plan from a UserJourney"""
+        try:
+            steps = tuple(StepPlan.from_step(step, journey.name) for step in sorted(journey.steps.all(), key=lambda step: step.order))
+        except ValueError as e:
+            raise ValueError(f"Journey {journey.name!r}: {e}")
+        return cls(journey.id, journey.name, journey.base_url, journey.weight, steps, journey.pacing)
+    
+    def to_dict(self):
+        """Serialize the journey plan"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'base_url': self.base_url,
+            'weight': self.weight,
+            'steps': [step.to_dict() for step in self.steps],
+            'pacing': self.pacing,
+        }
+    
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a journey plan from to_dict() output"""
+        steps = tuple(StepPlan.from_dict(step, data['name']) for step in data['steps'])
+        return cls(data['id'], data['name'], data['base_url'], data['weight'], steps, data.get('pacing'))
+
+class JourneyPlans:
+    """The journeys of a test, loaded once before it starts and picked by weight
+    
+    Engines only read these plans while a test runs, so no database query
+    is made from inside the measured window.
+    """
+    
+    def __init__(self, journeys=()):
+        # Journeys with no weight are never picked
+        journeys = [journey for journey in journeys if journey.weight > 0]
+        
+        # A journey that starts on the page left by the previous iteration
+        # needs every iteration to keep its last page
+        self.reads_previous_page = any(mark_kept_pages(journey.steps)[1] for journey in journeys)
+        self.journeys = tuple(
+            journey._replace(steps=mark_kept_pages(journey.steps, self.reads_previous_page)[0])
+            for journey in journeys
+        )
+        self.cum_weights = list(itertools.accumulate(journey.weight for journey in self.journeys))
+    
+    def __bool__(self):
+        return bool(self.journeys)
+    
+    def __len__(self):
+        return len(self.journeys)
+    
+    @classmethod
+    def for_test(cls, test):
+        """Load the journeys of a LoadTest (the main journey and the additional ones)"""
+        journeys = list(test.journeys.prefetch_related('steps'))
+        if test.journey_id and all(journey.id != test.journey_id for journey in journeys):
+            journeys.insert(0, test.journey)
+        return cls(JourneyPlan.from_journey(journey) for journey in journeys)
+    
+    def choose(self):
+        """Pick a journey at random, in proportion to the journey weights"""
+        if not self.journeys:
+            return None
+        return random.choices(self.journeys, cum_weights=self.cum_weights)[0]
+    
+    def to_dict(self):
+        """Serialize the plans so they can be sent to another process"""
+        return {'journeys': [journey.to_dict() for journey in self.journeys]}
+    
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild the plans from to_dict() output"""
+        return cls(JourneyPlan.from_dict(journey) for journey in data.get('journeys', []))
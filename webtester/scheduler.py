@@ -0,0 +1,96 @@
+import math
+import time
+
+# Sleeping can overshoot by a fraction of a millisecond, so the last stretch
+# before a deadline is spent spinning on the clock instead
+SPIN_THRESHOLD = 0.0005
+
+class ArrivalSchedule:
+    """Intended arrival times for a piecewise-linear arrival rate
+    
+    The rate is given as (offset, rate) points in seconds and arrivals per
+    second, and changes linearly between them. Arrival k is due when the
+    integral of the rate since the start reaches k, so ramps are smooth
+    instead of stepping once per second.
+    """
+    
+    def __init__(self, points):
+        self.points = list(points)
+        self.duration = self.points[-1][0] if self.points else 0
+        
+        # Cumulative arrivals at the start of each segment
+        self.segments = []
+        total = 0.0
+        for (start, start_rate), (end, end_rate) in zip(self.points, self.points[1:]):
+            self.segments.append((start, end, start_rate, end_rate, total))
+            total += (start_rate + end_rate) / 2 * (end - start)
+        self.total = total
+    
+    def arrival_time(self, index):
+        """Get the offset in seconds at which arrival number index is due"""
+        for start, end, start_rate, end_rate, before in self.segments:
+            segment_arrivals = (start_rate + end_rate) / 2 * (end - start)
+            if index >= before + segment_arrivals:
+                continue
+            
+            # Solve start_rate * t + slope * t^2 / 2 = index - before for t
+            remaining = index - before
+            slope = (end_rate - start_rate) / (end - start)
+            if abs(slope) < 1e-12:
+                return start + remaining / start_rate
+            discriminant = start_rate * start_rate + 2 * slope * remaining
+            return start + (math.sqrt(max(0.0, discriminant)) - start_rate) / slope
+        return None
+    
+    def __iter__(self):
+        """Yield (index, offset) for every arrival in the schedule"""
+        index = 0
+        while index < self.total:
+            offset = self.arrival_time(index)
+            if offset is None:
+                break
+            yield index, offset
+            index += 1
+
+class UserSchedule:
+    """Start and stop times of virtual users for a piecewise-linear user count
+    
+    The count is given as (offset, users) points. User number i runs while
+    the count is above i, so a ramp up starts users one at a time at the
+    moment the count reaches them, and a ramp down retires the most recently
+    started users first.
+    """
+    
+    def __init__(self, points):
+        self.points = list(points)
+        self.peak = math.ceil(max((users for offset, users in self.points), default=0))
+        
+        # (offset, user_id, start) events in time order
+        self.events = []
+        for (start, start_users), (end, end_users) in zip(self.points, self.points[1:]):
+            if end_users > start_users:
+                user_ids = range(math.ceil(start_users), math.ceil(end_users))
+            else:
+                user_ids = range(math.ceil(end_users), math.ceil(start_users))
+            for user_id in user_ids:
+                offset = start + (user_id - start_users) / (end_users - start_users) * (end - start)
+                self.events.append((offset, user_id, end_users > start_users))
+        self.events.sort(key=lambda event: event[0])
+
+def sleep_until(deadline, stop_event=None):
+    """Sleep until a time.time() deadline with sub-millisecond accuracy
+    
+    Returns False if the stop event was set while waiting.
+    """
+    while True:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        if remaining > SPIN_THRESHOLD:
+            sleep_for = remaining - SPIN_THRESHOLD
+            if stop_event is not None:
+                if stop_event.wait(sleep_for):
+                    return False
+            else:
+                time.sleep(sleep_for)
+    return stop_event is None or not stop_event.is_set()
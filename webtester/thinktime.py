@@ -0,0 +1,77 @@
+import json
+import math
+import random
+
+# z-score of the 95th percentile of a normal distribution
+Z95 = 1.6449
+
+# Recorded think times kept per step for the replay distribution
+MAX_REPLAY_SAMPLES = 1000
+
+def parse_samples(samples):
+    """Parse recorded think times (a JSON list of seconds); raises ValueError if they are invalid"""
+    if isinstance(samples, str):
+        try:
+            samples = json.loads(samples)
+        except json.JSONDecodeError:
+            raise ValueError("Recorded think times must be a JSON list of seconds")
+    if not isinstance(samples, list) or not samples:
+        raise ValueError("Recorded think times must be a non-empty list of seconds")
+    if len(samples) > MAX_REPLAY_SAMPLES:
+        raise ValueError(f"At most {MAX_REPLAY_SAMPLES} recorded think times can be replayed")
+    try:
+        parsed = [float(sample) for sample in samples]
+    except (TypeError, ValueError):
+        raise ValueError("Recorded think times must be numbers of seconds")
+    if any(sample < 0 or math.isnan(sample) for sample in parsed):
+        raise ValueError("Recorded think times cannot be negative")
+    return parsed
+
+class ThinkTime:
+    """Distribution of the think time before a journey step
+    
+    uniform draws between min_wait and max_wait. exponential starts at
+    min_wait and has max_wait as its 95th percentile, like users who are
+    equally likely to move on at any moment. lognormal has min_wait and
+    max_wait as its 5th and 95th percentiles, with the long tail of reading
+    times. replay picks one of the recorded samples at random.
+    """
+    
+    DISTRIBUTIONS = ('uniform', 'exponential', 'lognormal', 'replay')
+    
+    def __init__(self, distribution='uniform', min_wait=1.0, max_wait=3.0, samples=None):
+        self.distribution = distribution
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+        self.samples = samples
+        
+        if distribution == 'exponential' and max_wait > min_wait:
+            self.rate = math.log(20) / (max_wait - min_wait)
+        elif distribution == 'lognormal' and max_wait > min_wait:
+            self.mu = (math.log(min_wait) + math.log(max_wait)) / 2
+            self.sigma = (math.log(max_wait) - math.log(min_wait)) / (2 * Z95)
+    
+    @classmethod
+    def parse(cls, distribution, min_wait, max_wait, samples=None):
+        """Build a think time distribution from step settings; raises ValueError if they are invalid"""
+        distribution = distribution or 'uniform'
+        if distribution not in cls.DISTRIBUTIONS:
+            raise ValueError(f"Unknown think time distribution: {distribution}")
+        if min_wait < 0 or max_wait < min_wait:
+            raise ValueError("Max wait must be at least min wait, and neither can be negative")
+        if distribution == 'lognormal' and min_wait <= 0:
+            raise ValueError("A log-normal think time needs a min wait above 0")
+        parsed = parse_samples(samples) if distribution == 'replay' else None
+        return cls(distribution, min_wait, max_wait, parsed)
+    
+    def sample(self):
+        """Draw a think time in seconds"""
+        if self.distribution == 'replay':
+            return random.choice(self.samples)
+        if self.max_wait <= self.min_wait:
+            return self.min_wait
+        if self.distribution == 'exponential':
+            return self.min_wait + random.expovariate(self.rate)
+        if self.distribution == 'lognormal':
+            return random.lognormvariate(self.mu, self.sigma)
+        return random.uniform(self.min_wait, self.max_wait)
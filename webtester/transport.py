@@ -0,0 +1,154 @@
+import time
+import zlib
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# Default connections kept per host when a test does not set a pool size
+DEFAULT_POOL_SIZE = 10
+
+# Bytes read at a time from response bodies that are not kept
+BODY_CHUNK_SIZE = 64 * 1024
+
+class TimedConnectionMixin:
+    """Records connect, TLS and time-to-first-byte timings on urllib3 connections
+    
+    The timings of every response are attached to it as a phases dict:
+    connect (TCP, including the DNS lookup), tls, ttfb, the perf_counter()
+    time the headers arrived and whether the connection was reused.
+    """
+    
+    is_tls = False
+    pending_phases = None
+    request_started = 0.0
+    connected_at = 0.0
+    
+    def _new_conn(self):
+        started = time.perf_counter()
+        sock = super()._new_conn()
+        self.tcp_time = time.perf_counter() - started
+        return sock
+    
+    def connect(self):
+        started = time.perf_counter()
+        self.tcp_time = 0.0
+        super().connect()
+        self.connected_at = time.perf_counter()
+        
+        # Whatever connect() did after opening the socket is the TLS handshake
+        self.pending_phases = {
+            'connect': self.tcp_time,
+            'tls': self.connected_at - started - self.tcp_time if self.is_tls else None,
+        }
+    
+    def request(self, *args, **kwargs):
+        self.request_started = time.perf_counter()
+        return super().request(*args, **kwargs)
+    
+    def getresponse(self, *args, **kwargs):
+        response = super().getresponse(*args, **kwargs)
+        headers_at = time.perf_counter()
+        
+        phases = self.pending_phases
+        self.pending_phases = None
+        ttfb = headers_at - self.request_started
+        
+        if phases is None:
+            phases = {'connect': 0.0, 'tls': None, 'reused': True}
+        else:
+            phases['reused'] = False
+            # Plain HTTP connections are opened while the request is sent
+            if self.connected_at > self.request_started:
+                ttfb -= self.connected_at - self.request_started
+        
+        phases.update(ttfb=max(0.0, ttfb), headers_at=headers_at)
+        response.phases = phases
+        return response
+
+class TimedHTTPConnection(TimedConnectionMixin, HTTPConnection):
+    """HTTP connection with phase timings"""
+
+class TimedHTTPSConnection(TimedConnectionMixin, HTTPSConnection):
+    """HTTPS connection with phase timings"""
+    is_tls = True
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """Requests adapter whose connections record phase timings"""
+    
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimedHTTPConnectionPool,
+            'https': TimedHTTPSConnectionPool,
+        }
+
+class BodyCounter:
+    """Counts the bytes of a streamed response body, and optionally checksums them (CRC-32)"""
+    
+    def __init__(self, checksum=False):
+        self.length = 0
+        self.checksum = 0 if checksum else None
+    
+    def update(self, chunk):
+        self.length += len(chunk)
+        if self.checksum is not None:
+            self.checksum = zlib.crc32(chunk, self.checksum)
+    
+    def result(self):
+        """Get the content_length (and body_checksum) fields of a result"""
+        result = {'content_length': self.length}
+        if self.checksum is not None:
+            result['body_checksum'] = f'{self.checksum:08x}'
+        return result
+
+def build_adapter(pool_size=None):
+    """Create an adapter keeping up to pool_size connections per host"""
+    pool_size = pool_size or DEFAULT_POOL_SIZE
+    return TimedHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+
+def get_phase_timings(response, finished_at=None):
+    """Get the connect, TLS, TTFB and transfer timings of a requests response
+    
+    Redirects are included: their timings are added up. finished_at is the
+    perf_counter() time the body was read, which ends the transfer phase.
+    """
+    if finished_at is None:
+        finished_at = time.perf_counter()
+    
+    timings = {
+        'connect_time': 0.0,
+        'tls_time': None,
+        'ttfb': 0.0,
+        'transfer_time': 0.0,
+        'connection_reused': None,
+    }
+    
+    responses = list(response.history) + [response]
+    for index, current in enumerate(responses):
+        phases = getattr(current.raw, 'phases', None)
+        if phases is None:
+            # Not sent through a timed connection (e.g. through a proxy)
+            return {}
+        
+        # A redirect's transfer ends when the next request starts
+        if index + 1 < len(responses):
+            next_phases = getattr(responses[index + 1].raw, 'phases', None) or {}
+            ended_at = next_phases.get('headers_at', finished_at) - next_phases.get('ttfb', 0.0)
+        else:
+            ended_at = finished_at
+        
+        timings['connect_time'] += phases['connect']
+        if phases['tls'] is not None:
+            timings['tls_time'] = (timings['tls_time'] or 0.0) + phases['tls']
+        timings['ttfb'] += phases['ttfb']
+        timings['transfer_time'] += max(0.0, ended_at - phases['headers_at'])
+    
+    # Whether the final request went over an already open connection
+    timings['connection_reused'] = responses[-1].raw.phases['reused']
+    return timings
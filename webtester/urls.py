@@ -9,10 +9,16 @@ urlpatterns = [
     path('test/<int:pk>/', views.test_detail, name='detail'),
     path('test/<int:pk>/edit/', views.edit_test, name='edit'),
     path('test/<int:pk>/run/', views.run_test, name='run'),
+    path('test/<int:pk>/cancel/', views.cancel_test, name='cancel'),
     path('test/<int:pk>/delete/', views.delete_test, name='delete'),
     path('test/<int:pk>/status/', views.test_status, name='status'),
+    path('test/<int:pk>/metrics/', views.test_metrics, name='metrics'),
     path('test/<int:pk>/clone/', views.clone_test, name='clone'),
+    path('test/<int:pk>/compare/', views.compare_test, name='compare'),
+    path('test/<int:pk>/export/<str:export_format>/', views.export_results, name='export_results'),
     path('test/<int:pk>/make-public/', views.make_public_template, name='make_public_template'),
+    path('test/<int:pk>/feeders/add/', views.add_feeder, name='add_feeder'),
+    path('test/<int:pk>/feeders/<int:feeder_pk>/delete/', views.delete_feeder, name='delete_feeder'),
     
     # User Journey URLs
     path('journeys/', views.journey_list, name='journey_list'),
@@ -1,15 +1,25 @@
 import time
 import requests
 import concurrent.futures
+import multiprocessing
+import queue
 import threading
-import json
-import statistics
 import random
-import re
 from datetime import datetime
 import logging
+from django.conf import settings
+from django.db import connection, connections, transaction
 from django.utils import timezone
 from urllib.parse import urljoin
+from .metrics import ResultAggregator, ShardedAggregator, ShardedCounter
+from .scheduler import ArrivalSchedule, UserSchedule, sleep_until
+from .transport import BODY_CHUNK_SIZE, BodyCounter, build_adapter, get_phase_timings
+from .pages import ParsedPage
+from .plans import JourneyPlans, RequestPlan
+from .feeders import FeederSet, render_placeholders
+from .assertions import AssertionSet
+from .thinktime import ThinkTime
+from .errors import classify_exception
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -30,6 +40,25 @@ USER_AGENTS = [
     'Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Mobile Safari/537.36',
 ]
 
+# Seconds given to worker processes to import Django and load the test
+# before the shared test clock starts
+WORKER_STARTUP_DELAY = 3
+
+# How often worker processes stream their results to the coordinator
+WORKER_FLUSH_INTERVAL = 0.5
+
+# How often live per-second metrics are stored while a test runs, and how
+# many of the latest seconds are kept open for results still in transit
+METRICS_FLUSH_INTERVAL = 1
+METRICS_FLUSH_LAG = 2
+
+# How often the drain checks whether the last in-flight requests have finished
+DRAIN_POLL_INTERVAL = 0.05
+
+def get_drain_timeout():
+    """Seconds in-flight requests are given to finish once a test stops"""
+    return getattr(settings, 'WEBTESTER_DRAIN_TIMEOUT', 10)
+
 # Human-like behavior patterns
 READING_TIMES = {
     'short': (2, 5),      # Short content (e.g., product listing)
@@ -37,109 +66,196 @@ READING_TIMES = {
     'long': (15, 60)      # Long content (e.g., article, blog post)
 }
 
-class VirtualUser:
-    """Class representing a virtual user with its own session and state"""
+class BaseVirtualUser:
+    """Engine-independent state and page helpers shared by all virtual users"""
     
-    def __init__(self, user_id):
+    def __init__(self, user_id, stopped=None):
         self.user_id = user_id
-        self.session = requests.Session()
+        self.stopped = stopped  # Event set when the user is retired or the test stops
         self.user_agent = random.choice(USER_AGENTS)
-        self.session.headers.update({'User-Agent': self.user_agent})
         self.cookies = {}
         self.last_page = None
         self.last_request_time = None
         self.page_content = None
         self.current_url = None
         self.journey_state = {}  # Store state for the journey (e.g., extracted values)
+        self.parsed_page = None  # Parse of page_content, built on first use
+        self.parsed_page_source = None
+        self.feed_values = {}  # Feeder values of the current iteration
+        self.body_mode = 'keep'  # What to do with the bodies of pages that are not kept
+        self.paced_until = None  # When the next iteration of a paced journey may start
     
-    def wait_realistic_time(self, content_type='medium'):
-        """Wait a realistic amount of time based on content type"""
+    def is_stopped(self):
+        """Check whether the user has been retired or the test has stopped"""
+        return self.stopped is not None and self.stopped.is_set()
+    
+    def start_paced_iteration(self, journey, intended_time=None):
+        """Start the pacing clock of a journey with a fixed cycle time (not in the open model, whose arrivals are scheduled)"""
+        if journey.pacing and intended_time is None:
+            self.paced_until = time.time() + journey.pacing
+    
+    def get_pacing_wait(self):
+        """Get how long to wait before the next iteration so paced journeys keep their cycle time"""
+        paced_until, self.paced_until = self.paced_until, None
+        if paced_until is None:
+            return 0
+        return max(0, paced_until - time.time())
+    
+    def get_realistic_wait_time(self, think_time=None):
+        """Work out how long to wait before the next request (without waiting)
+        
+        The think time is drawn from think_time (a ThinkTime), by default
+        uniformly over the reading time of medium content.
+        """
         # If this is the first request, don't wait
         if self.last_request_time is None:
             self.last_request_time = time.time()
             return 0
         
+        if think_time is None:
+            think_time = ThinkTime('uniform', *READING_TIMES['medium'])
+        
         # Calculate time since last request
         time_since_last = time.time() - self.last_request_time
         
-        # Get reading time range based on content type
-        min_time, max_time = READING_TIMES.get(content_type, READING_TIMES['medium'])
+        # Wait the rest of a think time drawn from the distribution
+        wait_time = think_time.sample() - time_since_last
         
         # If we've already waited enough, don't wait more
-        if time_since_last >= min_time:
+        if wait_time <= 0:
             self.last_request_time = time.time()
             return 0
+        return wait_time
+    
+    def resolve_url(self, url, base_url=None):
+        """Resolve a possibly relative URL against the base URL"""
+        if base_url and not url.startswith(('http://', 'https://')):
+            return urljoin(base_url, url)
+        return url
+    
+    def get_page(self):
+        """Get the current page parsed once, shared by every step that uses it"""
+        if self.parsed_page is None or self.parsed_page_source is not self.page_content:
+            self.parsed_page = ParsedPage(self.page_content, self.current_url)
+            self.parsed_page_source = self.page_content
+        return self.parsed_page
+    
+    def extract_form_data(self, form_selector):
+        """Extract form data from the current page"""
+        if not self.page_content:
+            return {}
+        return self.get_page().get_form_data(form_selector)
+    
+    def get_form_target(self, form_selector):
+        """Find the action URL and method of a form on the current page"""
+        action, method = self.get_page().get_form_target(form_selector)
         
-        # Wait a random amount of time
-        wait_time = random.uniform(min_time, max_time) - time_since_last
+        # A form without an action submits to the current page
+        if action:
+            action = urljoin(self.current_url, action)
+        else:
+            action = self.current_url
+        
+        return action, method
+    
+    def find_link(self, selector):
+        """Find the href of a link matching the selector on the current page"""
+        return self.get_page().find_link(selector)
+    
+    def get_field_name(self, selector, default=None):
+        """Get the name of the input field matching the selector on the current page"""
+        return self.get_page().get_field_name(selector) or default
+
+class VirtualUser(BaseVirtualUser):
+    """Class representing a virtual user with its own session and state"""
+    
+    def __init__(self, user_id, stopped=None, adapter=None, keep_alive=True):
+        super().__init__(user_id, stopped)
+        self.session = requests.Session()
+        self.session.headers.update({'User-Agent': self.user_agent})
+        
+        # Connections come from the given adapter's pool (shared or this user's own)
+        adapter = adapter or build_adapter()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+    
+    def get_cookies(self):
+        """Get the current session cookies as a dictionary"""
+        return dict(self.session.cookies)
+    
+    def sleep(self, seconds):
+        """Sleep for a think time; return False if the user was stopped meanwhile"""
+        if self.stopped is None:
+            time.sleep(seconds)
+            return True
+        return not self.stopped.wait(seconds)
+    
+    def wait_realistic_time(self, think_time=None):
+        """Wait a realistic amount of time, drawn from think_time (a ThinkTime) if given"""
+        wait_time = self.get_realistic_wait_time(think_time)
         if wait_time > 0:
-            time.sleep(wait_time)
+            self.sleep(wait_time)
         
         self.last_request_time = time.time()
         return wait_time
     
-    def navigate_to(self, url, base_url=None):
-        """Navigate to a URL"""
-        # Handle relative URLs
-        if base_url and not url.startswith(('http://', 'https://')):
-            full_url = urljoin(base_url, url)
-        else:
-            full_url = url
+    def read_body(self, response, keep_page=True, check=None):
+        """Read a streamed response body, decoding it into page_content only when the page is kept
+        
+        check is the response's AssertionCheck, fed the raw body as it arrives.
+        """
+        try:
+            if keep_page or self.body_mode == 'keep':
+                self.page_content = response.text
+                if check is not None:
+                    check.feed(response.content)
+                return {'content_length': len(response.content)}
+            
+            counter = BodyCounter(checksum=self.body_mode == 'checksum')
+            for chunk in response.iter_content(BODY_CHUNK_SIZE):
+                counter.update(chunk)
+                if check is not None:
+                    check.feed(chunk)
+            self.page_content = None
+            return counter.result()
+        finally:
+            response.close()
+    
+    def navigate_to(self, url, base_url=None, keep_page=True, assertions=None, lag=None):
+        """Navigate to a URL, checking the response against an AssertionSet if given (see AssertionSet.start for lag)"""
+        full_url = self.resolve_url(url, base_url)
         
         try:
             start_time = time.time()
-            response = self.session.get(full_url, timeout=30)
+            response = self.session.get(full_url, timeout=30, stream=True)
+            check = assertions.start(response.status_code, response.headers, lag) if assertions else None
+            body = self.read_body(response, keep_page, check)
             end_time = time.time()
+            phases = get_phase_timings(response)
             
             self.current_url = full_url
-            self.page_content = response.text
             
-            return {
+            result = {
                 'success': 200 <= response.status_code < 400,
                 'status_code': response.status_code,
                 'response_time': end_time - start_time,
-                'content_length': len(response.content),
-                'url': full_url
+                'url': full_url,
+                **body,
+                **phases
             }
+            return check.finish(result) if check else result
         except requests.RequestException as e:
             return {
                 'success': False,
                 'error': str(e),
+                'error_class': classify_exception(e),
                 'url': full_url
             }
     
-    def extract_form_data(self, form_selector):
-        """Extract form data from the current page"""
-        # This is a simplified version - in a real implementation, you'd use a proper HTML parser
-        if not self.page_content:
-            return {}
-        
-        # Simple regex to find input fields in a form
-        # This is just a basic example - a real implementation would be more robust
-        form_data = {}
-        
-        # Find the form
-        form_pattern = f'<form[^>]*{form_selector}[^>]*>(.*?)</form>'
-        form_match = re.search(form_pattern, self.page_content, re.DOTALL | re.IGNORECASE)
-        
-        if not form_match:
-            return {}
-        
-        form_content = form_match.group(1)
-        
-        # Find input fields
-        input_pattern = r'<input[^>]*name=["\']([^"\']+)["\'][^>]*(?:value=["\']([^"\']*)["\'])?[^>]*>'
-        input_matches = re.finditer(input_pattern, form_content, re.DOTALL | re.IGNORECASE)
-        
-        for match in input_matches:
-            name = match.group(1)
-            value = match.group(2) or ''
-            form_data[name] = value
-        
-        return form_data
-    
-    def submit_form(self, form_selector, extra_data=None):
-        """Submit a form on the current page"""
+    def submit_form(self, form_selector, extra_data=None, keep_page=True, assertions=None, lag=None):
+        """Submit a form on the current page, checking the response against an AssertionSet if given (see AssertionSet.start for lag)"""
         if not self.page_content or not self.current_url:
             return {
                 'success': False,
@@ -155,46 +271,37 @@ class VirtualUser:
             form_data.update(extra_data)
         
         # Find form action and method
-        form_pattern = f'<form[^>]*{form_selector}[^>]*action=["\']([^"\']+)["\'][^>]*(?:method=["\']([^"\']+)["\'])?[^>]*>'
-        form_match = re.search(form_pattern, self.page_content, re.DOTALL | re.IGNORECASE)
-        
-        if form_match:
-            action = form_match.group(1)
-            method = form_match.group(2) or 'get'
-        else:
-            action = ''
-            method = 'post'
-        
-        # Handle relative URLs
-        if action and not action.startswith(('http://', 'https://')):
-            action = urljoin(self.current_url, action)
-        else:
-            action = self.current_url
+        action, method = self.get_form_target(form_selector)
         
         try:
             start_time = time.time()
             
             if method.lower() == 'get':
-                response = self.session.get(action, params=form_data, timeout=30)
+                response = self.session.get(action, params=form_data, timeout=30, stream=True)
             else:
-                response = self.session.post(action, data=form_data, timeout=30)
+                response = self.session.post(action, data=form_data, timeout=30, stream=True)
             
+            check = assertions.start(response.status_code, response.headers, lag) if assertions else None
+            body = self.read_body(response, keep_page, check)
             end_time = time.time()
+            phases = get_phase_timings(response)
             
             self.current_url = response.url
-            self.page_content = response.text
             
-            return {
+            result = {
                 'success': 200 <= response.status_code < 400,
                 'status_code': response.status_code,
                 'response_time': end_time - start_time,
-                'content_length': len(response.content),
-                'url': response.url
+                'url': response.url,
+                **body,
+                **phases
             }
+            return check.finish(result) if check else result
         except requests.RequestException as e:
             return {
                 'success': False,
                 'error': str(e),
+                'error_class': classify_exception(e),
                 'url': action
             }
 
@@ -204,38 +311,61 @@ class LoadTester:
     def __init__(self, test_instance):
         """Initialize with a LoadTest instance"""
         self.test = test_instance
-        self.results = []
+        self.collector = ShardedAggregator(keep_raw=test_instance.keep_raw_results)
+        self.started_at = None
+        self.finished_at = None
+        self.worker_active_users = {}  # Active users reported by each worker process
         self.stop_event = threading.Event()
-        self.active_users = 0
-        self.user_counter = 0
+        self.stopped_early = False  # Set when the test is stopped before its planned end
+        self.active_users = ShardedCounter()
+        self.user_counter = ShardedCounter()
         self.virtual_users = {}  # Dictionary to store VirtualUser objects
+        self.shared_adapter = None  # Connection pool shared by all users, if configured
+        self.journey_plans = None  # Journeys and steps, loaded once before the test starts
+        self.feeders = FeederSet()  # Data files filling the request placeholders
+        self.request_plan = None  # Parsed request of simple tests, built once per test
+        self.step_assertions = {}  # Assertions checked on each journey step, by step ID
+        self.browser_pool = None  # Headless browsers of browser journey tests
     
-    def make_request(self, virtual_user):
-        """Make a single request to the target URL using a virtual user's session"""
-        # Get headers from test configuration
-        headers = {}
-        if self.test.headers:
-            try:
-                headers = json.loads(self.test.headers)
-            except json.JSONDecodeError:
-                pass
-        
-        # Apply headers to the session
-        for key, value in headers.items():
-            virtual_user.session.headers[key] = value
-        
-        # Prepare request body
-        body = None
-        if self.test.body and self.test.http_method in ['POST', 'PUT']:
-            try:
-                body = json.loads(self.test.body)
-            except json.JSONDecodeError:
-                body = self.test.body
-        
-        # Wait a realistic amount of time before making the request
-        wait_time = virtual_user.wait_realistic_time()
-        
-        # Prepare result object
+    def load_plans(self):
+        """Load the test's journeys into memory so the engine never queries them while running"""
+        if self.journey_plans is None:
+            self.journey_plans = JourneyPlans.for_test(self.test)
+            self.feeders = FeederSet.for_test(self.test)
+            self.feeders.check_users(self.test.num_users)
+            self.get_request_plan()
+        return self.journey_plans
+    
+    def new_virtual_user(self, user_id, stopped=None):
+        """Create a thread engine virtual user with the configured connection pool"""
+        if self.test.connection_pool == 'shared':
+            if self.shared_adapter is None:
+                # One pool for every user in this process, sized for all of them by default
+                self.shared_adapter = build_adapter(self.test.pool_size or self.test.num_users)
+            adapter = self.shared_adapter
+        else:
+            adapter = build_adapter(self.test.pool_size)
+        virtual_user = VirtualUser(user_id, stopped, adapter, self.test.keep_alive)
+        virtual_user.session.headers.update(self.get_request_plan().session_headers)
+        virtual_user.body_mode = self.test.body_mode
+        return virtual_user
+    
+    def get_request_plan(self, values=None):
+        """Get the pre-built request for an iteration's feeder values"""
+        if self.request_plan is None:
+            self.request_plan = RequestPlan.from_test(self.test)
+        return self.request_plan.fill(self.test, values)
+    
+    def get_step_assertions(self, step):
+        """Get the assertions checked on a journey step: the test's, followed by the step's own"""
+        assertions = self.step_assertions.get(step.id)
+        if assertions is None:
+            assertions = AssertionSet.merge(self.get_request_plan().assertions, step.assertions)
+            self.step_assertions[step.id] = assertions
+        return assertions
+    
+    def new_result(self, virtual_user, wait_time, **extra):
+        """Build the base result object for a request made by a virtual user"""
         result = {
             'timestamp': timezone.now(),
             'success': False,
@@ -243,102 +373,128 @@ class LoadTester:
             'status_code': None,
             'response_time': None,
             'user_agent': virtual_user.user_agent,
-            'cookies': dict(virtual_user.session.cookies),
             'virtual_user_id': virtual_user.user_id,
             'wait_time': wait_time
         }
+        # Copying the cookies is only worth it when raw results are stored
+        if self.collector.keep_raw:
+            result['cookies'] = virtual_user.get_cookies()
+        result.update(extra)
+        return result
+    
+    def get_schedule_lag(self, intended_time):
+        """Get how late a scheduled arrival is being sent (None outside the open model)"""
+        if intended_time is None:
+            return None
+        return max(0.0, time.time() - intended_time)
+    
+    def apply_schedule_lag(self, result, lag):
+        """Measure a result from its intended send time instead of the actual one"""
+        if lag is None:
+            return
+        result['schedule_lag'] = lag
+        # Time spent waiting for a free virtual user is part of the latency
+        if result.get('response_time') is not None:
+            result['response_time'] += lag
+    
+    def make_request(self, virtual_user, intended_time=None):
+        """Make a single request to the target URL using a virtual user's session"""
+        # Fill the placeholders with this iteration's feeder values
+        request = self.get_request_plan(virtual_user.feed_values)
+        url = request.url
+        
+        # Wait a realistic amount of time before making the request, unless
+        # the arrival schedule decides when it is sent
+        if intended_time is None:
+            wait_time = virtual_user.wait_realistic_time(request.think_time)
+            if virtual_user.is_stopped():
+                return None
+        else:
+            wait_time = 0
+        
+        # Prepare result object
+        result = self.new_result(virtual_user, wait_time)
+        lag = self.get_schedule_lag(intended_time)
         
         try:
             # Make the request
             start_time = time.time()
             
-            if self.test.http_method == 'GET':
-                response = virtual_user.session.get(
-                    self.test.target_url,
-                    timeout=30
-                )
-            elif self.test.http_method == 'POST':
-                response = virtual_user.session.post(
-                    self.test.target_url,
-                    json=body,
-                    timeout=30
-                )
-            elif self.test.http_method == 'PUT':
-                response = virtual_user.session.put(
-                    self.test.target_url,
-                    json=body,
-                    timeout=30
-                )
-            elif self.test.http_method == 'DELETE':
-                response = virtual_user.session.delete(
-                    self.test.target_url,
-                    timeout=30
-                )
-            else:
-                # Fallback to generic request method
-                response = virtual_user.session.request(
-                    method=self.test.http_method,
-                    url=self.test.target_url,
-                    json=body if self.test.http_method in ['POST', 'PUT'] else None,
-                    timeout=30
-                )
+            response = virtual_user.session.request(
+                request.method,
+                url,
+                data=request.body,
+                headers=request.headers,
+                timeout=30,
+                stream=True
+            )
             
+            assertions = request.assertions
+            check = assertions.start(response.status_code, response.headers, lag) if assertions else None
+            
+            # Only a journey that starts on the current page needs it
+            body = virtual_user.read_body(response, self.journey_plans.reads_previous_page, check)
             end_time = time.time()
             response_time = end_time - start_time
+            phases = get_phase_timings(response)
             
             # Update virtual user's state
-            virtual_user.last_page = self.test.target_url
+            virtual_user.last_page = url
             virtual_user.cookies = dict(virtual_user.session.cookies)
-            virtual_user.page_content = response.text
-            virtual_user.current_url = self.test.target_url
+            virtual_user.current_url = url
             
             # Update result
             result.update({
                 'success': 200 <= response.status_code < 400,
                 'status_code': response.status_code,
                 'response_time': response_time,
-                'content_length': len(response.content) if hasattr(response, 'content') else 0,
-                'url': self.test.target_url
+                'url': url,
+                **body,
+                **phases
             })
+            if check is not None:
+                check.finish(result)
             
         except requests.RequestException as e:
             result.update({
                 'success': False,
                 'error': str(e),
-                'url': self.test.target_url
+                'error_class': classify_exception(e),
+                'url': url
             })
         
+        self.apply_schedule_lag(result, lag)
         return result
     
-    def execute_journey_step(self, virtual_user, step, journey):
+    def execute_journey_step(self, virtual_user, step, journey, intended_time=None):
         """Execute a single step in a user journey"""
-        # Wait before executing the step
-        wait_time = random.uniform(step.min_wait, step.max_wait)
-        time.sleep(wait_time)
+        # Wait before executing the step (a scheduled arrival starts right away)
+        if intended_time is None:
+            wait_time = step.think_time.sample()
+            if not virtual_user.sleep(wait_time):
+                return None
+        else:
+            wait_time = 0
         
         # Prepare base result object
-        result = {
-            'timestamp': timezone.now(),
-            'success': False,
-            'error': '',
-            'status_code': None,
-            'response_time': None,
-            'user_agent': virtual_user.user_agent,
-            'cookies': dict(virtual_user.session.cookies),
-            'virtual_user_id': virtual_user.user_id,
-            'journey_id': journey.id,
-            'journey_name': journey.name,
-            'journey_step_id': step.id,
-            'step_type': step.step_type,
-            'wait_time': wait_time
-        }
+        result = self.new_result(
+            virtual_user,
+            wait_time,
+            journey_id=journey.id,
+            journey_name=journey.name,
+            journey_step_id=step.id,
+            step_type=step.step_type
+        )
+        lag = self.get_schedule_lag(intended_time)
+        
+        assertions = self.get_step_assertions(step)
         
         try:
             # Execute the step based on its type
             if step.step_type == 'navigate':
                 # Navigate to URL
-                url = step.url
-                step_result = virtual_user.navigate_to(url, journey.base_url)
+                url = render_placeholders(step.url, virtual_user.feed_values)
+                step_result = virtual_user.navigate_to(url, journey.base_url, step.keep_page, assertions, lag)
                 result.update(step_result)
             
             elif step.step_type == 'click':
@@ -353,12 +509,10 @@ class LoadTester:
                 else:
                     # For now, we'll just simulate this by extracting the href and navigating to it
                     # This is a very simplified version - a real implementation would be more robust
-                    href_pattern = f'<a[^>]*{step.selector}[^>]*href=["\']([^"\']+)["\'][^>]*>'
-                    href_match = re.search(href_pattern, virtual_user.page_content, re.DOTALL | re.IGNORECASE)
+                    url = virtual_user.find_link(step.matcher)
                     
-                    if href_match:
-                        url = href_match.group(1)
-                        step_result = virtual_user.navigate_to(url, journey.base_url)
+                    if url:
+                        step_result = virtual_user.navigate_to(url, journey.base_url, step.keep_page, assertions, lag)
                         result.update(step_result)
                     else:
                         result.update({
@@ -378,8 +532,8 @@ class LoadTester:
                     })
                 else:
                     # Store the input value in the journey state
-                    field_name = step.selector.split('=')[-1].strip('"\'')
-                    virtual_user.journey_state[field_name] = step.value
+                    field_name = virtual_user.get_field_name(step.matcher, step.field_name)
+                    virtual_user.journey_state[field_name] = render_placeholders(step.value, virtual_user.feed_values)
                     
                     result.update({
                         'success': True,
@@ -396,7 +550,7 @@ class LoadTester:
                     })
                 else:
                     # Use the stored input values
-                    step_result = virtual_user.submit_form(step.selector, virtual_user.journey_state)
+                    step_result = virtual_user.submit_form(step.matcher, virtual_user.journey_state, step.keep_page, assertions, lag)
                     result.update(step_result)
                     
                     # Clear the journey state after form submission
@@ -420,69 +574,148 @@ class LoadTester:
             result.update({
                 'success': False,
                 'error': f'Error executing step: {str(e)}',
+                'error_class': classify_exception(e),
                 'url': virtual_user.current_url
             })
         
+        self.apply_schedule_lag(result, lag)
         return result
     
-    def user_task(self, user_id):
-        """Simulate a user making requests or executing a journey"""
-        self.active_users += 1
-        self.user_counter += 1
+    def user_task(self, user_id, retired=None):
+        """Simulate a user making requests or executing a journey until the test stops or the user is retired"""
+        self.active_users.add(1)
+        self.user_counter.add(1)
         
         # Create a virtual user with a persistent session
-        virtual_user = VirtualUser(user_id)
+        virtual_user = self.new_virtual_user(user_id, retired or self.stop_event)
         self.virtual_users[user_id] = virtual_user
         
         try:
-            # Make requests until the test duration is reached
-            while not self.stop_event.is_set():
-                # Decide whether to use a journey based on probability
-                use_journey = random.random() <= self.test.journey_probability
-                
-                if use_journey and (self.test.journey or self.test.journeys.exists()):
-                    # Get a random journey
-                    journey = self.test.get_random_journey()
-                    
-                    if journey:
-                        # Execute the journey
-                        journey_results = self.execute_journey(virtual_user, journey)
-                        self.results.extend(journey_results)
-                    else:
-                        # No journey selected, make a single request to the target URL
-                        if self.test.target_url:
-                            result = self.make_request(virtual_user)
-                            self.results.append(result)
+            # Make requests until the test duration is reached or the user is retired
+            while not self.stop_event.is_set() and not virtual_user.is_stopped():
+                results = self.run_iteration(virtual_user)
+                if results:
+                    self.record_results(results)
                 else:
-                    # Make a single request to the target URL
-                    if self.test.target_url:
-                        result = self.make_request(virtual_user)
-                        self.results.append(result)
-                    else:
-                        # No target URL and not using journey, sleep and continue
-                        time.sleep(1)
+                    # Nothing to request, wait and continue
+                    virtual_user.sleep(1)
+                
+                # Paced journeys start a fixed cycle time apart
+                pacing_wait = virtual_user.get_pacing_wait()
+                if pacing_wait > 0:
+                    virtual_user.sleep(pacing_wait)
         
         finally:
-            self.active_users -= 1
+            self.active_users.add(-1)
             # Clean up the virtual user
             if user_id in self.virtual_users:
                 del self.virtual_users[user_id]
     
-    def execute_journey(self, virtual_user, journey):
+    def run_iteration(self, virtual_user, intended_time=None):
+        """Run a journey or a single request for a virtual user and return the results"""
+        if self.feeders:
+            virtual_user.feed_values = self.feeders.next_values(virtual_user.user_id)
+        
+        # Decide whether to use a journey based on probability
+        use_journey = random.random() <= self.test.journey_probability
+        
+        if use_journey:
+            # Pick a journey by weight
+            journey = self.journey_plans.choose()
+            
+            if journey:
+                virtual_user.start_paced_iteration(journey, intended_time)
+                return self.execute_journey(virtual_user, journey, intended_time)
+        
+        # Make a single request to the target URL
+        if self.test.target_url:
+            result = self.make_request(virtual_user, intended_time)
+            return [result] if result else []
+        return []
+    
+    def arrival_task(self, intended_time, pool, user_ids):
+        """Run one scheduled arrival on this thread's virtual user"""
+        if self.stop_event.is_set():
+            return
+        
+        # Each pool thread keeps its own virtual user (and session) for all of its arrivals
+        virtual_user = getattr(pool, 'virtual_user', None)
+        if virtual_user is None:
+            user_id = next(user_ids)
+            self.user_counter.add(1)
+            virtual_user = pool.virtual_user = self.new_virtual_user(user_id, self.stop_event)
+            self.virtual_users[user_id] = virtual_user
+        
+        self.active_users.add(1)
+        try:
+            results = self.run_iteration(virtual_user, intended_time)
+            if results:
+                self.record_results(results)
+        except Exception as e:
+            logger.error(f"Arrival failed for virtual user {virtual_user.user_id}: {str(e)}")
+        finally:
+            self.active_users.add(-1)
+    
+    def stop(self):
+        """Stop the test before its planned end; the results so far are stored as a partial run"""
+        if not self.stop_event.is_set():
+            self.stopped_early = True
+            self.stop_event.set()
+    
+    def check_stop_requested(self):
+        """Stop the test if its job was cancelled (from the web UI or another process)"""
+        from .models import TestJob
+        if self.stop_event.is_set():
+            return
+        if TestJob.objects.filter(test=self.test, status='running', cancel_requested=True).exists():
+            logger.info(f"Stopping test {self.test.pk}: cancellation requested")
+            self.stop()
+    
+    def drain(self):
+        """Wait up to the drain timeout for the users' in-flight requests; returns how many users are still busy"""
+        deadline = time.time() + get_drain_timeout()
+        while self.active_users.value > 0 and time.time() < deadline:
+            time.sleep(DRAIN_POLL_INTERVAL)
+        
+        busy = self.active_users.value
+        if busy > 0:
+            logger.warning(f"{busy} virtual users still busy after the drain timeout; their in-flight requests are not counted")
+        return busy
+    
+    def record_results(self, results):
+        """Add request results to the calling thread's shard of the aggregated metrics"""
+        self.collector.add(results, self.get_current_second())
+    
+    def get_current_second(self, now=None):
+        """Get the number of whole seconds since the test started"""
+        if self.started_at is None:
+            return 0
+        return max(0, int((now or time.time()) - self.started_at))
+    
+    def get_active_users(self):
+        """Get the number of users currently running, across all worker processes"""
+        if self.worker_active_users:
+            return sum(self.worker_active_users.values())
+        return self.active_users.value
+    
+    def execute_journey(self, virtual_user, journey, intended_time=None):
         """Execute a complete user journey"""
-        journey_results = []
+        if self.browser_pool is not None:
+            return self.execute_browser_journey(virtual_user, journey, intended_time)
         
-        # Get all steps for the journey
-        steps = journey.steps.all().order_by('order')
+        journey_results = []
         
-        for step in steps:
+        for step in journey.steps:
             # Check if we should stop
-            if self.stop_event.is_set():
+            if self.stop_event.is_set() or virtual_user.is_stopped():
                 break
             
-            # Execute the step
-            result = self.execute_journey_step(virtual_user, step, journey)
+            # Execute the step (only the first one of an arrival is scheduled)
+            result = self.execute_journey_step(virtual_user, step, journey, intended_time)
+            if result is None:
+                break
             journey_results.append(result)
+            intended_time = None
             
             # If the step failed, stop the journey
             if not result['success']:
@@ -490,40 +723,143 @@ class LoadTester:
         
         return journey_results
     
+    def execute_browser_journey(self, virtual_user, journey, intended_time=None):
+        """Execute a user journey in a headless browser leased from the pool for the whole journey"""
+        from .browser import BrowserSession
+        
+        # Waiting for a free browser delays the first step (and counts as schedule lag)
+        try:
+            driver = self.browser_pool.acquire(virtual_user.stopped)
+        except Exception as e:
+            logger.error(f"Error starting a headless browser: {str(e)}")
+            return [self.browser_start_failure(virtual_user, journey, e, intended_time)]
+        if driver is None:
+            return []
+        
+        journey_results = []
+        session = None
+        try:
+            session = BrowserSession(driver, virtual_user.user_agent)
+            for step in journey.steps:
+                if self.stop_event.is_set() or virtual_user.is_stopped():
+                    break
+                
+                result = self.execute_browser_step(virtual_user, session, step, journey, intended_time)
+                if result is None:
+                    break
+                journey_results.append(result)
+                intended_time = None
+                
+                if not result['success']:
+                    break
+        finally:
+            self.browser_pool.release(driver, session.origins if session else ())
+        
+        return journey_results
+    
+    def browser_start_failure(self, virtual_user, journey, error, intended_time=None):
+        """Record a journey that could not get a browser as a failure of its first step"""
+        step = journey.steps[0] if journey.steps else None
+        result = self.new_result(
+            virtual_user,
+            0,
+            journey_id=journey.id,
+            journey_name=journey.name,
+            journey_step_id=step.id if step else None,
+            step_type=step.step_type if step else None,
+            error=f'Could not start a browser: {getattr(error, "msg", None) or str(error)}'
+        )
+        self.apply_schedule_lag(result, self.get_schedule_lag(intended_time))
+        
+        # Back off instead of starting a browser again right away
+        virtual_user.sleep(1)
+        return result
+    
+    def execute_browser_step(self, virtual_user, session, step, journey, intended_time=None):
+        """Execute a single journey step in a browser
+        
+        Steps that load a page are checked against the step's assertions
+        using the rendered page; the browser does not expose response
+        headers, so header assertions fail in browser journeys.
+        """
+        if intended_time is None:
+            wait_time = step.think_time.sample()
+            if not virtual_user.sleep(wait_time):
+                return None
+        else:
+            wait_time = 0
+        
+        result = self.new_result(
+            virtual_user,
+            wait_time,
+            journey_id=journey.id,
+            journey_name=journey.name,
+            journey_step_id=step.id,
+            step_type=step.step_type
+        )
+        lag = self.get_schedule_lag(intended_time)
+        
+        try:
+            if step.step_type == 'navigate':
+                url = virtual_user.resolve_url(render_placeholders(step.url, virtual_user.feed_values), journey.base_url)
+                step_result = session.navigate(url)
+            elif step.step_type == 'click':
+                step_result = session.click(step.selector)
+            elif step.step_type == 'input':
+                step_result = session.input(step.selector, render_placeholders(step.value, virtual_user.feed_values))
+            elif step.step_type == 'submit':
+                step_result = session.submit(step.selector)
+            elif step.step_type == 'wait':
+                step_result = {'success': True, 'url': session.current_url}
+            else:
+                step_result = {'success': False, 'error': f'Unknown step type: {step.step_type}', 'url': session.current_url}
+            
+            assertions = self.get_step_assertions(step)
+            if assertions and 'load_time' in step_result:
+                check = assertions.start(step_result.get('status_code'), {}, lag)
+                check.feed(session.get_page_source().encode('utf-8'))
+                step_result = check.finish(step_result)
+            result.update(step_result)
+        
+        except Exception as e:
+            result.update({
+                'success': False,
+                'error': f'Error executing step: {getattr(e, "msg", None) or str(e)}',
+                'error_class': classify_exception(e),
+                'url': session.current_url
+            })
+        
+        self.apply_schedule_lag(result, lag)
+        return result
+    
     def run_test(self):
         """Run the load test with the configured parameters"""
         try:
             # Mark test as started
             self.test.start_test()
+            self.load_plans()
             
             # Calculate end time
             end_time = time.time() + self.test.duration
             
-            # Create a thread pool
-            with concurrent.futures.ThreadPoolExecutor(max_workers=self.test.num_users) as executor:
-                # Submit initial tasks based on spawn rate
-                futures = []
-                
-                # Keep spawning users until we reach the target number
-                for i in range(self.test.num_users):
-                    if time.time() >= end_time:
-                        break
-                    
-                    futures.append(executor.submit(self.user_task, i))
-                    
-                    # Respect the spawn rate
-                    if i % self.test.spawn_rate == 0:
-                        time.sleep(1)
-                
-                # Wait until the test duration is reached
-                while time.time() < end_time and not self.stop_event.is_set():
-                    time.sleep(0.5)
-                
-                # Signal all tasks to stop
-                self.stop_event.set()
-                
-                # Wait for all tasks to complete
-                concurrent.futures.wait(futures)
+            # Store live metrics (and raw results) while the test runs
+            writer_finished = threading.Event()
+            writer = threading.Thread(target=self.write_live_results, args=(writer_finished,), daemon=True)
+            writer.start()
+            
+            try:
+                self.started_at = time.time()
+                if self.test.remote_workers:
+                    self.run_distributed(end_time)
+                elif self.test.worker_processes > 1:
+                    self.run_processes(end_time)
+                else:
+                    self.run_engine(end_time)
+                self.finished_at = time.time()
+            finally:
+                writer_finished.set()
+                writer.join()
+                self.feeders.close()
             
             # Process results
             test_results = self.process_results()
@@ -538,125 +874,322 @@ class LoadTester:
             self.test.fail_test(str(e))
             return {'error': str(e)}
     
-    def process_results(self):
-        """Process the test results and calculate statistics"""
-        if not self.results:
-            return {
-                'total_requests': 0,
-                'successful_requests': 0,
-                'failed_requests': 0,
-                'avg_response_time': None,
-                'min_response_time': None,
-                'max_response_time': None,
-                'requests_per_second': 0,
-                'detailed_results': []
-            }
-        
-        # Count successful and failed requests
-        successful = [r for r in self.results if r.get('success', False)]
-        failed = [r for r in self.results if not r.get('success', False)]
+    def run_engine(self, end_time, start_time=None, worker_index=0, worker_count=1):
+        """Run this process's share of the virtual users with the configured engine"""
+        called_at = time.time()
         
-        # Calculate response time statistics
-        response_times = [r.get('response_time') for r in self.results if r.get('response_time') is not None]
+        # Every worker takes every worker_count-th user (or arrival) so the
+        # global schedule is kept across workers
+        user_ids = range(worker_index, self.test.num_users, worker_count)
+        self.feeders.set_worker(worker_index, worker_count)
+        self.get_request_plan()
         
-        if response_times:
-            avg_response_time = statistics.mean(response_times)
-            min_response_time = min(response_times)
-            max_response_time = max(response_times)
-        else:
-            avg_response_time = None
-            min_response_time = None
-            max_response_time = None
-        
-        # Calculate requests per second
-        if self.test.started_at and self.test.completed_at:
-            duration = (self.test.completed_at - self.test.started_at).total_seconds()
-            requests_per_second = len(self.results) / duration if duration > 0 else 0
-        else:
-            requests_per_second = 0
-        
-        # Group results by virtual user
-        users_data = {}
-        for result in self.results:
-            user_id = result.get('virtual_user_id')
-            if user_id not in users_data:
-                users_data[user_id] = {
-                    'requests': 0,
-                    'successful': 0,
-                    'failed': 0
-                }
-            
-            users_data[user_id]['requests'] += 1
-            if result.get('success', False):
-                users_data[user_id]['successful'] += 1
+        if self.test.engine == 'async':
+            if self.test.journey_mode == 'browser':
+                raise ValueError("Browser journeys run on the thread engine")
+            
+            # Run all virtual users as coroutines on a single event loop
+            from .async_engine import AsyncLoadRunner
+            runner = AsyncLoadRunner(self)
+            
+            # Start the clock once the engine is loaded, not while importing it
+            if start_time is None:
+                start_time = time.time()
+                end_time += start_time - called_at
+            
+            if self.test.load_model == 'open':
+                runner.run_arrivals(end_time, start_time, user_ids, worker_index, worker_count)
             else:
-                users_data[user_id]['failed'] += 1
+                runner.run(end_time, start_time, worker_index, worker_count)
+            return
         
-        # Calculate success rate for each user
-        for user_id, data in users_data.items():
-            if data['requests'] > 0:
-                data['success_rate'] = (data['successful'] / data['requests']) * 100
+        if start_time is None:
+            start_time = time.time()
+        
+        # Browser journeys share a pool of headless browsers, which the
+        # worker processes of this machine split between them
+        if self.test.journey_mode == 'browser':
+            from .browser import BrowserPool
+            self.browser_pool = BrowserPool.for_test(self.test, 1 if self.test.remote_workers else worker_count)
+        
+        try:
+            if self.test.load_model == 'open':
+                self.run_arrival_threads(end_time, start_time, user_ids, worker_index, worker_count)
             else:
-                data['success_rate'] = 0
-        
-        # Group results by journey
-        journeys_data = {}
-        for result in self.results:
-            journey_id = result.get('journey_id')
-            if journey_id and journey_id not in journeys_data:
-                journeys_data[journey_id] = {
-                    'name': result.get('journey_name', f'Journey {journey_id}'),
-                    'requests': 0,
-                    'successful': 0,
-                    'failed': 0,
-                    'steps': {}
-                }
-            
-            if journey_id:
-                journeys_data[journey_id]['requests'] += 1
-                if result.get('success', False):
-                    journeys_data[journey_id]['successful'] += 1
-                else:
-                    journeys_data[journey_id]['failed'] += 1
+                self.run_threads(end_time, start_time, worker_index, worker_count)
+        finally:
+            if self.browser_pool is not None:
+                self.browser_pool.close()
+    
+    def get_arrival_schedule(self):
+        """Get the arrival schedule of an open model test"""
+        return ArrivalSchedule(self.test.get_load_points())
+    
+    def get_user_events(self, start_time, end_time, worker_index=0, worker_count=1):
+        """Get this worker's (time, user_id, start) events of a closed model test"""
+        events = []
+        for offset, user_id, start in UserSchedule(self.test.get_load_points()).events:
+            if user_id % worker_count != worker_index:
+                continue
+            if start_time + offset >= end_time:
+                break
+            events.append((start_time + offset, user_id, start))
+        return events
+    
+    def get_arrivals(self, start_time, end_time, worker_index=0, worker_count=1):
+        """Yield the intended send times of this worker's share of the arrivals"""
+        for index, offset in self.get_arrival_schedule():
+            if index % worker_count != worker_index:
+                continue
+            intended_time = start_time + offset
+            if intended_time >= end_time:
+                break
+            yield intended_time
+    
+    def run_threads(self, end_time, start_time, worker_index=0, worker_count=1):
+        """Run the virtual users with one thread per user until the end time"""
+        events = self.get_user_events(start_time, end_time, worker_index, worker_count)
+        spawned = sum(1 for event_time, user_id, start in events if start)
+        retire_events = {}
+        
+        # Create a thread pool
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, spawned))
+        try:
+            # Start and retire users exactly when the load profile says so
+            for event_time, user_id, start in events:
+                if not sleep_until(event_time, self.stop_event):
+                    break
+                
+                if start:
+                    retire_events[user_id] = threading.Event()
+                    executor.submit(self.user_task, user_id, retire_events[user_id])
+                elif user_id in retire_events:
+                    retire_events.pop(user_id).set()
+            
+            # Wait until the test duration is reached
+            self.stop_event.wait(max(0, end_time - time.time()))
+            
+            # Signal all tasks to stop, waking up users in the middle of a think time
+            self.stop_event.set()
+            for retired in retire_events.values():
+                retired.set()
+            
+            # Give in-flight requests the drain timeout to complete
+            self.drain()
+        finally:
+            # Users still blocked in a request finish in the background
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def run_arrival_threads(self, end_time, start_time, user_ids, worker_index=0, worker_count=1):
+        """Start iterations at the scheduled arrival rate on a pool of one thread per user"""
+        pool = threading.local()
+        available_ids = iter(user_ids)
+        
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(user_ids)))
+        try:
+            for intended_time in self.get_arrivals(start_time, end_time, worker_index, worker_count):
+                if not sleep_until(intended_time, self.stop_event):
+                    break
+                
+                # When every virtual user is busy the arrival queues up, and
+                # the wait is counted in its latency
+                executor.submit(self.arrival_task, intended_time, pool, available_ids)
+            
+            # Wait until the test duration is reached
+            self.stop_event.wait(max(0, end_time - time.time()))
+            
+            # Queued arrivals are dropped once the test stops, arrivals in
+            # flight get the drain timeout to complete
+            self.stop_event.set()
+            self.drain()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def run_processes(self, end_time):
+        """Split the virtual users across worker processes and merge their results"""
+        worker_count = min(self.test.worker_processes, self.test.num_users)
+        context = multiprocessing.get_context('spawn')
+        result_queue = context.Queue()
+        stop_event = context.Event()
+        
+        # Start the shared test clock once every worker has had time to start
+        start_time = time.time() + WORKER_STARTUP_DELAY
+        end_time += WORKER_STARTUP_DELAY
+        self.started_at = start_time
+        
+        # Workers open their own database connections
+        connections.close_all()
+        
+        workers = []
+        for worker_index in range(worker_count):
+            worker = context.Process(
+                target=run_worker_process,
+                args=(self.test.pk, worker_index, worker_count, start_time, end_time, stop_event, result_queue),
+                daemon=True
+            )
+            worker.start()
+            workers.append(worker)
+        
+        running = set(range(worker_count))
+        errors = []
+        try:
+            while running:
+                if self.stop_event.is_set():
+                    stop_event.set()
                 
-                # Group by step within journey
-                step_id = result.get('journey_step_id')
-                if step_id and step_id not in journeys_data[journey_id]['steps']:
-                    journeys_data[journey_id]['steps'][step_id] = {
-                        'step_type': result.get('step_type', 'unknown'),
-                        'requests': 0,
-                        'successful': 0,
-                        'failed': 0,
-                        'response_times': []
-                    }
+                try:
+                    kind, worker_index, payload = result_queue.get(timeout=WORKER_FLUSH_INTERVAL)
+                except queue.Empty:
+                    # A worker that exits cleanly always reports first, so only
+                    # a crashed worker can be missing here
+                    for worker_index in list(running):
+                        exitcode = workers[worker_index].exitcode
+                        if exitcode is not None and exitcode != 0:
+                            running.discard(worker_index)
+                            errors.append(f"Worker {worker_index} exited with code {exitcode}")
+                    continue
                 
-                if step_id:
-                    step_data = journeys_data[journey_id]['steps'][step_id]
-                    step_data['requests'] += 1
-                    if result.get('success', False):
-                        step_data['successful'] += 1
-                    else:
-                        step_data['failed'] += 1
+                if self.handle_worker_message(kind, worker_index, payload, errors):
+                    running.discard(worker_index)
+        finally:
+            stop_event.set()
+            for worker in workers:
+                worker.join(timeout=WORKER_STARTUP_DELAY)
+                if worker.is_alive():
+                    worker.terminate()
+        
+        if errors:
+            raise RuntimeError('; '.join(errors))
+    
+    def run_distributed(self, end_time):
+        """Run the test on remote workers registered with a coordinator"""
+        from .distributed import Coordinator
+        coordinator = Coordinator(self, self.test.remote_workers)
+        
+        # Waiting for the workers to register is not part of the test, the
+        # coordinator starts the clock once they all have
+        self.started_at = None
+        errors = coordinator.run(end_time - time.time())
+        if errors:
+            raise RuntimeError('; '.join(errors))
+    
+    def handle_worker_message(self, kind, worker_index, payload, errors):
+        """Merge a message streamed by a worker; returns True once the worker has finished"""
+        if kind == 'results':
+            self.collector.merge(ResultAggregator.from_dict(payload['aggregator']))
+            self.worker_active_users[worker_index] = payload['active_users']
+            return False
+        
+        self.worker_active_users[worker_index] = 0
+        if kind == 'error':
+            errors.append(f"Worker {worker_index}: {payload}")
+        return True
+    
+    def stream_results(self, result_queue, worker_index, finished):
+        """Send aggregated results to the coordinator until the worker finishes"""
+        while True:
+            done = finished.wait(WORKER_FLUSH_INTERVAL)
+            
+            # Hand over what was aggregated so far and start again from empty
+            aggregator = self.collector.take()
+            result_queue.put(('results', worker_index, {
+                'aggregator': aggregator.to_dict(),
+                'active_users': self.active_users.value,
+            }))
+            
+            if done:
+                break
+    
+    def write_live_results(self, finished):
+        """Periodically store per-second metrics and move raw results to the database"""
+        from .models import TestMetricSample, TestResultWriter
+        writer = TestResultWriter(self.test)
+        raw_interval = getattr(settings, 'WEBTESTER_RESULT_FLUSH_INTERVAL', 5)
+        last_raw_flush = time.time()
+        
+        try:
+            while True:
+                done = finished.wait(METRICS_FLUSH_INTERVAL)
+                now = time.time()
+                second = self.get_current_second(now)
+                
+                if not done:
+                    self.check_stop_requested()
+                
+                with self.collector.lock:
+                    aggregator = self.collector.collect()
+                    timeline = aggregator.timeline
+                    if self.started_at is not None and not done:
+                        timeline.set_active_users(second, self.get_active_users())
                     
-                    if result.get('response_time') is not None:
-                        step_data['response_times'].append(result.get('response_time'))
-        
-        # Calculate average response time for each step
-        for journey_id, journey_data in journeys_data.items():
-            for step_id, step_data in journey_data['steps'].items():
-                if step_data['response_times']:
-                    step_data['avg_response_time'] = statistics.mean(step_data['response_times'])
-                    del step_data['response_times']  # Remove the raw data to save space
-        
-        return {
-            'total_requests': len(self.results),
-            'successful_requests': len(successful),
-            'failed_requests': len(failed),
-            'avg_response_time': avg_response_time,
-            'min_response_time': min_response_time,
-            'max_response_time': max_response_time,
-            'requests_per_second': requests_per_second,
-            'users_data': users_data,
-            'journeys_data': journeys_data,
-            'detailed_results': self.results
-        }
\ No newline at end of file
+                    # Keep the latest seconds open for results still on their way from workers
+                    buckets = timeline.drain(None if done else second - METRICS_FLUSH_LAG)
+                    
+                    batch = []
+                    if not done and now - last_raw_flush >= raw_interval:
+                        batch = aggregator.raw_results
+                        aggregator.raw_results = []
+                        last_raw_flush = now
+                
+                if buckets:
+                    TestMetricSample.objects.bulk_create([
+                        TestMetricSample.from_bucket(self.test, bucket_second, bucket)
+                        for bucket_second, bucket in buckets
+                    ])
+                
+                # Whatever is left at the end is stored by complete_test
+                if batch:
+                    with transaction.atomic():
+                        writer.write(batch)
+                        writer.flush()
+                
+                if done:
+                    break
+        except Exception as e:
+            logger.error(f"Error writing live results: {str(e)}")
+        finally:
+            # This thread has its own database connection
+            connection.close()
+    
+    def process_results(self):
+        """Process the test results and calculate statistics"""
+        duration = None
+        if self.started_at and self.finished_at:
+            duration = self.finished_at - self.started_at
+        
+        results = self.collector.collect().summary(duration)
+        results['stopped_early'] = self.stopped_early
+        return results
+
+def run_worker_process(test_id, worker_index, worker_count, start_time, end_time, stop_event, result_queue):
+    """Entry point of a worker process running one shard of a load test"""
+    try:
+        import django
+        from django.apps import apps
+        if not apps.ready:
+            django.setup()
+        
+        from .models import LoadTest
+        test = LoadTest.objects.get(pk=test_id)
+        
+        tester = LoadTester(test)
+        tester.stop_event = stop_event
+        tester.started_at = start_time
+        tester.load_plans()
+        
+        # Stream results to the coordinator while the users run
+        finished = threading.Event()
+        streamer = threading.Thread(target=tester.stream_results, args=(result_queue, worker_index, finished))
+        streamer.start()
+        
+        try:
+            tester.run_engine(end_time, start_time, worker_index, worker_count)
+        finally:
+            finished.set()
+            streamer.join()
+        
+        result_queue.put(('done', worker_index, None))
+    
+    except Exception as e:
+        logger.error(f"Error in load test worker {worker_index}: {str(e)}")
+        result_queue.put(('error', worker_index, str(e)))
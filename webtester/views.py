@@ -1,17 +1,21 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.urls import reverse
 from django.utils import timezone
 from django.forms import inlineformset_factory
 from django.db.models import Q
-from .models import LoadTest, TestResult, UserJourney, JourneyStep, TestTemplate
-from .forms import LoadTestForm, UserJourneyForm, JourneyStepForm, PublicTemplateForm
-from .utils import LoadTester
-import threading
+from .models import LoadTest, TestResult, UserJourney, JourneyStep, TestTemplate, DataFeeder
+from .forms import LoadTestForm, UserJourneyForm, JourneyStepForm, PublicTemplateForm, DataFeederForm
+from .comparison import compare_tests
+from .exports import COLUMNAR_CONTENT_TYPE, iter_columnar, iter_csv
+from .jobs import cancel_job, enqueue_test
 import json
 
+# Most per-second samples returned by one metrics request
+METRICS_PAGE_SIZE = 600
+
 
 @login_required
 def dashboard(request):
@@ -118,6 +122,7 @@ def test_detail(request, pk):
     context = {
         'test': test,
         'results': results,
+        'active_job': test.get_active_job(),
     }
     return render(request, 'webtester/test_detail.html', context)
 
@@ -279,6 +284,43 @@ def delete_journey_step(request, journey_pk, step_pk):
     
     return redirect('webtester:journey_detail', pk=journey.pk)
 
+@login_required
+def add_feeder(request, pk):
+    """Upload a data feeder for a load test"""
+    test = get_object_or_404(LoadTest, pk=pk, created_by=request.user)
+    
+    if request.method == 'POST':
+        form = DataFeederForm(request.POST, request.FILES, test=test)
+        if form.is_valid():
+            feeder = form.save(commit=False)
+            feeder.test = test
+            feeder.save()
+            
+            messages.success(request, f"Feeder '{feeder.name}' added to test '{test.name}' successfully!")
+            return redirect('webtester:detail', pk=test.pk)
+    else:
+        form = DataFeederForm(test=test)
+    
+    context = {
+        'form': form,
+        'test': test,
+        'title': f'Add Data Feeder to {test.name}'
+    }
+    return render(request, 'webtester/feeder_form.html', context)
+
+@login_required
+def delete_feeder(request, pk, feeder_pk):
+    """Delete a data feeder and its file"""
+    test = get_object_or_404(LoadTest, pk=pk, created_by=request.user)
+    feeder = get_object_or_404(DataFeeder, pk=feeder_pk, test=test)
+    
+    if request.method == 'POST':
+        feeder.data_file.delete(save=False)
+        feeder.delete()
+        messages.success(request, f"Feeder deleted successfully!")
+    
+    return redirect('webtester:detail', pk=test.pk)
+
 @login_required
 def add_journey_to_test(request, journey_pk):
     """Add a journey to an existing test"""
@@ -324,20 +366,38 @@ def run_test(request, pk):
         messages.error(request, "You don't have permission to run this test.")
         return redirect('webtester:detail', pk=test.pk)
     
-    if test.status == 'running':
-        messages.error(request, "Test is already running!")
+    # Queue the test for a runner process instead of running it in the web worker
+    try:
+        enqueue_test(test, request.user)
+    except ValueError as e:
+        messages.error(request, str(e))
         return redirect('webtester:detail', pk=test.pk)
     
-    # Run the test in a background thread
-    def run_test_thread():
-        tester = LoadTester(test)
-        tester.run_test()
+    messages.success(request, f"Test '{test.name}' queued! It starts as soon as a runner (manage.py webtester_runner) picks it up.")
+    return redirect('webtester:detail', pk=test.pk)
+
+@login_required
+def cancel_test(request, pk):
+    """Cancel a queued test or stop a running one"""
+    test = get_object_or_404(
+        LoadTest,
+        Q(pk=pk) & (Q(created_by=request.user) | Q(assignments__assigned_to=request.user))
+    )
     
-    thread = threading.Thread(target=run_test_thread)
-    thread.daemon = True
-    thread.start()
+    # Only the creator or an admin can cancel the test
+    if test.created_by != request.user and not request.user.is_staff:
+        messages.error(request, "You don't have permission to cancel this test.")
+        return redirect('webtester:detail', pk=test.pk)
+    
+    if request.method == 'POST':
+        job = test.get_active_job()
+        if not job:
+            messages.error(request, "Test is not queued or running.")
+        elif cancel_job(job).status == 'cancelled':
+            messages.success(request, f"Test '{test.name}' removed from the queue.")
+        else:
+            messages.success(request, f"Stopping test '{test.name}'...")
     
-    messages.success(request, f"Test '{test.name}' started!")
     return redirect('webtester:detail', pk=test.pk)
 
 @login_required
@@ -357,9 +417,12 @@ def delete_test(request, pk):
 def test_status(request, pk):
     """Get the current status of a test (for AJAX polling)"""
     test = get_object_or_404(LoadTest, pk=pk, created_by=request.user)
+    job = test.get_active_job()
     
     data = {
         'status': test.status,
+        'job_status': job.status if job else None,
+        'cancel_requested': job.cancel_requested if job else False,
         'total_requests': test.total_requests,
         'successful_requests': test.successful_requests,
         'failed_requests': test.failed_requests,
@@ -369,6 +432,93 @@ def test_status(request, pk):
     
     return JsonResponse(data)
 
+@login_required
+def test_metrics(request, pk):
+    """Get the per-second metrics recorded after the 'since' cursor (for AJAX polling)"""
+    test = get_object_or_404(LoadTest, pk=pk, created_by=request.user)
+    
+    try:
+        since = int(request.GET.get('since', -1))
+    except ValueError:
+        since = -1
+    
+    samples = []
+    for sample in test.metric_samples.filter(second__gt=since).order_by('second')[:METRICS_PAGE_SIZE]:
+        samples.append({
+            'second': sample.second,
+            'requests_per_second': sample.requests,
+            'errors': sample.errors,
+            'error_rate': sample.get_error_rate(),
+            'active_users': sample.active_users,
+            'avg_response_time': sample.avg_response_time,
+            'p50_response_time': sample.p50_response_time,
+            'p90_response_time': sample.p90_response_time,
+            'p95_response_time': sample.p95_response_time,
+            'p99_response_time': sample.p99_response_time,
+        })
+    
+    data = {
+        'status': test.status,
+        'samples': samples,
+        # Pass this back as 'since' to only get newer samples
+        'cursor': samples[-1]['second'] if samples else since,
+    }
+    
+    return JsonResponse(data)
+
+@login_required
+def export_results(request, pk, export_format):
+    """Stream every raw result of a test as CSV or in the columnar format"""
+    # Get the test if it's created by the user OR assigned to the user
+    test = get_object_or_404(
+        LoadTest,
+        Q(pk=pk) & (Q(created_by=request.user) | Q(assignments__assigned_to=request.user))
+    )
+    
+    # Rows are read with a queryset iterator and written as they come, so
+    # the whole result set is never held in memory
+    if export_format == 'csv':
+        response = StreamingHttpResponse(iter_csv(test), content_type='text/csv')
+        extension = 'csv'
+    elif export_format == 'columnar':
+        response = StreamingHttpResponse(iter_columnar(test), content_type=COLUMNAR_CONTENT_TYPE)
+        extension = 'wtcol'
+    else:
+        raise Http404("Unknown export format")
+    
+    response['Content-Disposition'] = f'attachment; filename="test-{test.pk}-results.{extension}"'
+    return response
+
+@login_required
+def compare_test(request, pk):
+    """Compare a completed test with an earlier run (the baseline) and flag regressions"""
+    # Tests created by the user OR assigned to the user
+    visible_tests = LoadTest.objects.filter(Q(created_by=request.user) | Q(assignments__assigned_to=request.user))
+    test = get_object_or_404(visible_tests, pk=pk)
+    baselines = visible_tests.filter(status='completed').exclude(pk=test.pk).distinct().order_by('-completed_at')
+    
+    baseline = None
+    comparison = None
+    if request.GET.get('baseline'):
+        baseline = get_object_or_404(baselines, pk=request.GET['baseline'])
+        try:
+            comparison = compare_tests(baseline, test)
+        except ValueError as e:
+            messages.error(request, str(e))
+    
+    if request.GET.get('format') == 'json':
+        if comparison is None:
+            return JsonResponse({'error': 'Choose a completed baseline test to compare with'}, status=400)
+        return JsonResponse(comparison)
+    
+    context = {
+        'test': test,
+        'baselines': baselines[:50],
+        'baseline': baseline,
+        'comparison': comparison,
+    }
+    return render(request, 'webtester/test_compare.html', context)
+
 @login_required
 def clone_test(request, pk):
     """Clone an existing test"""